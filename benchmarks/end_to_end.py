@@ -0,0 +1,168 @@
+"""
+End to end latency benchmark for QueueBot
+
+Runs a real QueueBot (not in testing mode) against test/fake_discord.py so every
+command goes through the gateway, on_message() and a real channel.send() over
+HTTP. Latency and per-channel rate limits can be injected into the fake server.
+
+Measures:
+    - Command latency: time from MESSAGE_CREATE being sent until the reply arrives
+    - Reconnect time: time from the gateway asking the bot to reconnect until it
+      answers a command again (both resumed and re-identified sessions)
+
+Usage (from the repo root):
+    PYTHONPATH=src python -m benchmarks.end_to_end --latency 0.05 --rate-limit 5 5 --output e2e.json
+"""
+
+import sys
+import json
+import random
+import asyncio
+import logging
+import argparse
+from time import perf_counter
+from datetime import datetime
+
+from test.utils import SEED, STUDENT_NAMES
+from test.fake_discord import FakeDiscord, start_queuebot
+from benchmarks.load_simulation import scratch_directory, summarize, get_commit
+from src.queuebot import QueueBot, QueueConfig
+
+E2E_CONFIG = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "True",
+    "VOICE_WAITING": "waiting-room",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+
+# Commands each student cycles through
+STUDENT_COMMANDS = ["!q join", "!q position", "!q list", "!q leave"]
+
+
+class EndToEnd:
+    """
+    Parameters:
+        latency: seconds the fake server adds to every REST response and gateway event
+        rate_limit: (requests, seconds) allowed per channel, or None
+        seed: seed for picking students
+    """
+    def __init__(self, latency=0.0, rate_limit=None, seed=SEED):
+        self._rand = random.Random(seed)
+        self.fake = FakeDiscord(latency=latency, rate_limit=rate_limit)
+        self.guild = self.fake.add_guild("e2e")
+        ta_role = self.fake.add_role(self.guild, E2E_CONFIG["TA_ROLES"][0])
+        self.channel = self.fake.add_channel(self.guild, E2E_CONFIG["TEXT_LISTENS"][0])
+        waiting_room = self.fake.add_channel(self.guild, E2E_CONFIG["VOICE_WAITING"], voice=True)
+        self.ta = self.fake.add_member(self.guild, "TA", [ta_role])
+
+        self.students = []
+        for name, nick in STUDENT_NAMES:
+            student = self.fake.add_member(self.guild, name, nick=nick)
+            self.fake.guilds[self.guild]["voice_states"][student] = waiting_room
+            self.students.append(student)
+
+        self.bot = None
+
+    async def _command(self, author, content):
+        start = perf_counter()
+        await self.fake.send_message(self.channel, author, content)
+        await self.fake.wait_for_message(self.channel, timeout=60.0)
+        return perf_counter() - start
+
+    async def _reconnect(self, resume):
+        start = perf_counter()
+        await self.fake.force_reconnect(resume=resume)
+        await self.fake.wait_until_identified(timeout=60.0)
+        connected = perf_counter() - start
+        await self._command(self.ta, "!q ping")
+        return connected, perf_counter() - start
+
+    async def run(self, commands, reconnects):
+        latencies = {}
+        reconnect_times = {"resume": [], "identify": []}
+        await self.fake.start()
+        try:
+            with self.fake.patch():
+                self.bot = QueueBot(QueueConfig(E2E_CONFIG, test_mode=True),
+                                    logging.getLogger("queuebot.e2e"), guild_ready_timeout=0.05)
+                start = perf_counter()
+                task = await start_queuebot(self.fake, self.bot, E2E_CONFIG["SECRET_TOKEN"], timeout=60.0)
+                startup = perf_counter() - start
+
+                try:
+                    progress = {}
+                    for _ in range(commands):
+                        student = self._rand.choice(self.students)
+                        content = STUDENT_COMMANDS[progress.get(student, 0) % len(STUDENT_COMMANDS)]
+                        progress[student] = progress.get(student, 0) + 1
+                        latencies.setdefault(content.split()[1], []).append(await self._command(student, content))
+
+                    for i in range(reconnects):
+                        resume = i % 2 == 0
+                        reconnect_times["resume" if resume else "identify"].append(await self._reconnect(resume))
+                finally:
+                    await self.bot.close()
+                    await task
+        finally:
+            await self.fake.stop()
+
+        all_latencies = [t for values in latencies.values() for t in values]
+        return {
+            "startup_s": round(startup, 4),
+            "commands": len(all_latencies),
+            "rest_requests": self.fake.requests,
+            "rate_limited": self.fake.rate_limited,
+            "latency_ms": dict([("all", summarize(all_latencies))] +
+                               [(kind, summarize(values)) for kind, values in sorted(latencies.items())]),
+            "reconnect_ms": {
+                kind: {
+                    "connected": summarize([c for c, _ in times]),
+                    "first_reply": summarize([r for _, r in times]),
+                } for kind, times in reconnect_times.items()
+            },
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark QueueBot end to end against a local fake Discord")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds added to every REST response and gateway event (default: %(default)s)")
+    parser.add_argument("--rate-limit", type=float, nargs=2, metavar=("REQUESTS", "SECONDS"),
+                        help="messages allowed per channel per window")
+    parser.add_argument("--commands", type=int, default=200, help="number of commands to send (default: %(default)s)")
+    parser.add_argument("--reconnects", type=int, default=2,
+                        help="number of reconnects, alternating resume and re-identify (default: %(default)s)")
+    parser.add_argument("--output", help="JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    rate_limit = (int(args.rate_limit[0]), args.rate_limit[1]) if args.rate_limit else None
+    with scratch_directory():
+        benchmark = EndToEnd(args.latency, rate_limit)
+        result = asyncio.run(benchmark.run(args.commands, args.reconnects))
+
+    result.update({
+        "benchmark": "end_to_end",
+        "commit": get_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "injected_latency_s": args.latency,
+        "rate_limit": rate_limit,
+    })
+
+    latency = result["latency_ms"]["all"]
+    print(f"commands={result['commands']} p50={latency['p50']:.2f}ms p99={latency['p99']:.2f}ms "
+          f"rate_limited={result['rate_limited']} startup={result['startup_s']:.2f}s", file=sys.stderr)
+    for kind, times in result["reconnect_ms"].items():
+        if times["first_reply"]["count"]:
+            print(f"reconnect ({kind}): first reply after {times['first_reply']['mean']:.0f}ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Benchmark of the queue engine (src/queue_engine.py) without Discord
+
+Runs the same mix of queue operations (join, position, list, next, leave) against
+a QueueEngine called directly and against the same engine served on a Unix socket
+through EngineClient, to show how much the process split costs per operation.
+Over the socket, clients send their operations concurrently (pipelined)
+
+Usage (from the repo root):
+    PYTHONPATH=src python -m benchmarks.engine
+    PYTHONPATH=src python -m benchmarks.engine --operations 50000 --clients 8 --output engine.json
+"""
+
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+from time import perf_counter
+from datetime import datetime
+
+from test.utils import SEED
+from benchmarks.load_simulation import get_commit
+from src.queue_engine import QueueEngine, EngineClient, start_server
+from src.clock import VirtualClock
+from src.utils import DiscordUser
+
+DEFAULT_OPERATIONS = 20000
+DEFAULT_CLIENTS = 4
+DEFAULT_OUTPUT = "engine_results.json"
+
+# Servers the students are spread over
+GUILDS = 4
+
+
+class EngineBenchmark:
+    """
+    Parameters:
+        operations: number of operations per run
+        clients: number of concurrent clients over the socket
+        seed: seed for picking operations
+    """
+    def __init__(self, operations, clients=DEFAULT_CLIENTS, seed=SEED):
+        self.operations = operations
+        self.clients = clients
+        self._seed = seed
+        self._clock = VirtualClock()
+
+    def _workload(self, rand):
+        # Mostly joins and reads, with enough next/leave to keep the queues from growing forever
+        ops = []
+        for i in range(self.operations):
+            guild = rand.randrange(GUILDS)
+            uuid = rand.randrange(500)
+            roll = rand.random()
+            if roll < 0.35:
+                user = DiscordUser(uuid, f"Student{uuid}", "0001", None, clock=self._clock).to_dict()
+                ops.append(("join", {"guild": guild, "user": user, "inperson": roll < 0.1}))
+            elif roll < 0.55:
+                ops.append(("position", {"guild": guild, "uuid": uuid}))
+            elif roll < 0.7:
+                ops.append(("list", {"guild": guild, "start": 0, "stop": 10}))
+            elif roll < 0.85:
+                ops.append(("next", {"guild": guild, "server": f"bench{guild}", "ta": "TA"}))
+            else:
+                ops.append(("leave", {"guild": guild, "server": f"bench{guild}", "uuid": uuid}))
+        return ops
+
+    async def _direct(self, ops):
+        engine = QueueEngine(clock=self._clock)
+        start = perf_counter()
+        for op, args in ops:
+            await engine.call(op, **args)
+        return perf_counter() - start
+
+    async def _socket(self, ops, path):
+        server = await start_server(QueueEngine(clock=self._clock), path)
+        clients = [EngineClient(path) for _ in range(self.clients)]
+        try:
+            for client in clients:
+                await client.call("stats")  # Connect before timing
+
+            async def send(client, share):
+                for op, args in share:
+                    await client.call(op, **args)
+
+            start = perf_counter()
+            await asyncio.gather(*(send(client, ops[i::self.clients]) for i, client in enumerate(clients)))
+            return perf_counter() - start
+        finally:
+            for client in clients:
+                await client.close()
+            server.close()
+            await server.wait_closed()
+
+    async def run(self):
+        """
+        Session logs are written to logs/ in a temporary directory
+
+        Returns: A dictionary with the operations per second of each way of calling the engine
+        """
+        ops = self._workload(random.Random(self._seed))
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                os.mkdir("logs")
+                direct = await self._direct(ops)
+                over_socket = await self._socket(ops, os.path.join(tmp, "engine.sock"))
+            finally:
+                os.chdir(cwd)
+        return {
+            "direct": {"operations": len(ops), "operations_per_s": round(len(ops) / direct, 2)},
+            "socket": {"operations": len(ops), "clients": self.clients,
+                       "operations_per_s": round(len(ops) / over_socket, 2),
+                       "overhead_us": round((over_socket - direct) / len(ops) * 1e6, 2)},
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure the queue engine's throughput in process and over its socket")
+    parser.add_argument("--operations", type=int, default=DEFAULT_OPERATIONS,
+                        help="number of operations per run (default: %(default)s)")
+    parser.add_argument("--clients", type=int, default=DEFAULT_CLIENTS,
+                        help="concurrent clients over the socket (default: %(default)s)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(EngineBenchmark(args.operations, args.clients).run())
+
+    report = {
+        "benchmark": "engine",
+        "commit": get_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "results": results,
+    }
+    for kind, result in results.items():
+        print(f"{kind:<8} {result['operations_per_s']:>12.0f} operations/s", file=sys.stderr)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Office hours load simulation for QueueBot
+
+Drives QueueBot._queue_command() with the mock objects from test/utils.py to
+simulate a busy office hours session:
+    - A burst of joins at the top of the hour (the whole queue joins at once)
+    - Students spamming "!q position" while they wait
+    - TAs calling "!q next" at a steady cadence
+    - Students leaving (and new students trickling in)
+
+Each queue size is simulated with a freshly created bot. Throughput, per-command
+latency percentiles and peak memory (via tracemalloc) are written to a JSON file
+so results can be compared between commits.
+
+Usage (from the repo root):
+    PYTHONPATH=src python -m benchmarks.load_simulation
+    PYTHONPATH=src python -m benchmarks.load_simulation --sizes 10 100 --output new.json --compare old.json
+"""
+
+import os
+import sys
+import json
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from time import perf_counter
+from datetime import datetime
+from contextlib import contextmanager, redirect_stdout
+
+from test.utils import SEED, MockAuthor, MockChannel, MockGuild, MockLogger, MockMessage, TA_NAMES
+from src.queuebot import QueueBot, QueueConfig
+from src.clock import VirtualClock
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+DEFAULT_OUTPUT = "bench_results.json"
+
+BENCH_CONFIG = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+
+# Relative weight of each command once the initial burst is over
+STEADY_MIX = [
+    ("position", 50),
+    ("next", 15),
+    ("join", 15),
+    ("leave", 10),
+    ("list", 10),
+]
+
+
+def percentile(sorted_values, pct):
+    """
+    Nearest-rank percentile of an already sorted list
+
+    Parameters:
+        sorted_values: list of numbers sorted in ascending order
+        pct: percentile to compute (0-100)
+
+    Returns: The percentile value (0.0 for an empty list)
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(pct / 100 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def summarize(latencies):
+    """
+    Turn a list of latencies (in seconds) into a dictionary of statistics (in milliseconds)
+    """
+    values = sorted(latencies)
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values) * 1000, 4) if values else 0.0,
+        "p50": round(percentile(values, 50) * 1000, 4),
+        "p90": round(percentile(values, 90) * 1000, 4),
+        "p99": round(percentile(values, 99) * 1000, 4),
+        "max": round(values[-1] * 1000, 4) if values else 0.0,
+    }
+
+
+class LoadSimulation:
+    """
+    Simulates a single office hours session against a fresh QueueBot
+
+    Parameters:
+        queue_size: number of students who join during the top of the hour burst
+        steady_commands: number of mixed commands sent after the burst
+        inperson_ratio: fraction of joins which use "!q join-inperson"
+        command_interval: average virtual seconds between commands after the burst
+        seed: seed for the traffic generator
+    """
+    def __init__(self, queue_size, steady_commands, inperson_ratio=0.2, command_interval=2.0, seed=SEED):
+        self._rand = random.Random(seed + queue_size)
+        self.queue_size = queue_size
+        self.steady_commands = steady_commands
+        self.inperson_ratio = inperson_ratio
+        self.command_interval = command_interval
+        # Join and wait times follow simulated time instead of the wall clock
+        self.clock = VirtualClock()
+
+        self.guild = MockGuild("bench")
+        self.channel = MockChannel(BENCH_CONFIG["TEXT_LISTENS"][0], self.guild)
+        self.tas = [MockAuthor(name, nick, BENCH_CONFIG["TA_ROLES"]) for name, nick in TA_NAMES]
+        for ta in self.tas:
+            self.guild.add_member(ta)
+
+        self._student_count = 0
+        self.waiting = []  # Students who have not joined the queue yet (or left it)
+        self.latencies = {}
+
+        self.bot = QueueBot(QueueConfig(BENCH_CONFIG, test_mode=True), MockLogger(), testing=True, clock=self.clock)
+
+    def _new_student(self):
+        self._student_count += 1
+        student = MockAuthor(f"Student{self._student_count}", None)
+        self.guild.add_member(student)
+        return student
+
+    def _random_queued(self, queue):
+        return self.guild.get_member(queue[self._rand.randrange(len(queue))].get_uuid())
+
+    def _queued_students(self):
+        return self.bot.get_queue(self.channel)
+
+    async def _run_command(self, kind, content, author):
+        message = MockMessage(content, author, self.channel)
+        start = perf_counter()
+        await self.bot._queue_command(message)
+        self.latencies.setdefault(kind, []).append(perf_counter() - start)
+
+    async def _join(self, student):
+        if self._rand.random() < self.inperson_ratio:
+            await self._run_command("join", "!q join-inperson", student)
+        else:
+            await self._run_command("join", "!q join", student)
+
+    async def _steady_command(self):
+        kind = self._rand.choices([k for k, _ in STEADY_MIX], weights=[w for _, w in STEADY_MIX])[0]
+        queue = self._queued_students()
+
+        # Commands that need someone in the queue fall back to a join when it is empty
+        if kind in ("position", "leave") and len(queue) == 0:
+            kind = "join"
+
+        if kind == "position":
+            await self._run_command(kind, "!q position", self._random_queued(queue))
+        elif kind == "leave":
+            student = self._random_queued(queue)
+            await self._run_command(kind, "!q leave", student)
+            self.waiting.append(student)
+        elif kind == "next":
+            await self._run_command(kind, "!q next", self._rand.choice(self.tas))
+        elif kind == "list":
+            author = self._random_queued(queue) if len(queue) else self._rand.choice(self.tas)
+            await self._run_command(kind, "!q list", author)
+        else:
+            student = self.waiting.pop() if self.waiting and self._rand.random() < 0.5 else self._new_student()
+            await self._join(student)
+
+    async def run(self):
+        """
+        Run the full simulation
+
+        Returns: A dictionary with the results of the simulation
+        """
+        students = [self._new_student() for _ in range(self.queue_size)]
+
+        start = perf_counter()
+        for student in students:
+            await self._join(student)
+        burst_elapsed = perf_counter() - start
+
+        for _ in range(self.steady_commands):
+            self.clock.advance(self._rand.expovariate(1 / self.command_interval))
+            await self._steady_command()
+        elapsed = perf_counter() - start
+
+        all_latencies = [t for values in self.latencies.values() for t in values]
+        return {
+            "queue_size": self.queue_size,
+            "commands": len(all_latencies),
+            "elapsed_s": round(elapsed, 4),
+            "throughput_cps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+            "burst_throughput_cps": round(self.queue_size / burst_elapsed, 2) if burst_elapsed else 0.0,
+            "final_queue_length": len(self._queued_students()),
+            "virtual_duration_s": round(self.clock.monotonic(), 2),
+            "render_cache": self.bot._render_cache.stats(),
+            "latency_ms": dict([("all", summarize(all_latencies))] +
+                               [(kind, summarize(values)) for kind, values in sorted(self.latencies.items())]),
+        }
+
+
+@contextmanager
+def scratch_directory():
+    """
+    Run inside a temporary directory (with a logs/ folder) since
+    log_session() writes to logs/ relative to the working directory
+    """
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        os.mkdir("logs")
+        try:
+            yield tmp
+        finally:
+            os.chdir(cwd)
+
+
+def run_size(queue_size, steady_commands, trace_memory):
+    # discord.Client grabs the current event loop when it is created
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    if trace_memory:
+        tracemalloc.start()
+    try:
+        simulation = LoadSimulation(queue_size, steady_commands)
+        # In testing mode the bot prints every message it would have sent
+        with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+            result = loop.run_until_complete(simulation.run())
+        if trace_memory:
+            result["peak_memory_bytes"] = tracemalloc.get_traced_memory()[1]
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    return result
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old, new):
+    """
+    Print the change in throughput and latency between two result files
+    """
+    old_results = {r["queue_size"]: r for r in old["results"]}
+    print(f"\nComparing against {old.get('commit') or 'unknown commit'}")
+    print(f"{'size':>8} {'throughput':>22} {'p50 (ms)':>22} {'p99 (ms)':>22}")
+    for result in new["results"]:
+        before = old_results.get(result["queue_size"])
+        if before is None:
+            continue
+
+        def change(a, b):
+            pct = (b - a) / a * 100 if a else 0.0
+            return f"{a:.2f} -> {b:.2f} ({pct:+.0f}%)"
+
+        print(f"{result['queue_size']:>8} "
+              f"{change(before['throughput_cps'], result['throughput_cps']):>22} "
+              f"{change(before['latency_ms']['all']['p50'], result['latency_ms']['all']['p50']):>22} "
+              f"{change(before['latency_ms']['all']['p99'], result['latency_ms']['all']['p99']):>22}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate office hours traffic against QueueBot")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="queue sizes to simulate (default: %(default)s)")
+    parser.add_argument("--steady", type=int, default=2000,
+                        help="number of mixed commands to send after the join burst (default: %(default)s)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file to write results to")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip tracemalloc (latencies are lower without it)")
+    args = parser.parse_args(argv)
+
+    output = os.path.abspath(args.output)
+    report = {
+        "benchmark": "load_simulation",
+        "commit": get_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "steady_commands": args.steady,
+        "tracemalloc": not args.no_memory,
+        "results": [],
+    }
+
+    with scratch_directory():
+        for size in args.sizes:
+            result = run_size(size, args.steady, not args.no_memory)
+            report["results"].append(result)
+            latency = result["latency_ms"]["all"]
+            print(f"size={size:<6} commands={result['commands']:<6} "
+                  f"throughput={result['throughput_cps']:>10.2f}/s "
+                  f"p50={latency['p50']:.3f}ms p99={latency['p99']:.3f}ms "
+                  f"peak_mem={result.get('peak_memory_bytes', 0) / 1024:.0f}KiB", file=sys.stderr)
+
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Microbenchmark of QueueBot.on_message() for messages it ignores
+
+Most messages the bot receives are chat (in the queue channel or any other
+channel of the server). on_message() has to reject them before doing any real
+work, so this measures how many of them it can reject per second:
+    - chat: normal messages in a TEXT_LISTENS channel
+    - other_channel: normal messages in a channel the bot doesn't listen to
+    - command_elsewhere: "!q" commands in a channel the bot doesn't listen to
+
+The same messages are also run through the checks on_message() used to do first
+(own message, isinstance, channel name lookup and an INFO log line) for comparison
+
+Usage (from the repo root):
+    PYTHONPATH=src python -m benchmarks.reject_path
+    PYTHONPATH=src python -m benchmarks.reject_path --messages 200000 --output reject.json
+"""
+
+import sys
+import json
+import random
+import asyncio
+import logging
+import argparse
+import platform
+from time import perf_counter
+from datetime import datetime
+
+import discord
+from test.utils import SEED, MockAuthor, MockChannel, MockGuild, MockMessage
+from benchmarks.load_simulation import get_commit
+from src.queuebot import QueueBot, QueueConfig, ResolvedConfig
+
+DEFAULT_MESSAGES = 100000
+DEFAULT_OUTPUT = "reject_results.json"
+
+BENCH_CONFIG = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+
+CHAT = [
+    "does anyone know when the assignment is due?",
+    "is office hours still going on",
+    "thanks!",
+    "my code compiles but the tests time out :(",
+    "q: is the midterm cumulative",
+]
+
+
+async def previous_entry_path(bot, message):
+    """
+    The checks on_message() did before fast rejecting was added (kept for comparison)
+    """
+    if not bot._is_initialized:
+        return
+    if message.author == bot.user:
+        return
+    if not isinstance(message.channel, (discord.channel.TextChannel, MockChannel)):
+        return
+    if message.channel.name not in bot._config.TEXT_LISTEN_SET:
+        return
+    bot._logger.info('[#{0.channel}] {0.author} ({0.author.id}): {0.content}'.format(message))
+    if message.content[:2].lower().startswith("!q"):
+        raise AssertionError("Only messages that are ignored should be benchmarked")
+
+
+class RejectBenchmark:
+    """
+    Parameters:
+        messages: number of messages of each kind to send
+        seed: seed for picking messages
+    """
+    def __init__(self, messages, seed=SEED):
+        self._rand = random.Random(seed)
+        self.messages = messages
+
+        # Not in testing mode so on_message() runs like it does when connected
+        self.bot = QueueBot(QueueConfig(BENCH_CONFIG, test_mode=True), logging.getLogger("queuebot.bench"))
+        self.guild = MockGuild("bench")
+        self.listen = MockChannel(BENCH_CONFIG["TEXT_LISTENS"][0], self.guild)
+        self.general = MockChannel("general", self.guild)
+        self.bot._resolved = ResolvedConfig(self.bot._config, self.guild)
+        self.bot._is_initialized = True
+        self.students = [MockAuthor(f"Student{i}", None) for i in range(50)]
+
+    def _make(self, kind):
+        author = self._rand.choice(self.students)
+        if kind == "chat":
+            return MockMessage(self._rand.choice(CHAT), author, self.listen)
+        if kind == "other_channel":
+            return MockMessage(self._rand.choice(CHAT), author, self.general)
+        return MockMessage("!q join", author, self.general)
+
+    async def _time(self, handler, messages):
+        start = perf_counter()
+        for message in messages:
+            await handler(message)
+        return perf_counter() - start
+
+    async def run(self):
+        """
+        Returns: A dictionary with the messages per second of each kind for both paths
+        """
+        results = {}
+        for kind in ("chat", "other_channel", "command_elsewhere"):
+            messages = [self._make(kind) for _ in range(self.messages)]
+            elapsed = await self._time(self.bot.on_message, messages)
+            before = await self._time(lambda m: previous_entry_path(self.bot, m), messages)
+            results[kind] = {
+                "messages": self.messages,
+                "messages_per_s": round(self.messages / elapsed, 2),
+                "previous_messages_per_s": round(self.messages / before, 2),
+                "speedup": round(before / elapsed, 2),
+            }
+        return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how fast QueueBot ignores chat messages")
+    parser.add_argument("--messages", type=int, default=DEFAULT_MESSAGES,
+                        help="number of messages of each kind (default: %(default)s)")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    # INFO logs are on like when the bot runs (queuebot.py's setup_loggers()) but go nowhere
+    logger = logging.getLogger("queuebot.bench")
+    logger.setLevel(logging.INFO)
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        results = loop.run_until_complete(RejectBenchmark(args.messages).run())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    report = {
+        "benchmark": "reject_path",
+        "commit": get_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": SEED,
+        "results": results,
+    }
+    for kind, result in results.items():
+        print(f"{kind:<18} {result['messages_per_s']:>12.0f}/s "
+              f"(before: {result['previous_messages_per_s']:.0f}/s, {result['speedup']:.1f}x)", file=sys.stderr)
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return report
+
+
+if __name__ == "__main__":
+    main()
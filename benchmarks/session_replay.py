@@ -0,0 +1,283 @@
+"""
+Replay real office hours traffic from QueueBot session logs
+
+log_session() writes one row to logs/OH_logs_<guild>.csv every time a student
+leaves the queue (next, dispatch, leave, remove, clear or timeout). Each row has the student's
+name, the date, when they joined, which TA helped them and when they left.
+This tool turns those rows back into a time ordered stream of "!q join",
+"!q next", "!q leave", "!q remove" and "!q clear" commands and feeds them to a
+QueueBot in testing mode.
+
+Time is virtual: --speed 0 (the default) replays as fast as possible,
+--speed 1 replays in real time and --speed 60 replays an hour in a minute.
+
+Usage (from the repo root):
+    PYTHONPATH=src python -m benchmarks.session_replay logs/OH_logs_MyServer.csv --list-days
+    PYTHONPATH=src python -m benchmarks.session_replay logs/OH_logs_MyServer.csv --date "April 05, 2021" --output replay.json
+"""
+
+import os
+import sys
+import csv
+import json
+import asyncio
+import argparse
+from time import perf_counter
+from datetime import datetime, timedelta
+from collections import namedtuple, Counter
+from contextlib import redirect_stdout
+
+from test.utils import MockAuthor, MockChannel, MockGuild, MockLogger, MockMessage
+from benchmarks.load_simulation import BENCH_CONFIG, scratch_directory, summarize, get_commit
+from src.queuebot import QueueBot, QueueConfig
+from src.clock import VirtualClock
+
+DATE_FORMAT = "%B %d, %Y"
+TIME_FORMATS = ["%H:%M:%S", "%H:%M"]
+
+# A single row of OH_logs_<guild>.csv (see utils.log_session)
+SessionRow = namedtuple("SessionRow", ["name", "date", "join_time", "ta", "leave_time", "command_type"])
+
+# A command to replay. actor runs the command, target is who it is about
+ReplayEvent = namedtuple("ReplayEvent", ["time", "order", "command", "actor", "target"])
+
+# Joins sort before exits that happen in the same (minute truncated) timestamp
+JOIN_ORDER = 0
+EXIT_ORDER = 1
+
+
+def _parse_time(day, value):
+    for fmt in TIME_FORMATS:
+        try:
+            t = datetime.strptime(value, fmt).time()
+        except ValueError:
+            continue
+        return datetime.combine(day, t)
+    raise ValueError(f"Unknown time format '{value}'")
+
+
+def parse_session_log(path):
+    """
+    Read an OH_logs_<guild>.csv file
+
+    Parameters:
+        path: path to the log file
+
+    Returns: list of SessionRow. join_time and leave_time are datetime objects
+             (join_time is None when the row has "N/A")
+    """
+    rows = []
+    with open(path, newline="") as f:
+        for record in csv.reader(f, delimiter="|"):
+            if len(record) < 7:
+                continue
+            name, date, join_time, ta, leave_time, _, command_type = record[:7]
+            day = datetime.strptime(date, DATE_FORMAT).date()
+            leave = _parse_time(day, leave_time)
+
+            join = None
+            if join_time != "N/A":
+                join = _parse_time(day, join_time)
+                if join > leave:
+                    # Joined before midnight and left after it
+                    join -= timedelta(days=1)
+
+            rows.append(SessionRow(name, date, join, None if ta == "N/A" else ta, leave, command_type))
+    return rows
+
+
+def build_events(rows):
+    """
+    Turn session rows into a time ordered list of commands
+
+    Parameters:
+        rows: list of SessionRow (see parse_session_log)
+
+    Returns: list of ReplayEvent sorted by time
+    """
+    events = []
+    cleared = set()
+
+    for row in rows:
+        if row.join_time is not None:
+            events.append(ReplayEvent(row.join_time, JOIN_ORDER, "join", row.name, None))
+
+        if row.command_type == "next" or row.command_type == "dispatch":
+            # config.AUTO_DISPATCH moved the student to the TA's room. Replay it as the TA calling them
+            events.append(ReplayEvent(row.leave_time, EXIT_ORDER, "next", row.ta, row.name))
+        elif row.command_type == "leave":
+            events.append(ReplayEvent(row.leave_time, EXIT_ORDER, "leave", row.name, None))
+        elif row.command_type == "remove" or row.command_type == "timeout":
+            # The bot removes students who leave voice for too long. Replay it as a TA removing them
+            events.append(ReplayEvent(row.leave_time, EXIT_ORDER, "remove", row.ta, row.name))
+        elif row.command_type == "clear":
+            # Every student in the queue gets a row when it is cleared. Only clear once
+            if (row.leave_time, row.ta) not in cleared:
+                cleared.add((row.leave_time, row.ta))
+                events.append(ReplayEvent(row.leave_time, EXIT_ORDER, "clear", row.ta, None))
+
+    # sorted() is stable so rows in the same minute keep their log order
+    return sorted(events, key=lambda e: (e.time, e.order))
+
+
+def days_in_log(rows):
+    """
+    Count how many students joined the queue on each day
+
+    Returns: list of (date string, join count) sorted by busiest day first
+    """
+    counts = Counter(row.date for row in rows if row.join_time is not None)
+    return counts.most_common()
+
+
+class SessionReplay:
+    """
+    Feeds a list of ReplayEvents to a QueueBot in testing mode
+
+    The bot shares a VirtualClock with the replay so join times, wait times and
+    the session log it writes follow the replayed timestamps instead of the wall clock
+
+    Parameters:
+        events: list of ReplayEvent sorted by time
+        speed: how many virtual seconds pass per real second (0 = don't wait at all)
+    """
+    def __init__(self, events, speed=0):
+        self.events = events
+        self.speed = speed
+        self.clock = VirtualClock(events[0].time if events else datetime.now())
+
+        self.guild = MockGuild("replay")
+        self.channel = MockChannel(BENCH_CONFIG["TEXT_LISTENS"][0], self.guild)
+        self._authors = {}
+
+        self.latencies = {}
+        self.peak_queue_length = 0
+        self.next_mismatches = 0  # "!q next" popped someone other than who the log says
+        self.missing = 0  # Exit events for someone who is not in the queue
+
+        self.bot = QueueBot(QueueConfig(BENCH_CONFIG, test_mode=True), MockLogger(), testing=True, clock=self.clock)
+
+    async def _wait_until(self, when):
+        delta = (when - self.clock.now()).total_seconds()
+        if delta <= 0:
+            return
+        if self.speed > 0:
+            await asyncio.sleep(delta / self.speed)
+        self.clock.set(when)
+
+    def _author(self, name, ta=False):
+        if name not in self._authors:
+            author = MockAuthor(name, None, BENCH_CONFIG["TA_ROLES"] if ta else [])
+            self.guild.add_member(author)
+            self._authors[name] = author
+        return self._authors[name]
+
+    def _in_queue(self, name):
+        author = self._authors.get(name)
+        return author is not None and author.id in self.bot.get_queue(self.channel)
+
+    async def _run_command(self, kind, content, author, mentions=None):
+        message = MockMessage(content, author, self.channel, mentions)
+        start = perf_counter()
+        await self.bot._queue_command(message)
+        self.latencies.setdefault(kind, []).append(perf_counter() - start)
+
+    async def _replay(self, event):
+        queue = self.bot.get_queue(self.channel)
+
+        if event.command == "join":
+            await self._run_command("join", "!q join", self._author(event.actor))
+        elif event.command == "leave":
+            self.missing += not self._in_queue(event.actor)
+            await self._run_command("leave", "!q leave", self._author(event.actor))
+        elif event.command == "remove":
+            self.missing += not self._in_queue(event.target)
+            target = self._author(event.target)
+            await self._run_command("remove", f"!q remove {target.mention}", self._author(event.actor or "TA", ta=True),
+                                    [target])
+        elif event.command == "next":
+            head = queue[0].get_name() if len(queue) else None
+            self.next_mismatches += head != event.target
+            await self._run_command("next", "!q next", self._author(event.actor or "TA", ta=True))
+        elif event.command == "clear":
+            await self._run_command("clear", "!q clear", self._author(event.actor or "TA", ta=True))
+
+        self.peak_queue_length = max(self.peak_queue_length, len(queue))
+
+    async def run(self):
+        """
+        Replay every event
+
+        Returns: A dictionary with the results of the replay
+        """
+        start = perf_counter()
+        for event in self.events:
+            await self._wait_until(event.time)
+            await self._replay(event)
+        elapsed = perf_counter() - start
+
+        all_latencies = [t for values in self.latencies.values() for t in values]
+        virtual = (self.events[-1].time - self.events[0].time).total_seconds() if self.events else 0
+        return {
+            "events": len(self.events),
+            "virtual_duration_s": virtual,
+            "elapsed_s": round(elapsed, 4),
+            "throughput_cps": round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+            "peak_queue_length": self.peak_queue_length,
+            "final_queue_length": len(self.bot.get_queue(self.channel)),
+            "next_mismatches": self.next_mismatches,
+            "missing": self.missing,
+            "latency_ms": dict([("all", summarize(all_latencies))] +
+                               [(kind, summarize(values)) for kind, values in sorted(self.latencies.items())]),
+        }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay QueueBot session logs against a testing QueueBot")
+    parser.add_argument("log", help="path to an OH_logs_<guild>.csv file")
+    parser.add_argument("--date", help='only replay a single day (ex: "April 05, 2021")')
+    parser.add_argument("--list-days", action="store_true", help="list the busiest days in the log and exit")
+    parser.add_argument("--speed", type=float, default=0,
+                        help="virtual seconds per real second; 0 replays as fast as possible (default: %(default)s)")
+    parser.add_argument("--output", help="JSON file to write results to")
+    args = parser.parse_args(argv)
+
+    rows = parse_session_log(args.log)
+    if args.list_days:
+        for day, joins in days_in_log(rows):
+            print(f"{day}: {joins} join(s)")
+        return None
+
+    if args.date:
+        rows = [row for row in rows if row.date == args.date]
+    events = build_events(rows)
+    if not events:
+        print("Nothing to replay", file=sys.stderr)
+        return None
+
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        with scratch_directory():
+            replay = SessionReplay(events, args.speed)
+            with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+                result = loop.run_until_complete(replay.run())
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+    result.update({"log": os.path.abspath(args.log), "date": args.date, "speed": args.speed, "commit": get_commit()})
+    latency = result["latency_ms"]["all"]
+    print(f"events={result['events']} peak_queue={result['peak_queue_length']} "
+          f"next_mismatches={result['next_mismatches']} missing={result['missing']} "
+          f"p50={latency['p50']:.3f}ms p99={latency['p99']:.3f}ms", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+from collections import OrderedDict
+
+from clock import DEFAULT_CLOCK
+
+# Weight of the newest sample in the average time between students being helped
+SERVICE_EWMA_ALPHA = 0.2
+# The projected wait isn't used to turn students away until this many students were helped
+MIN_SERVICE_SAMPLES = 3
+
+
+class AdmissionControl:
+    """
+    Decides whether a student can join a server's queue when the queue is limited by
+    config.QUEUE_CAPACITY (number of students) or config.MAX_WAIT_MINUTES (projected wait)
+    and keeps the overflow waitlist (config.OVERFLOW_WAITLIST) and shed load counters
+
+    The projected wait of a new student is their position times the average (EWMA)
+    time between students being helped ("!q next" and dispatches, the same events as
+    the "next"/"dispatch" rows of the session log). Time when nobody was waiting isn't
+    counted, so a quiet start of office hours doesn't make the queue look slow
+
+    Counters (see stats()):
+        rejected_full: students turned away because the queue was at capacity
+        rejected_wait: students turned away because their projected wait was too long
+        waitlisted: students put on the waitlist instead of being turned away
+        promoted: waitlisted students who were moved into the queue
+        waitlist_left: waitlisted students who left before getting into the queue
+
+    Parameters:
+        capacity: most students in the queue (None for no limit)
+        max_wait: longest projected wait in seconds (None for no limit)
+        clock: clock used to time the students being helped. Defaults to the system clock
+    """
+    def __init__(self, capacity=None, max_wait=None, clock=None):
+        self.capacity = capacity
+        self.max_wait = max_wait
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._interval = None  # EWMA of the seconds between students being helped
+        self._samples = 0
+        self._since = None  # clock.monotonic() the current interval started (None while the queue is empty)
+        self.waitlist = OrderedDict()  # uuid -> DiscordUser, in the order they were waitlisted
+        self.shedding = False  # True from the first student shed until the queue takes students again
+        self.rejected_full = 0
+        self.rejected_wait = 0
+        self.waitlisted = 0
+        self.promoted = 0
+        self.waitlist_left = 0
+
+    def joined(self):
+        """
+        Record that a student was added to the queue
+
+        Returns: None
+        """
+        if self._since is None:
+            self._since = self._clock.monotonic()
+
+    def helped(self, remaining):
+        """
+        Record that a student was helped (and removed from the queue)
+
+        Parameters:
+            remaining: number of students left in the queue
+
+        Returns: None
+        """
+        now = self._clock.monotonic()
+        if self._since is not None:
+            sample = max(0.0, now - self._since)
+            if self._interval is None:
+                self._interval = sample
+            else:
+                self._interval += SERVICE_EWMA_ALPHA * (sample - self._interval)
+            self._samples += 1
+        self._since = now if remaining else None
+
+    def emptied(self):
+        # Nobody is waiting so the time until the next student joins isn't service time
+        self._since = None
+
+    def projected_wait(self, position):
+        """
+        Returns: estimated seconds until the student at position is helped
+                 (None until MIN_SERVICE_SAMPLES students were helped)
+        """
+        if self._samples < MIN_SERVICE_SAMPLES:
+            return None
+        return position * self._interval
+
+    def check(self, length):
+        """
+        Parameters:
+            length: number of students in the queue
+
+        Returns: None if another student can join, otherwise "full" or "wait"
+                 (the reason they can't). An empty queue always takes students
+        """
+        if length == 0:
+            return None
+        if self.capacity is not None and length >= self.capacity:
+            return "full"
+        wait = self.projected_wait(length + 1)
+        if self.max_wait is not None and wait is not None and wait > self.max_wait:
+            return "wait"
+        return None
+
+    def shed(self, reason, waitlist):
+        """
+        Record that a student couldn't join
+
+        Parameters:
+            reason: what check() returned
+            waitlist: True if the student was put on the waitlist
+
+        Returns: True if this is the first student shed since the queue last took students
+        """
+        if waitlist:
+            self.waitlisted += 1
+        elif reason == "full":
+            self.rejected_full += 1
+        else:
+            self.rejected_wait += 1
+        first = not self.shedding
+        self.shedding = True
+        return first
+
+    def admitted(self):
+        # A student got into the queue without being shed
+        self.shedding = False
+
+    def waitlist_position(self, uuid):
+        """
+        Returns: the user's position on the waitlist (1 is next). None if they're not on it
+        """
+        for position, waiting in enumerate(self.waitlist, start=1):
+            if waiting == uuid:
+                return position
+        return None
+
+    def leave_waitlist(self, uuid):
+        """
+        Returns: the DiscordUser removed from the waitlist (None if they weren't on it)
+        """
+        user = self.waitlist.pop(uuid, None)
+        if user is not None:
+            self.waitlist_left += 1
+        return user
+
+    def promote(self, length):
+        """
+        Take students off the waitlist while there is room in the queue
+
+        Parameters:
+            length: number of students in the queue
+
+        Returns: list of DiscordUsers to add to the end of the queue (in order)
+        """
+        users = []
+        while self.waitlist and self.check(length + len(users)) is None:
+            users.append(self.waitlist.popitem(last=False)[1])
+        self.promoted += len(users)
+        return users
+
+    def stats(self):
+        """
+        Returns: dictionary with the shed load counters, the students on the waitlist
+                 and the average seconds between students being helped (None if unknown)
+        """
+        return {
+            "rejected_full": self.rejected_full,
+            "rejected_wait": self.rejected_wait,
+            "waitlisted": self.waitlisted,
+            "promoted": self.promoted,
+            "waitlist_left": self.waitlist_left,
+            "waitlist": len(self.waitlist),
+            "service_interval": self._interval,
+        }
@@ -0,0 +1,68 @@
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+
+class SystemClock():
+    """
+    The clock QueueBot uses by default
+
+    monotonic() is used for measuring durations and timers (it never jumps when the
+    system time changes). now() is the real wall clock time, so timestamps follow
+    NTP corrections and DST changes on a bot that runs for weeks
+    """
+    def monotonic(self):
+        """
+        Returns: seconds (as a float) since an arbitrary starting point
+        """
+        return time.monotonic()
+
+    def now(self):
+        """
+        Returns: the current date and time as a datetime object
+        """
+        return datetime.now()
+
+    async def sleep(self, seconds):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock():
+    """
+    A clock that only moves when it is told to. Used by simulations,
+    session replays and unit tests so they don't have to wait in real time
+
+    Parameters:
+        start: datetime the clock starts at (defaults to the current time)
+    """
+    def __init__(self, start=None):
+        self._start = start if start is not None else datetime.now()
+        self._elapsed = 0.0
+
+    def monotonic(self):
+        return self._elapsed
+
+    def now(self):
+        return self._start + timedelta(seconds=self._elapsed)
+
+    def advance(self, seconds):
+        """
+        Move the clock forward by the given amount of seconds
+        """
+        if seconds < 0:
+            raise ValueError("A clock can not go backwards")
+        self._elapsed += seconds
+
+    def set(self, when):
+        """
+        Move the clock forward to a given datetime (earlier times are ignored)
+        """
+        self._elapsed = max(self._elapsed, (when - self._start).total_seconds())
+
+    async def sleep(self, seconds):
+        # Let other tasks run like asyncio.sleep() would
+        self.advance(seconds)
+        await asyncio.sleep(0)
+
+
+DEFAULT_CLOCK = SystemClock()
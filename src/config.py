@@ -2,68 +2,130 @@ import os
 import sys
 import json
 
+from types import MappingProxyType
 
-def get_config_json():
+
+class ConfigError(Exception):
     """
-    Opens and ensures config.json config file is valid
-    If config.json does not exist, the program is terminated
+    Raised when the config file is missing or one of its values is invalid
+    """
+    pass
 
-    Returns: Dictionary with config key/values
+
+def get_config_path():
+    """
+    Returns: path to the config file (/data/config.json when running in Docker)
     """
     if os.environ.get("QUEUE_USE_ENV"):
-        CONFIG_FILE = "/data/config.json"
-    else:
-        CONFIG_FILE = "config.json"
+        return "/data/config.json"
+    return "config.json"
+
+
+def read_config_json(path=None):
+    """
+    Opens the config file (see get_config_path) and parses it
+
+    Parameters:
+        path: config file to read. Defaults to get_config_path()
+
+    Returns: Dictionary with config key/values
+    Raises: ConfigError if the file does not exist or is not valid JSON
+    """
+    path = path if path is not None else get_config_path()
 
     # Check if config file exists
-    if not os.path.exists(CONFIG_FILE):
-        print(f"{CONFIG_FILE} not found. Please add your secret token and ensure your bot is already in the desired server")
-        sys.exit(1)
+    if not os.path.exists(path):
+        raise ConfigError(f"{path} not found. Please add your secret token and ensure your bot is already in the desired server")
 
     # Read secrets.json file
-    with open(CONFIG_FILE) as f:
-        data = json.load(f)
+    with open(path) as f:
+        try:
+            return json.load(f)
+        except ValueError as e:
+            raise ConfigError(f"{path} is not valid JSON: {e}")
 
-    return data
 
+def get_config_json():
+    """
+    Opens and ensures config.json config file is valid
+    If config.json does not exist, the program is terminated
+
+    Returns: Dictionary with config key/values
+    """
+    try:
+        return read_config_json()
+    except ConfigError as e:
+        print(e)
+        sys.exit(1)
 
 
 class QueueConfig:
     """
     A storage class which holds all config values for QueueBot.
     On initialization, it does simple validation checks to see if
-    the given config is properly configured. This object does not check
-    if the values work for a given discord server - that must be verified
-    after authentication has taken place.
+    the given config is properly configured (raising ConfigError if it is not).
+    This object does not check if the values work for a given discord server -
+    that must be verified after authentication has taken place (see ResolvedConfig).
+
+    A QueueConfig can not be modified once it is created. List options are stored as
+    tuples and each one has a matching frozenset (ex: TA_ROLE_SET) for constant time
+    lookups. Use copy() to create a config with different values.
 
     Paramters:
         config_obj: a dictionary with config options (see README.md for all options)
         from_env: True if config values come from environmental variables (for Docker)
         test_mode: set to True for unit test cases
     """
-    def __init__(self, config_obj, from_env=False, test_mode=False):
-        self.original_config = config_obj
-        self.clean_config = self._validate_config(config_obj, from_env)
-        self.FROM_ENV = from_env
-        self.TEST_MODE = test_mode
-        self.VERSION = "1.2.0"
+    __slots__ = (
+        "original_config", "clean_config", "FROM_ENV", "TEST_MODE", "VERSION",
+        # Config options (optional options are None when they are not used)
+        "SECRET_TOKEN", "TA_ROLES", "CHECK_VOICE_WAITING", "TEXT_LISTENS", "ALERT_ON_FIRST_JOIN", "REPLY_MODE", "AUTO_DISPATCH",
+        "OVERFLOW_WAITLIST", "QUEUE_CAPACITY", "MAX_WAIT_MINUTES", "QUEUE_ENGINE", "TEXT_ALERT", "VOICE_WAITING", "VOICE_OFFICES", "COURSES",
+        # Lookup sets
+        "TA_ROLE_SET", "TEXT_LISTEN_SET", "VOICE_OFFICE_SET", "COURSE_WEIGHTS",
+    )
 
-        # TODO Default config attribtues so python knows the attribute exists...?
+    def __init__(self, config_obj, from_env=False, test_mode=False):
+        clean_config = self._validate_config(config_obj, from_env)
+        self._compile(dict(config_obj), clean_config, from_env, test_mode)
 
+    def _compile(self, original_config, clean_config, from_env, test_mode):
+        """
+        Fill in every attribute from an already validated config
+        """
+        fields = {name: None for name in self.__slots__}
         # Each dictionary attribute becomes a constant field
-        for key, val in self.clean_config.items():
-            setattr(self, key.upper(), val)
+        fields.update(clean_config)
+        fields.update({
+            "original_config": MappingProxyType(original_config),
+            "clean_config": MappingProxyType(clean_config),
+            "FROM_ENV": from_env,
+            "TEST_MODE": test_mode,
+            "VERSION": "1.2.0",
+            "TA_ROLE_SET": frozenset(clean_config["TA_ROLES"]),
+            "TEXT_LISTEN_SET": frozenset(clean_config["TEXT_LISTENS"]),
+            "VOICE_OFFICE_SET": frozenset(clean_config.get("VOICE_OFFICES", ())),
+            "COURSE_WEIGHTS": MappingProxyType(dict(clean_config.get("COURSES", ()))),
+        })
+        for name, val in fields.items():
+            object.__setattr__(self, name, val)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("QueueConfig can not be modified. Use QueueConfig.copy() to change values")
+
+    def __delattr__(self, name):
+        raise AttributeError("QueueConfig can not be modified. Use QueueConfig.copy() to change values")
 
     def _validate_config(self, config_obj, from_env):
         """
         Do basic error checking
-        NOTE: This method terminates the program if a config option is invalid
+        NOTE: This method raises ConfigError if a config option is invalid
 
         Parmeters:
             config_object: a dictionary with config options (see README for all options)
             from_env: True if config values come from environmental variables (for Docker)
 
-        Returns: A clean dictionary (whitespace trimmed, etc.) with config options
+        Returns: A clean dictionary (whitespace trimmed, lists turned into tuples, etc.) with config options
         """
 
         # TODO Logger Level config option
@@ -73,55 +135,111 @@ class QueueConfig:
             "TA_ROLES": "This field is required to allow administrators to remove users from the queue",
             "TEXT_LISTENS": "You must update this field to allow the bot to read commands",
             "VOICE_WAITING": "You must define which voice channel is a waiting room when you have CHECK_VOICE_WAITING enabled",
-            "VOICE_OFFICES": "You must define Office Hour(s) voice channels when you have ALERT_ON_FIRST_JOIN is enabled",
-            "TEXT_ALERT": "You must define an alerts channel so the bot can send you notification message"
+            "VOICE_OFFICES": "You must define Office Hour(s) voice channels when you have ALERT_ON_FIRST_JOIN or AUTO_DISPATCH enabled",
+            "TEXT_ALERT": "You must define an alerts channel so the bot can send you notification message",
+            "COURSES": "Remove this field or list the courses that share the queue (ex: [\"csc110:2\", \"csc120\"])",
         }
 
-        config_clean = {
-            "SECRET_TOKEN": config_obj["SECRET_TOKEN"].strip(),
-            "TA_ROLES": [r.strip() for r in config_obj["TA_ROLES"] if r],
-            "CHECK_VOICE_WAITING": config_obj["CHECK_VOICE_WAITING"].strip().lower() == "true",
-            "TEXT_LISTENS": [c.strip().lstrip("#") for c in config_obj["TEXT_LISTENS"] if c],
-            "ALERT_ON_FIRST_JOIN": config_obj["ALERT_ON_FIRST_JOIN"].strip().lower() == "true",
-        }
+        try:
+            config_clean = {
+                "SECRET_TOKEN": config_obj["SECRET_TOKEN"].strip(),
+                "TA_ROLES": tuple(r.strip() for r in config_obj["TA_ROLES"] if r),
+                "CHECK_VOICE_WAITING": config_obj["CHECK_VOICE_WAITING"].strip().lower() == "true",
+                "TEXT_LISTENS": tuple(c.strip().lstrip("#") for c in config_obj["TEXT_LISTENS"] if c),
+                "ALERT_ON_FIRST_JOIN": config_obj["ALERT_ON_FIRST_JOIN"].strip().lower() == "true",
+                # Optional (added after the other options so older configs don't have it)
+                "REPLY_MODE": config_obj.get("REPLY_MODE", "False").strip().lower() == "true",
+                "AUTO_DISPATCH": config_obj.get("AUTO_DISPATCH", "False").strip().lower() == "true",
+                "OVERFLOW_WAITLIST": config_obj.get("OVERFLOW_WAITLIST", "False").strip().lower() == "true",
+            }
+
+            if config_clean["ALERT_ON_FIRST_JOIN"]:
+                config_clean["TEXT_ALERT"] = config_obj["TEXT_ALERT"].strip()
 
-        if config_clean["ALERT_ON_FIRST_JOIN"]:
-            config_clean["TEXT_ALERT"] = config_obj["TEXT_ALERT"].strip()
+            if config_clean["CHECK_VOICE_WAITING"]:
+                config_clean["VOICE_WAITING"] = config_obj["VOICE_WAITING"].strip()
 
-        if config_clean["CHECK_VOICE_WAITING"]:
-            config_clean["VOICE_WAITING"] = config_obj["VOICE_WAITING"].strip()
+            if config_clean["ALERT_ON_FIRST_JOIN"] or config_clean["AUTO_DISPATCH"]:
+                config_clean["VOICE_OFFICES"] = tuple(v.strip() for v in config_obj["VOICE_OFFICES"] if v)
 
-        if config_clean["ALERT_ON_FIRST_JOIN"]:
-            config_clean["VOICE_OFFICES"] = [v.strip()
-                                             for v in config_obj["VOICE_OFFICES"] if v]
+            # Optional. Courses that share the queue as "name" or "name:weight" (see fair_scheduler.py)
+            if "COURSES" in config_obj:
+                config_clean["COURSES"] = tuple(_parse_course(c, prefix) for c in config_obj["COURSES"] if c)
+
+            # Optional. Limits on who can join the queue (see admission.py)
+            if config_obj.get("QUEUE_CAPACITY", "").strip():
+                config_clean["QUEUE_CAPACITY"] = _parse_positive("QUEUE_CAPACITY", config_obj["QUEUE_CAPACITY"], int, prefix)
+            if config_obj.get("MAX_WAIT_MINUTES", "").strip():
+                config_clean["MAX_WAIT_MINUTES"] = _parse_positive("MAX_WAIT_MINUTES", config_obj["MAX_WAIT_MINUTES"], float, prefix)
+
+            # Optional. Socket of a separate queue engine process (see queue_engine.py)
+            if config_obj.get("QUEUE_ENGINE", "").strip():
+                config_clean["QUEUE_ENGINE"] = config_obj["QUEUE_ENGINE"].strip()
+        except KeyError as e:
+            raise ConfigError(f"{prefix}{e.args[0]} is missing!")
+        except AttributeError:
+            raise ConfigError("Config values must be strings (or lists of strings)")
 
         if config_clean["SECRET_TOKEN"] == "YOUR_SECRET_TOKEN_HERE":
-            print(prefix + "SECRET_TOKEN is empty!")
-            print(error["SECRET_TOKEN"])
-            sys.exit(1)
+            raise ConfigError(f"{prefix}SECRET_TOKEN is empty!\n{error['SECRET_TOKEN']}")
 
         # Simple error checking. Make sure non-booleans are nonempty
         for key, val in config_clean.items():
-            if isinstance(val, bool):
+            if isinstance(val, (bool, int, float)):
                 continue
             if len(val) == 0:
-                print(prefix + key, "is empty!")
-                print(error[key])
-                sys.exit(1)
+                raise ConfigError(f"{prefix}{key} is empty!\n{error[key]}")
+
+        names = [name for name, _ in config_clean.get("COURSES", ())]
+        if len(names) != len(set(names)):
+            raise ConfigError(f"{prefix}COURSES lists the same course more than once")
 
-        if config_clean["CHECK_VOICE_WAITING"] and config_clean["ALERT_ON_FIRST_JOIN"] and \
-                        config_clean["VOICE_WAITING"] in config_clean["VOICE_OFFICES"]:
-            print(config_clean["VOICE_WAITING"], "can be either the waiting room or an office room not both!")
-            sys.exit(1)
+        # These need the queue in the bot's process
+        in_process = [key for key in ("AUTO_DISPATCH", "COURSES", "QUEUE_CAPACITY", "MAX_WAIT_MINUTES", "OVERFLOW_WAITLIST")
+                      if config_clean.get(key)]
+        if config_clean.get("QUEUE_ENGINE") and in_process:
+            raise ConfigError(f"{prefix}QUEUE_ENGINE can't be used with {', '.join(prefix + key for key in in_process)}")
+
+        if config_clean["CHECK_VOICE_WAITING"] and \
+                        config_clean["VOICE_WAITING"] in config_clean.get("VOICE_OFFICES", ()):
+            raise ConfigError(f"{config_clean['VOICE_WAITING']} can be either the waiting room or an office room not both!")
 
         return config_clean
 
-    def copy(self):
+    def changed_keys(self, other):
+        """
+        Compare this config with another one
+
+        Parameters:
+            other: QueueConfig to compare against
+
+        Returns: set of keys (ex: "TA_ROLES") whose values differ between the two configs
+        """
+        if other.clean_config is self.clean_config:
+            return set()
+        keys = set(self.clean_config) | set(other.clean_config)
+        return {key for key in keys if self.clean_config.get(key) != other.clean_config.get(key)}
+
+    def copy(self, **changes):
         """
-        Return a clone of the QueueBot config
+        Return a clone of the QueueBot config. A plain copy shares every value with
+        the original (nothing is parsed or validated again since configs can't be modified)
+
+        Parameters:
+            changes: config options to change in the clone, in the same format as
+                     config.json (ex: copy(CHECK_VOICE_WAITING="True", VOICE_WAITING="waiting-room"))
+
+        Returns: a QueueConfig
+        Raises: ConfigError if the changed config is invalid
         """
-        return QueueConfig(self.original_config.copy(),
-                           from_env=self.FROM_ENV, test_mode=self.TEST_MODE)
+        if changes:
+            return QueueConfig(dict(self.original_config, **changes),
+                               from_env=self.FROM_ENV, test_mode=self.TEST_MODE)
+
+        clone = object.__new__(QueueConfig)
+        for name in self.__slots__:
+            object.__setattr__(clone, name, getattr(self, name))
+        return clone
 
     def __str__(self):
         retval = []
@@ -132,7 +250,205 @@ class QueueConfig:
         for key, val in self.clean_config.items():
             if key == "SECRET_TOKEN":
                 val = '*' * 40
+            elif isinstance(val, tuple):
+                val = list(val)
             retval.append(f"{prefix}{key}: {val}\n")
         retval.append('=' * banner_width + "\n")
 
         return "".join(retval)
+
+
+def _parse_course(course, prefix=""):
+    """
+    Parse a COURSES entry ("csc110" or "csc110:2"). Names are lower case like commands
+
+    Returns: (name, weight) where weight is a positive number (1 if it isn't given)
+    Raises: ConfigError if the weight isn't a positive number
+    """
+    name, _, weight = course.strip().partition(":")
+    try:
+        weight = float(weight) if weight.strip() else 1.0
+    except ValueError:
+        weight = 0
+    if not name.strip() or not weight > 0:
+        raise ConfigError(f"{prefix}COURSES entry '{course}' must be a course name optionally followed by :weight (a positive number)")
+    return name.strip().lower(), weight
+
+
+def _parse_positive(key, value, kind, prefix=""):
+    """
+    Parse a number option (ex: QUEUE_CAPACITY)
+
+    Parameters:
+        kind: int or float
+
+    Returns: the number
+    Raises: ConfigError if the value isn't a positive number of that kind
+    """
+    try:
+        number = kind(value.strip())
+    except ValueError:
+        number = 0
+    if not number > 0:
+        raise ConfigError(f"{prefix}{key} must be a positive {'whole ' if kind is int else ''}number (got '{value.strip()}')")
+    return number
+
+
+def find_channels(names, all_channels):
+    """
+    Find channels by name
+
+    Parameters:
+        names: a channel name or a list/tuple of channel names
+        all_channels: discord.py channels to search (ex: guild.voice_channels)
+
+    Returns: frozenset of discord.py channels matching the names
+    Raises: ConfigError if any of the channels can not be found
+    """
+    # TODO Assert all voice channels names are unique
+    names = set([names]) if isinstance(names, str) else set(names)
+    channel_objects = frozenset(filter(lambda c: c.name in names, all_channels))
+
+    if len(names) == len(channel_objects):
+        return channel_objects
+
+    # Could not find all channels
+    # TODO Make debug output more helpful (is it looking for office hours? Waiting room?)
+    missing = names - set([v.name for v in channel_objects])
+    raise ConfigError("Unable to find the following channels: " +
+                      ", ".join([f"'{v}'" for v in missing]) + "\n" +
+                      "Available channels: " + ", ".join([f"'{c.name}'" for c in all_channels]))
+
+
+class ResolvedConfig:
+    """
+    The parts of a QueueConfig that refer to a discord server, with role and channel
+    names resolved to IDs. This is built once after logging in so request-path checks
+    are frozenset lookups on IDs (which also keep working if a role or channel is renamed).
+    Like QueueConfig, it can not be modified once it is created. It can be saved to
+    a snapshot (see to_snapshot()) so a restarted bot does not have to resolve it again.
+
+    Parameters:
+        config: the QueueConfig to resolve
+        guild: discord.py guild the names are resolved in
+        previous: an older ResolvedConfig for the same guild. Lookups built from config
+                  keys that did not change are shared with it instead of being rebuilt
+        keys: config keys that changed since previous was built (see QueueConfig.changed_keys)
+
+    Raises: ConfigError if a voice channel from the config does not exist
+    """
+    __slots__ = ("config", "GUILD_ID", "TA_ROLE_IDS", "TEXT_LISTEN_IDS", "WAITING_ROOM_ID", "OFFICE_ROOM_IDS", "missing")
+
+    # Config keys each lookup is built from
+    ROLE_KEYS = frozenset(["TA_ROLES"])
+    TEXT_KEYS = frozenset(["TEXT_LISTENS"])
+    VOICE_KEYS = frozenset(["CHECK_VOICE_WAITING", "VOICE_WAITING", "ALERT_ON_FIRST_JOIN", "VOICE_OFFICES"])
+
+    def __init__(self, config, guild, previous=None, keys=None):
+        fields = {"config": config, "GUILD_ID": guild.id, "missing": ()}
+        if previous is not None:
+            fields.update({name: getattr(previous, name) for name in self.__slots__ if name not in fields})
+        else:
+            keys = self.ROLE_KEYS | self.TEXT_KEYS | self.VOICE_KEYS
+
+        missing = set()
+        if keys & self.ROLE_KEYS:
+            roles = [r for r in guild.roles if r.name in config.TA_ROLE_SET]
+            fields["TA_ROLE_IDS"] = frozenset(r.id for r in roles)
+            missing |= config.TA_ROLE_SET - {r.name for r in roles}
+        if keys & self.TEXT_KEYS:
+            channels = [c for c in guild.text_channels if c.name in config.TEXT_LISTEN_SET]
+            fields["TEXT_LISTEN_IDS"] = frozenset(c.id for c in channels)
+            missing |= config.TEXT_LISTEN_SET - {c.name for c in channels}
+        if keys & self.VOICE_KEYS:
+            fields["WAITING_ROOM_ID"] = None
+            fields["OFFICE_ROOM_IDS"] = frozenset()
+            if config.CHECK_VOICE_WAITING:
+                fields["WAITING_ROOM_ID"] = next(iter(find_channels(config.VOICE_WAITING, guild.voice_channels))).id
+            if config.VOICE_OFFICES:
+                fields["OFFICE_ROOM_IDS"] = frozenset(c.id for c in find_channels(config.VOICE_OFFICES, guild.voice_channels))
+        if missing:
+            fields["missing"] = tuple(sorted(missing))
+
+        self._set_fields(fields)
+
+    def _set_fields(self, fields):
+        for name, val in fields.items():
+            object.__setattr__(self, name, val)
+
+    @staticmethod
+    def _fingerprint(config):
+        # The config values a ResolvedConfig is built from (in a JSON friendly format)
+        keys = ResolvedConfig.ROLE_KEYS | ResolvedConfig.TEXT_KEYS | ResolvedConfig.VOICE_KEYS
+        return {key: list(val) if isinstance(val, tuple) else val
+                for key, val in config.clean_config.items() if key in keys}
+
+    def to_snapshot(self):
+        """
+        Returns: a JSON friendly dictionary that from_snapshot() can turn back into a ResolvedConfig
+        """
+        return {
+            "guild_id": self.GUILD_ID,
+            "config": self._fingerprint(self.config),
+            "ta_role_ids": sorted(self.TA_ROLE_IDS),
+            "text_listen_ids": sorted(self.TEXT_LISTEN_IDS),
+            "waiting_room_id": self.WAITING_ROOM_ID,
+            "office_room_ids": sorted(self.OFFICE_ROOM_IDS),
+        }
+
+    @classmethod
+    def from_snapshot(cls, config, guild, data):
+        """
+        Rebuild a ResolvedConfig saved with to_snapshot() without searching the guild by name
+
+        Parameters:
+            config: the current QueueConfig
+            guild: discord.py guild the snapshot should be for
+            data: dictionary from to_snapshot() (or None)
+
+        Returns: a ResolvedConfig, or None if the snapshot is for another guild, the config
+                 has changed since it was saved or one of its voice channels no longer exists
+        """
+        try:
+            if data is None or data["guild_id"] != guild.id or data["config"] != cls._fingerprint(config):
+                return None
+            room_ids = set(data["office_room_ids"])
+            if data["waiting_room_id"] is not None:
+                room_ids.add(data["waiting_room_id"])
+            if any(guild.get_channel(room_id) is None for room_id in room_ids):
+                return None
+
+            resolved = object.__new__(cls)
+            resolved._set_fields({
+                "config": config,
+                "GUILD_ID": guild.id,
+                "TA_ROLE_IDS": frozenset(data["ta_role_ids"]),
+                "TEXT_LISTEN_IDS": frozenset(data["text_listen_ids"]),
+                "WAITING_ROOM_ID": data["waiting_room_id"],
+                "OFFICE_ROOM_IDS": frozenset(data["office_room_ids"]),
+                "missing": (),
+            })
+            return resolved
+        except (KeyError, TypeError):
+            return None
+
+    def __setattr__(self, name, value):
+        raise AttributeError("ResolvedConfig can not be modified")
+
+    def is_ta(self, roles):
+        """
+        Returns: True if any of the given discord.py roles is a TA role
+        """
+        return any(r.id in self.TA_ROLE_IDS for r in roles)
+
+    def listens_to(self, channel):
+        """
+        Returns: True if the bot reads commands in the given discord.py text channel
+        """
+        return channel.id in self.TEXT_LISTEN_IDS
+
+    def office_rooms(self, guild):
+        """
+        Returns: list of the config.VOICE_OFFICES discord.py voice channels in guild
+        """
+        return [room for room in map(guild.get_channel, self.OFFICE_ROOM_IDS) if room is not None]
@@ -3,23 +3,50 @@ MSG_HELP = {
             "STUDENT": """__STUDENT COMMANDS:__
 > `!q help` - Get this help message
 > `!q join`  - Join the queue (ONLINE aka TA will assist you in via Discord screen share)
+> `!q join <course>` - Join the queue for a course when several courses share it (`!q join-inperson <course>` for in-person)
 > `!q leave` - Leave the queue
 > `!q position` - See how many people are in front of you
-> `!q list` - Get a list of the next 10 people in line""",
+> `!q list [page]` - Get a list of the next 10 people in line (or another page of the queue)
+> `!q notify [N]` - Get a Direct Message when you reach position N in the queue (3 if N is left out). `!q notify off` to cancel""",
 
             "TA": """__TA COMMANDS:__
 > `!q help` - Get this help message
 > `!q next` - Get the next person within that class to help **(REMOVES FROM QUEUE)**
+> `!q next voice|online|inperson` - Get the next person who is online and in voice/online/in person **(REMOVES FROM QUEUE)**
 > `!q clear` - Empty the queue (requires confirmation)
-> `!q list` - Get a list of the next 10 people in line
+> `!q list [page]` - Get a list of the next 10 people in line (or another page of the queue)
 > `!q ping` - Bot should reply with `Pong!` Used to make sure bot can send/receive messages
 > `!q add @user` - add @user to the end of the queue and marks them as online (you must @mention the person)
 > `!q add-inperson @user` - add @user to the end of the queue and marks them as in-person (you must @mention the person)
 > `!q remove @user` - remove @user from the queue (you must @mention the person)
 > `!q front @user` - adds/moves @user to the front of the queue (you must @mention the person)
 > `!q logs` - Get logs of office hours as a file in DMs
+> `!q reload` - Reload the config file without restarting the bot
+> `!q board` - Post a message with Join, Leave and Position buttons
+> `!q stats` - Show dispatch, course wait time, admission and overload stats so far
 NOTE: TAs can also run student commands""",
 }
 
+MSG_QUEUE_BOARD = """**Office Hours Queue**
+Use the buttons below (or the `/join`, `/leave` and `/position` commands) to join or leave the queue"""
 MSG_QUEUE_CLEAR = """Are you sure you want to clear the queue?
-React with ✅ to confirm or ❌ to cancel"""
\ No newline at end of file
+React with ✅ to confirm or ❌ to cancel"""
+MSG_WAITING_REMINDER = """You are in the __{room}__ voice channel but not in the office hours queue.
+Type `!q join` in #{channel} to join it"""
+
+MSG_NOT_WAITING = "These students are in the queue (online) but not in the __{room}__ voice channel: {names}"
+
+MSG_VOICE_TIMEOUT = "{mention} you have been removed from the queue because you left the __{room}__ voice channel"
+
+MSG_ALMOST_UP = "You are now at position #{position} in the office hours queue for **{server}**. Get ready!"
+
+MSG_DISPATCHED = "{mention} it's your turn! You have been moved to the __{room}__ voice channel"
+
+MSG_QUEUE_FULL = "{mention} you can't join the queue right now because {reason}. Please try again later"
+
+MSG_WAITLISTED = """{mention} {reason} so you have been added to the waitlist at position #{position}
+You will be added to the queue (and pinged here) when there is room. `!q leave` to leave the waitlist"""
+
+MSG_PROMOTED = "{mention} there is room in the queue now. You have been added at position #{position}"
+
+MSG_SHEDDING = "Students are being turned away or waitlisted because {reason}. More TAs may be needed"
@@ -0,0 +1,148 @@
+from clock import DEFAULT_CLOCK
+
+
+class Dispatcher:
+    """
+    Keeps track of office rooms for automatic dispatching (config.AUTO_DISPATCH):
+    which rooms have a free TA, which students are being moved and which rooms
+    are waiting for the student who was sent to them. QueueBot decides when a room
+    is free and moves the students (see QueueBot.dispatch_students())
+
+    A room that was sent a student isn't free again until that student's voice
+    state changes (they arrive or go somewhere else), so a TA never gets two
+    students because Discord hadn't told the bot about the first one yet
+
+    Metrics (see stats()):
+        latency: seconds from the event that let a student be dispatched (a TA
+                 becoming free or a student joining) until they were moved
+        idle: seconds an office room had only TAs in it before it got a student
+
+    Parameters:
+        clock: clock used for the metrics. Defaults to the system clock
+    """
+    def __init__(self, clock=None):
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._free_since = {}  # room id -> clock.monotonic() the room became free
+        self._assigned = {}  # room id -> uuid of the student sent to it
+        self._moving = set()  # uuids of students who are being moved
+        self._skipped = set()  # uuids of students who were passed over and are still waiting
+        self.dispatches = 0
+        self.failures = 0
+        self.skipped = 0  # Students passed over since they weren't in voice (once per stay in the queue)
+        self._latency_total = 0.0
+        self._max_latency = 0.0
+        self._idle_total = 0.0
+        self._idle_periods = 0
+
+    def update_room(self, room_id, free):
+        """
+        Record whether a room has only TAs in it (free) or not. A room that stops being
+        free ends its idle period
+
+        Returns: None
+        """
+        if free:
+            self._free_since.setdefault(room_id, self._clock.monotonic())
+        else:
+            self._end_idle(room_id)
+
+    def is_free(self, room_id):
+        """
+        Returns: True if the room has a free TA and isn't waiting for a student
+        """
+        return room_id in self._free_since and room_id not in self._assigned
+
+    def is_moving(self, uuid):
+        return uuid in self._moving
+
+    def assign(self, room_id, uuid):
+        """
+        Start sending a student to a room
+
+        Returns: seconds the room was idle
+        """
+        self._assigned[room_id] = uuid
+        self._moving.add(uuid)
+        return self._end_idle(room_id)
+
+    def skip(self, uuid):
+        """
+        Record that a student was passed over since they weren't in voice. A student is
+        only counted once until they are moved or leave the queue (see left())
+
+        Returns: None
+        """
+        if uuid not in self._skipped:
+            self._skipped.add(uuid)
+            self.skipped += 1
+
+    def left(self, uuid):
+        """
+        A student left the queue (or was taken out of it)
+
+        Returns: None
+        """
+        self._skipped.discard(uuid)
+
+    def moved(self, uuid, started):
+        """
+        Record that a student was moved
+
+        Parameters:
+            uuid: the student
+            started: clock.monotonic() of the event that triggered the dispatch
+
+        Returns: dispatch latency in seconds
+        """
+        self._moving.discard(uuid)
+        self._skipped.discard(uuid)
+        latency = max(0.0, self._clock.monotonic() - started)
+        self.dispatches += 1
+        self._latency_total += latency
+        self._max_latency = max(self._max_latency, latency)
+        return latency
+
+    def failed(self, room_id, uuid):
+        """
+        Record that a student couldn't be moved. The room is free again
+
+        Returns: None
+        """
+        self._moving.discard(uuid)
+        if self._assigned.get(room_id) == uuid:
+            del self._assigned[room_id]
+        self.failures += 1
+
+    def voice_update(self, uuid):
+        """
+        A member's voice state changed. Rooms waiting for them stop waiting
+
+        Returns: None
+        """
+        for room_id in [room_id for room_id, assigned in self._assigned.items() if assigned == uuid]:
+            del self._assigned[room_id]
+
+    def _end_idle(self, room_id):
+        since = self._free_since.pop(room_id, None)
+        if since is None:
+            return 0.0
+        idle = max(0.0, self._clock.monotonic() - since)
+        self._idle_total += idle
+        self._idle_periods += 1
+        return idle
+
+    def stats(self):
+        """
+        Returns: dictionary with the number of dispatches, failures and skipped students,
+                 the mean/max dispatch latency and the total/mean TA idle time (in seconds)
+        """
+        return {
+            "dispatches": self.dispatches,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "mean_latency": self._latency_total / self.dispatches if self.dispatches else 0.0,
+            "max_latency": self._max_latency,
+            "idle_total": self._idle_total,
+            "mean_idle": self._idle_total / self._idle_periods if self._idle_periods else 0.0,
+            "free_rooms": sum(1 for room_id in self._free_since if room_id not in self._assigned),
+        }
@@ -0,0 +1,149 @@
+import heapq
+
+
+class FairScheduler:
+    """
+    Picks which course the next student is helped from when several courses share
+    a queue (config.COURSES) so a big course can't starve a small one
+
+    Each course with students waiting is in a heap keyed by its virtual finish time
+    (weighted fair queuing). Helping a student from a course moves its finish time
+    forward by 1 / weight, so over time a course with weight 2 gets twice as many
+    students helped as a course with weight 1 (when both have students waiting).
+    A course that was empty starts at the current virtual time instead of catching
+    up on turns it didn't use
+
+    pick() only finds the course whose turn it is. The turn is used up by charge()
+    once a student from the course was actually taken, so a course doesn't lose
+    its turn when taking the student fails (ex: a dispatch that couldn't move them)
+
+    arrive(), pick() and charge() are O(log k) for k courses. Courses whose students
+    all left, and heap entries replaced by charge(), are dropped lazily when they
+    reach the top of the heap
+
+    Parameters:
+        weights: dictionary of course name -> weight (a positive number)
+    """
+    def __init__(self, weights):
+        self._weights = dict(weights)
+        self._time = 0.0  # Virtual time: the finish time of the last course picked
+        self._finish = {}  # course -> virtual finish time of its last turn
+        self._heap = []  # (virtual finish time, order, course) of courses with students waiting
+        self._entries = {}  # course -> its current heap entry (other entries of the course are stale)
+        self._order = 0  # Breaks ties between courses with the same finish time (first come first served)
+        self._waits = {course: [0, 0.0, 0.0] for course in self._weights}  # course -> [served, total wait, max wait]
+
+    def __contains__(self, course):
+        return course in self._entries
+
+    def arrive(self, course):
+        """
+        Record that a course has students waiting (safe to call for every student who joins)
+
+        Returns: None
+        """
+        if course in self._entries:
+            return
+        finish = max(self._time, self._finish.get(course, 0.0)) + 1 / self._weights.get(course, 1)
+        self._push(course, finish)
+
+    def _push(self, course, finish):
+        self._order += 1
+        entry = (finish, self._order, course)
+        self._entries[course] = entry
+        heapq.heappush(self._heap, entry)
+
+    def pick(self, backlogged, eligible=None):
+        """
+        Find the course whose turn it is without using up the turn (see charge()).
+        The course keeps its place in the heap until backlogged() says it has nobody left
+
+        Parameters:
+            backlogged: function that returns True if a course still has students waiting
+            eligible: optional function that returns False for courses that have students
+                      but none who can be picked right now (ex: nobody in voice). Those
+                      courses keep their turn
+
+        Returns: the course (None if no course can be picked)
+        """
+        passed = []
+        course = None
+        while self._heap:
+            entry = self._heap[0]
+            if self._entries.get(entry[2]) is not entry:
+                heapq.heappop(self._heap)  # Replaced by charge()
+                continue
+            if not backlogged(entry[2]):
+                heapq.heappop(self._heap)
+                del self._entries[entry[2]]
+                continue
+            if eligible is not None and not eligible(entry[2]):
+                passed.append(heapq.heappop(self._heap))
+                continue
+            course = entry[2]
+            break
+        for entry in passed:
+            heapq.heappush(self._heap, entry)
+        return course
+
+    def charge(self, course):
+        """
+        Use up a course's turn once one of its students was taken. Its next turn
+        is 1 / weight later in virtual time
+
+        Returns: None
+        """
+        entry = self._entries.get(course)
+        if entry is not None:
+            finish = entry[0]
+        else:
+            finish = max(self._time, self._finish.get(course, 0.0)) + 1 / self._weights.get(course, 1)
+        self._time = finish
+        self._finish[course] = finish
+        self._push(course, finish + 1 / self._weights.get(course, 1))
+
+    def copy(self):
+        """
+        Returns: a FairScheduler with the same turns, to plan several picks (charging the copy)
+                 before any of them are taken. Wait times aren't copied
+        """
+        other = FairScheduler(self._weights)
+        other._time = self._time
+        other._finish = dict(self._finish)
+        other._heap = list(self._heap)
+        other._entries = dict(self._entries)
+        other._order = self._order
+        return other
+
+    def record_wait(self, course, seconds):
+        """
+        Record how long a student from the course waited before being helped
+
+        Returns: None
+        """
+        waits = self._waits.setdefault(course, [0, 0.0, 0.0])
+        waits[0] += 1
+        waits[1] += seconds
+        waits[2] = max(waits[2], seconds)
+
+    def stats(self):
+        """
+        Returns: dictionary with, for each course, its weight, the number of students
+                 helped, their share of everyone helped and the mean/max wait (in seconds).
+                 "fairness" is Jain's index of the courses' mean waits (1.0 when every
+                 course waits equally long, down to 1/k when one course gets all the waiting)
+        """
+        served = sum(waits[0] for waits in self._waits.values())
+        courses = {}
+        for course, (count, total, longest) in self._waits.items():
+            courses[course] = {
+                "weight": self._weights.get(course, 1),
+                "served": count,
+                "share": count / served if served else 0.0,
+                "mean_wait": total / count if count else 0.0,
+                "max_wait": longest,
+            }
+        means = [course["mean_wait"] for course in courses.values() if course["served"]]
+        squares = sum(mean * mean for mean in means)
+        fairness = sum(means) ** 2 / (len(means) * squares) if squares else 1.0
+        return {"courses": courses, "fairness": fairness}
@@ -0,0 +1,112 @@
+"""
+Slash commands and buttons (Discord "interactions")
+
+The version of py-cord QueueBot uses doesn't know about interactions, so QueueBot
+reads INTERACTION_CREATE gateway events itself (see QueueBot.handle_interaction())
+and answers them through the REST routes below. This file only holds the
+payloads and parsing so it can be used without a connection to Discord
+"""
+
+# Interaction types (https://discord.com/developers/docs/interactions/receiving-and-responding)
+APPLICATION_COMMAND = 2
+MESSAGE_COMPONENT = 3
+
+# Interaction response types
+CHANNEL_MESSAGE = 4  # Reply right away
+DEFERRED_CHANNEL_MESSAGE = 5  # "QueueBot is thinking...". The reply is sent later by editing @original
+
+# Message flag that only shows a message to the person who used the command
+EPHEMERAL = 64
+
+# Application command option types
+STRING = 3
+INTEGER = 4
+BOOLEAN = 5
+
+# Registered as server commands (they show up right away, unlike global commands)
+SLASH_COMMANDS = [
+    {"name": "join", "description": "Join the office hours queue",
+     "options": [{"name": "in-person", "description": "Join as an in-person student", "type": BOOLEAN},
+                 {"name": "course", "description": "Course you need help with (if the queue is shared)", "type": STRING}]},
+    {"name": "leave", "description": "Leave the office hours queue"},
+    {"name": "position", "description": "See how many people are in front of you"},
+    {"name": "list", "description": "List the people in the queue",
+     "options": [{"name": "page", "description": "Page of the queue to show", "type": INTEGER, "min_value": 1}]},
+    {"name": "notify", "description": "Get a Direct Message when you reach a position in the queue",
+     "options": [{"name": "position", "description": "Position (default 3) or 'off' to cancel", "type": STRING}]},
+    {"name": "next", "description": "(TA) Get the next person in the queue and remove them from it"},
+]
+
+# Button custom IDs start with this so they can be told apart from other bots' buttons
+BUTTON_PREFIX = "queue:"
+
+# Buttons on the queue board ("!q board"). They keep working after the bot restarts
+# since buttons are only identified by their custom ID
+BOARD_COMPONENTS = [
+    {"type": 1, "components": [
+        {"type": 2, "style": 3, "label": "Join", "custom_id": BUTTON_PREFIX + "join"},
+        {"type": 2, "style": 4, "label": "Leave", "custom_id": BUTTON_PREFIX + "leave"},
+        {"type": 2, "style": 2, "label": "Position", "custom_id": BUTTON_PREFIX + "position"},
+    ]},
+]
+
+
+class Interaction:
+    """
+    The parts of an INTERACTION_CREATE event QueueBot uses
+
+    Parameters:
+        data: the event's "d" payload
+    """
+    __slots__ = ("id", "token", "application_id", "type", "guild_id", "channel_id",
+                 "user_id", "name", "discriminator", "nick", "role_ids", "command", "options")
+
+    def __init__(self, data):
+        self.id = data["id"]
+        self.token = data["token"]
+        self.application_id = data["application_id"]
+        self.type = data["type"]
+        self.guild_id = int(data["guild_id"]) if data.get("guild_id") else None
+        self.channel_id = int(data["channel_id"]) if data.get("channel_id") else None
+
+        # Interactions in servers have a member, ones in DMs only have a user
+        member = data.get("member") or {}
+        user = member.get("user") or data.get("user") or {}
+        self.user_id = int(user["id"]) if "id" in user else None
+        self.name = user.get("username")
+        self.discriminator = user.get("discriminator")
+        self.nick = member.get("nick")
+        self.role_ids = [int(role) for role in member.get("roles", ())]
+
+        command = data.get("data") or {}
+        self.command = None
+        self.options = {}
+        if self.type == APPLICATION_COMMAND:
+            self.command = command.get("name")
+            self.options = {option["name"]: option.get("value") for option in command.get("options", ())}
+        elif self.type == MESSAGE_COMPONENT:
+            custom_id = command.get("custom_id", "")
+            if custom_id.startswith(BUTTON_PREFIX):
+                self.command = custom_id[len(BUTTON_PREFIX):]
+
+    def __repr__(self):
+        return f"Interaction(command={self.command}, options={self.options}, user_id={self.user_id})"
+
+
+def response_data(replies):
+    """
+    Turn the messages a command sent (see QueueBot._send()) into an ephemeral response
+
+    Parameters:
+        replies: list of (content, embed) pairs
+
+    Returns: the "data" of an interaction response (or the body of an @original edit)
+    """
+    content = "\n".join(content for content, _ in replies if content)
+    embeds = [embed.to_dict() for _, embed in replies if embed is not None]
+    return {
+        "content": content or (None if embeds else "Done"),
+        "embeds": embeds,
+        "flags": EPHEMERAL,
+        "allowed_mentions": {"parse": []},  # Mentions in replies don't ping anyone
+    }
@@ -0,0 +1,71 @@
+from collections import Counter
+
+
+class PositionNotifier:
+    """
+    Keeps track of students who asked to be told when they reach a position in the
+    queue ("!q notify 3"). Each subscription is used once
+
+    When someone at position p leaves the queue everyone behind them moves up by one,
+    so the only student who can reach position n is the one who is now at n (and only
+    if p <= n). crossed() looks them up with StudentQueue.user_at() for each position
+    students are waiting for, so it never walks the queue
+
+    Parameters:
+        max_position: largest position a student can ask for
+    """
+    def __init__(self, max_position):
+        self.max_position = max_position
+        self._positions = {}  # uuid -> position they want to be told about
+        self._counts = Counter()  # position -> number of students waiting for it
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, uuid):
+        return uuid in self._positions
+
+    def subscribe(self, uuid, position):
+        """
+        Tell the student when they reach position (replaces their old subscription)
+
+        Raises: ValueError if position is not between 1 and max_position
+        """
+        if not 1 <= position <= self.max_position:
+            raise ValueError(f"position must be between 1 and {self.max_position}")
+        self.unsubscribe(uuid)
+        self._positions[uuid] = position
+        self._counts[position] += 1
+
+    def unsubscribe(self, uuid):
+        """
+        Returns: True if the student had a subscription
+        """
+        position = self._positions.pop(uuid, None)
+        if position is None:
+            return False
+        self._counts[position] -= 1
+        if self._counts[position] == 0:
+            del self._counts[position]
+        return True
+
+    def crossed(self, queue, removed_position):
+        """
+        Find the students who reached their position after someone left the queue
+        Their subscriptions are used up
+
+        Parameters:
+            queue: the StudentQueue (after the removal)
+            removed_position: position the student who left was at
+
+        Returns: list of DiscordUsers to notify
+        """
+        users = []
+        for position in list(self._counts):
+            if removed_position <= position <= len(queue):
+                user = queue.user_at(position)
+                if self._positions.get(user.get_uuid()) == position:
+                    users.append(user)
+        for user in users:
+            self.unsubscribe(user.get_uuid())
+        return users
@@ -0,0 +1,132 @@
+from clock import DEFAULT_CLOCK
+
+# Weight of the newest message in the average send latency
+LATENCY_EWMA_ALPHA = 0.3
+
+
+class OverloadDetector:
+    """
+    Decides when the bot is getting commands faster than it can answer them (overloaded)
+    from the number of commands running at once (the backlog: commands waiting on
+    Discord's rate limits stay running) and the average (EWMA) time it takes to send
+    a message. Sends are timed instead of whole commands since some commands wait
+    for people (ex: "!q clear" waits for a TA to confirm)
+
+    The bot becomes overloaded as soon as either signal reaches its enter threshold
+    and only recovers once both have been at or below their (lower) exit thresholds
+    for recover_seconds, so it doesn't flip back and forth at the edge of a burst.
+    The average latency is forgotten after recover_seconds without commands or messages
+
+    Parameters:
+        enter_backlog: commands running at once that make the bot overloaded
+        exit_backlog: commands running at once the bot has to be at or below to recover
+        enter_latency: average send latency (seconds) that makes the bot overloaded
+        exit_latency: average send latency (seconds) the bot has to be at or below to recover
+        recover_seconds: how long both signals have to stay low to recover
+        clock: clock used for recovering. Defaults to the system clock
+    """
+    def __init__(self, enter_backlog, exit_backlog, enter_latency, exit_latency, recover_seconds, clock=None):
+        assert exit_backlog < enter_backlog and exit_latency < enter_latency
+        self._enter_backlog = enter_backlog
+        self._exit_backlog = exit_backlog
+        self._enter_latency = enter_latency
+        self._exit_latency = exit_latency
+        self._recover_seconds = recover_seconds
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self.degraded = False
+        self._latency = None  # EWMA of send latency in seconds (None if unknown)
+        self._last_seen = None  # clock.monotonic() of the last observation
+        self._calm_since = None  # clock.monotonic() both signals went low while degraded
+        self._degraded_since = None
+        self.episodes = 0
+        self.degraded_seconds = 0.0
+        self.degraded_commands = 0  # Commands started while degraded
+        self.max_backlog = 0
+
+    def started(self, backlog):
+        """
+        Record that a command started
+
+        Parameters:
+            backlog: number of commands running (including this one)
+
+        Returns: True if the bot became overloaded, False if it recovered, None if nothing changed
+        """
+        now = self._clock.monotonic()
+        if self._last_seen is not None and now - self._last_seen >= self._recover_seconds:
+            self._latency = None  # Stale. The messages it measured are long gone
+            if self.degraded and self._calm_since is None:
+                self._calm_since = self._last_seen  # Nothing happened since, so that counts as calm
+        change = self._update(backlog, now)
+        if self.degraded:
+            self.degraded_commands += 1
+        return change
+
+    def finished(self, backlog):
+        """
+        Record that a command finished
+
+        Parameters:
+            backlog: number of commands still running
+
+        Returns: True if the bot became overloaded, False if it recovered, None if nothing changed
+        """
+        return self._update(backlog, self._clock.monotonic())
+
+    def sent(self, latency, backlog):
+        """
+        Record how long sending a message took
+
+        Parameters:
+            latency: seconds the send took
+            backlog: number of commands running
+
+        Returns: True if the bot became overloaded, False if it recovered, None if nothing changed
+        """
+        if self._latency is None:
+            self._latency = latency
+        else:
+            self._latency += LATENCY_EWMA_ALPHA * (latency - self._latency)
+        return self._update(backlog, self._clock.monotonic())
+
+    def _update(self, backlog, now):
+        self._last_seen = now
+        self.max_backlog = max(self.max_backlog, backlog)
+        latency = self._latency if self._latency is not None else 0.0
+        if not self.degraded:
+            if backlog >= self._enter_backlog or latency >= self._enter_latency:
+                self.degraded = True
+                self.episodes += 1
+                self._degraded_since = now
+                self._calm_since = None
+                return True
+            return None
+
+        if backlog > self._exit_backlog or latency > self._exit_latency:
+            self._calm_since = None
+            return None
+        if self._calm_since is None:
+            self._calm_since = now
+        if now - self._calm_since < self._recover_seconds:
+            return None
+        self.degraded = False
+        self.degraded_seconds += now - self._degraded_since
+        self._degraded_since = None
+        return False
+
+    def stats(self):
+        """
+        Returns: dictionary with the number of overload episodes, seconds spent overloaded
+                 (including the current episode), commands started while overloaded, the
+                 largest backlog seen and the current average latency (None if unknown)
+        """
+        degraded_seconds = self.degraded_seconds
+        if self._degraded_since is not None:
+            degraded_seconds += self._clock.monotonic() - self._degraded_since
+        return {
+            "episodes": self.episodes,
+            "degraded_seconds": degraded_seconds,
+            "degraded_commands": self.degraded_commands,
+            "max_backlog": self.max_backlog,
+            "latency": self._latency,
+        }
@@ -0,0 +1,453 @@
+"""
+The queue engine: the queues, the session log and queue stats without Discord
+
+QueueBot normally keeps the queues in its own process. With config.QUEUE_ENGINE
+the queues live in this separate local service instead and QueueBot only talks to
+Discord (checking voice channels, sending replies) and forwards queue commands
+to it, so slow work here (ex: writing the session log) never holds up the
+gateway's heartbeats. Nothing here imports py-cord, so the engine can be tested
+and benchmarked on its own (see benchmarks/engine.py)
+
+Protocol: one JSON object per line over a Unix socket. Requests are
+{"id": n, "op": "join", "args": {...}} and every request gets one response
+{"id": n, "result": {...}} or {"id": n, "error": "..."}. Requests on the same
+connection are applied in the order they are sent but responses can come back
+in any order (match them by id)
+
+Usage (from the repo root):
+    python src/queue_engine.py --socket queue_engine.sock
+"""
+
+import os
+import sys
+import json
+import signal
+import asyncio
+import logging
+import argparse
+from functools import partial
+
+from clock import DEFAULT_CLOCK
+from snapshot import discard_snapshot, load_snapshot, save_snapshot
+from student_queue import StudentQueue
+from utils import DiscordUser, log_sessions
+
+DEFAULT_SOCKET = "queue_engine.sock"
+DEFAULT_SNAPSHOT = "queue_engine_snapshot.json"
+
+# "!q next <mode>" modes the engine can pick from (voice channels are only known to QueueBot)
+ENGINE_NEXT_MODES = {"online", "inperson"}
+
+# Longest request line the server reads (a "!q list" page is far smaller)
+MAX_LINE_BYTES = 1 << 20
+
+
+class EngineError(Exception):
+    """
+    A request to the queue engine failed (the engine's error message is the exception's message)
+    """
+
+
+class QueueEngine:
+    """
+    The queues of every server plus their session logs and stats. Every operation is an
+    async method that takes and returns JSON friendly values (users are DiscordUser.to_dict()
+    dictionaries) so it can be called directly or through EngineClient the same way (see call())
+    Queues are changed before the first await, so operations apply in the order they are called
+
+    Parameters:
+        clock: clock used for join/wait times. Defaults to the system clock
+        snapshot: JSON friendly dictionary from snapshot() to restore the queues from
+    """
+    # Operations call() accepts
+    OPERATIONS = frozenset({"join", "leave", "position", "next", "remove", "front", "list", "clear", "logs", "stats", "snapshot"})
+
+    def __init__(self, clock=None, snapshot=None):
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._queues = {}  # guild id -> StudentQueue
+        self._stats = {}  # guild id -> counters (see stats())
+        if snapshot is not None:
+            for guild_id, users in snapshot.get("queues", {}).items():
+                self._queues[int(guild_id)] = StudentQueue(DiscordUser.from_dict(data, self._clock) for data in users)
+
+    async def call(self, op, **args):
+        """
+        Run an operation by name (what the server does for each request)
+
+        Returns: the operation's result
+        Raises: EngineError if the operation doesn't exist or its arguments are wrong
+        """
+        if op not in self.OPERATIONS:
+            raise EngineError(f"Unknown operation '{op}'")
+        try:
+            return await getattr(self, op)(**args)
+        except (TypeError, KeyError, ValueError) as e:
+            raise EngineError(f"Bad request for '{op}': {e}")
+
+    def _queue(self, guild):
+        if guild not in self._queues:
+            self._queues[guild] = StudentQueue()
+        return self._queues[guild]
+
+    def _guild_stats(self, guild):
+        if guild not in self._stats:
+            self._stats[guild] = {"joined": 0, "helped": 0, "left": 0, "removed": 0, "cleared": 0,
+                                  "wait_total": 0.0, "max_wait": 0.0}
+        return self._stats[guild]
+
+    def _count(self, guild, name, amount=1):
+        stats = self._guild_stats(guild)
+        stats[name] += amount
+        return stats
+
+    async def join(self, guild, user, inperson=False, switch=True):
+        """
+        Add a user to the end of the queue
+
+        Parameters:
+            guild: server ID
+            user: user dictionary (DiscordUser.to_dict())
+            inperson: True if they're waiting in person
+            switch: if they're already in the queue, switch them to the given mode
+
+        Returns: {"status": "added", "changed" (switched mode) or "already", "position": their position,
+                  "length": number of people in the queue}
+        """
+        queue = self._queue(guild)
+        q_user = queue.get(user["uuid"])
+        if q_user is not None:
+            status = "already"
+            if switch and q_user.is_inperson() != inperson:
+                q_user.set_inperson(inperson)
+                queue.touch(q_user.get_uuid())
+                status = "changed"
+            return {"status": status, "position": queue.position(q_user), "length": len(queue)}
+
+        q_user = DiscordUser.from_dict(user, self._clock)
+        q_user.set_inperson(inperson)
+        queue.append(q_user)
+        self._count(guild, "joined")
+        return {"status": "added", "position": len(queue), "length": len(queue)}
+
+    async def leave(self, guild, server, uuid):
+        """
+        Remove a user who left on their own (logged as "leave")
+
+        Returns: {"removed": True if they were in the queue}
+        """
+        queue = self._queue(guild)
+        q_user = queue.get(uuid)
+        if q_user is None:
+            return {"removed": False}
+        queue.remove(q_user)
+        self._count(guild, "left")
+        await log_sessions([(q_user.get_name(), q_user.get_join_time(), None, "leave")], server, self._clock)
+        return {"removed": True}
+
+    async def position(self, guild, uuid):
+        """
+        Returns: {"position": the user's position (None if they're not in the queue)}
+        """
+        return {"position": self._queue(guild).position(uuid)}
+
+    async def next(self, guild, server, ta, mode=None):
+        """
+        Remove the next user (the first one who is online/in person with a mode) for a TA
+        (logged as "next")
+
+        Parameters:
+            ta: display name of the TA
+            mode: None or one of ENGINE_NEXT_MODES
+
+        Returns: {"user": the user's dictionary (None if nobody matched), "length": people left in the queue}
+        """
+        if mode is not None and mode not in ENGINE_NEXT_MODES:
+            raise ValueError(f"mode must be one of {sorted(ENGINE_NEXT_MODES)}")
+        queue = self._queue(guild)
+        q_next = queue.first(mode) if mode is not None else (queue[0] if queue else None)
+        if q_next is None:
+            return {"user": None, "length": len(queue)}
+        if queue.position(q_next) == 1:
+            queue.popleft()
+        else:
+            queue.remove(q_next)
+
+        wait = q_next.get_wait_time()
+        stats = self._count(guild, "helped")
+        stats["wait_total"] += wait
+        stats["max_wait"] = max(stats["max_wait"], wait)
+        await log_sessions([(q_next.get_name(), q_next.get_join_time(), ta, "next")], server, self._clock)
+        return {"user": q_next.to_dict(), "length": len(queue)}
+
+    async def remove(self, guild, server, ta, uuid):
+        """
+        Remove a user for a TA (logged as "remove")
+
+        Returns: {"user": the user's dictionary (None if they weren't in the queue)}
+        """
+        queue = self._queue(guild)
+        q_user = queue.get(uuid)
+        if q_user is None:
+            return {"user": None}
+        queue.remove(q_user)
+        self._count(guild, "removed")
+        await log_sessions([(q_user.get_name(), q_user.get_join_time(), ta, "remove")], server, self._clock)
+        return {"user": q_user.to_dict()}
+
+    async def front(self, guild, user):
+        """
+        Add a user to the front of the queue (or move them there). They keep their join time
+
+        Returns: {"length": number of people in the queue}
+        """
+        queue = self._queue(guild)
+        q_user = queue.get(user["uuid"])
+        if q_user is not None:
+            queue.remove(q_user)
+        else:
+            q_user = DiscordUser.from_dict(user, self._clock)
+            self._count(guild, "joined")
+        queue.appendleft(q_user)
+        return {"length": len(queue)}
+
+    async def list(self, guild, start=0, stop=10):
+        """
+        Returns: {"users": dictionaries of the users from index start to stop (0 is the front),
+                  "length": number of people in the queue, "version": changes when the queue does}
+        """
+        queue = self._queue(guild)
+        return {"users": [user.to_dict() for user in queue.slice(start, stop)], "length": len(queue),
+                "version": queue.version}
+
+    async def clear(self, guild, server, ta):
+        """
+        Empty the queue (logged as "clear" with a single session log write)
+
+        Returns: {"cleared": number of users removed}
+        """
+        queue = self._queue(guild)
+        records = [(q_user.get_name(), q_user.get_join_time(), ta, "clear") for q_user in queue]
+        queue.clear()
+        self._count(guild, "cleared", len(records))
+        await log_sessions(records, server, self._clock)
+        return {"cleared": len(records)}
+
+    async def logs(self, server):
+        """
+        Returns: {"path": absolute path of the server's session log (None if nothing was logged yet)}
+        """
+        path = os.path.abspath(f"logs/OH_logs_{server}.csv")
+        return {"path": path if os.path.exists(path) else None}
+
+    async def stats(self):
+        """
+        Returns: {server ID (as a string): {"length", "joined", "helped", "left", "removed", "cleared",
+                  "mean_wait", "max_wait"}} (waits of the people helped, in seconds)
+        """
+        result = {}
+        for guild in set(self._queues) | set(self._stats):
+            stats = dict(self._guild_stats(guild))
+            total = stats.pop("wait_total")
+            stats["mean_wait"] = total / stats["helped"] if stats["helped"] else 0.0
+            stats["length"] = len(self._queue(guild))
+            result[str(guild)] = stats
+        return result
+
+    async def snapshot(self):
+        """
+        Returns: JSON friendly dictionary with the queues (see snapshot.py)
+        """
+        return {
+            "saved_at": self._clock.now().timestamp(),
+            "queues": {str(guild): [user.to_dict() for user in queue] for guild, queue in self._queues.items()},
+        }
+
+
+async def _handle_connection(engine, reader, writer):
+    tasks = set()
+
+    async def respond(request):
+        response = {"id": request.get("id")}
+        try:
+            response["result"] = await engine.call(request.get("op"), **request.get("args", {}))
+        except EngineError as e:
+            response["error"] = str(e)
+        except Exception as e:
+            logging.getLogger("queuebot.engine").exception(f"Request {request} failed")
+            response["error"] = f"{type(e).__name__}: {e}"
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("requests must be JSON objects")
+            except ValueError as e:
+                writer.write(json.dumps({"id": None, "error": f"Bad request: {e}"}).encode() + b"\n")
+                continue
+            # Started right away so the queue changes happen in order. Only log writes run concurrently
+            task = asyncio.ensure_future(respond(request))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+    except (ConnectionError, ValueError):
+        pass  # The client went away (or sent a line longer than MAX_LINE_BYTES)
+    except asyncio.CancelledError:
+        pass  # The engine is stopping with the client still connected
+    finally:
+        if tasks:
+            await asyncio.wait(tasks)
+        writer.close()
+
+
+async def start_server(engine, path):
+    """
+    Serve an engine on a Unix socket (an old socket file at path is replaced)
+
+    Returns: the asyncio Server (close() it to stop)
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    return await asyncio.start_unix_server(partial(_handle_connection, engine), path=path, limit=MAX_LINE_BYTES)
+
+
+class EngineClient:
+    """
+    Talks to a queue engine over its Unix socket. call() works like QueueEngine.call(),
+    so QueueBot uses either one the same way. Requests are pipelined: many calls can
+    wait for their responses at the same time. Connects on the first call and again
+    after the connection is lost
+
+    Parameters:
+        path: the engine's socket
+    """
+    def __init__(self, path):
+        self._path = path
+        self._reader = None
+        self._writer = None
+        self._pending = {}  # request id -> future for its response
+        self._next_id = 0
+        self._connecting = None  # Task connecting to the engine (None when not connecting)
+        self._read_task = None
+
+    async def _connect(self):
+        if self._writer is not None:
+            return
+        if self._connecting is None:
+            self._connecting = asyncio.ensure_future(asyncio.open_unix_connection(self._path, limit=MAX_LINE_BYTES))
+        try:
+            reader, writer = await asyncio.shield(self._connecting)
+        except OSError as e:
+            raise EngineError(f"Unable to connect to the queue engine at {self._path}: {e}")
+        finally:
+            self._connecting = None
+        if self._writer is None:
+            self._reader, self._writer = reader, writer
+            self._read_task = asyncio.ensure_future(self._read_responses(reader))
+
+    async def _read_responses(self, reader):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                future = self._pending.pop(response.get("id"), None)
+                if future is None or future.done():
+                    continue
+                if "error" in response:
+                    future.set_exception(EngineError(response["error"]))
+                else:
+                    future.set_result(response.get("result"))
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            self._disconnected()
+
+    def _disconnected(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+        pending, self._pending = self._pending, {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(EngineError("Lost the connection to the queue engine"))
+
+    async def call(self, op, **args):
+        """
+        Run an operation on the engine
+
+        Returns: the operation's result
+        Raises: EngineError if the engine can't be reached or the operation failed
+        """
+        await self._connect()
+        self._next_id += 1
+        request_id = self._next_id
+        future = asyncio.get_event_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(json.dumps({"id": request_id, "op": op, "args": args}).encode() + b"\n")
+            await self._writer.drain()
+        except ConnectionError as e:
+            self._pending.pop(request_id, None)
+            self._disconnected()
+            raise EngineError(f"Lost the connection to the queue engine: {e}")
+        return await future
+
+    async def close(self):
+        if self._read_task is not None:
+            self._read_task.cancel()
+            self._read_task = None
+        self._disconnected()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run QueueBot's queue engine as a separate process")
+    parser.add_argument("--socket", default=DEFAULT_SOCKET, help="Unix socket to listen on (default: %(default)s)")
+    parser.add_argument("--snapshot", default=DEFAULT_SNAPSHOT,
+                        help="file the queues are saved to when stopping and restored from when starting (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='[%(asctime)s] [%(levelname)-8s] %(message)s', datefmt="%Y-%m-%d %H:%M:%S")
+    logger = logging.getLogger("queuebot.engine")
+    if not os.path.exists("logs"):
+        os.mkdir("logs")
+
+    snapshot = load_snapshot(args.snapshot)
+    engine = QueueEngine(snapshot=snapshot)
+    if snapshot is not None:
+        discard_snapshot(args.snapshot)
+
+    async def serve():
+        stop = asyncio.Event()
+        loop = asyncio.get_event_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop.set)
+            except (NotImplementedError, RuntimeError):
+                pass  # Not supported on Windows. Ctrl+C raises KeyboardInterrupt instead
+        server = await start_server(engine, args.socket)
+        logger.info(f"Queue engine listening on {args.socket}")
+        try:
+            await stop.wait()
+        finally:
+            server.close()
+            await server.wait_closed()
+            save_snapshot(await engine.snapshot(), args.snapshot)
+            logger.info(f"Saved queue snapshot to {args.snapshot}. Stats: {await engine.stats()}")
+            if os.path.exists(args.socket):
+                os.remove(args.socket)
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
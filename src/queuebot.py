@@ -19,22 +19,143 @@ NOTICES:
 """
 
 import os
+import re
 import sys
+import signal
 import logging
 import logging.handlers
 import asyncio
+import inspect
+import contextvars
+from collections import OrderedDict
+from functools import partial
 import discord  # This is defined by py-cord (referenced as discord.py in codebase)
-from datetime import datetime
 import constants
 
-from collections import deque
+from discord.ext import tasks
+from discord.http import Route
+
+from clock import DEFAULT_CLOCK
+from config import ConfigError, QueueConfig, ResolvedConfig, find_channels, get_config_json, get_config_path, read_config_json
+from admission import AdmissionControl
+from dispatcher import Dispatcher
+from fair_scheduler import FairScheduler
+from interactions import (APPLICATION_COMMAND, BOARD_COMPONENTS, CHANNEL_MESSAGE, DEFERRED_CHANNEL_MESSAGE, EPHEMERAL,
+                          MESSAGE_COMPONENT, SLASH_COMMANDS, Interaction, response_data)
+from notifications import PositionNotifier
+from overload import OverloadDetector
+from queue_engine import ENGINE_NEXT_MODES, EngineClient, EngineError
+from reconciler import WaitingRoomReconciler
+from render_cache import RenderCache
+from snapshot import discard_snapshot, get_snapshot_path, load_snapshot, save_snapshot
+from student_queue import StudentQueue
+from throttle import Throttle
+from timer_wheel import TimerWheel
+from ttl_cache import TTLCache
+from utils import CmdPrefix, DiscordUser, log_session, log_sessions
+
+# Every command starts with one of these (str.startswith() takes a tuple)
+COMMAND_PREFIXES = ("!q", "!Q")
+
+# Config keys that can only be changed by restarting the bot (the token is used to log in)
+RESTART_KEYS = {"SECRET_TOKEN", "QUEUE_ENGINE"}
+
+# How often (in seconds) the config file is checked for changes
+CONFIG_POLL_SECONDS = 5
+
+# How long (in seconds) shutting down waits for running commands to finish sending their replies
+SHUTDOWN_DRAIN_SECONDS = 10
+
+# discord.Client options used when restarting from a snapshot. Skipping member chunking lets
+# the bot answer commands as soon as the server's data arrives (members in voice channels
+# are still sent with it, which is all the voice checks need)
+WARM_START_OPTIONS = {"chunk_guilds_at_startup": False, "guild_ready_timeout": 0.5}
+
+# How often (in seconds) the waiting room is compared against the queue (see reconcile_waiting_room())
+RECONCILE_SECONDS = 30
+# How long (in seconds) a student can sit in the waiting room without joining the queue before they're reminded
+REMINDER_GRACE_SECONDS = 60
+# How long (in seconds) an online student can be in the queue but not in the waiting room before TAs are told
+ABSENT_GRACE_SECONDS = 120
+# Most reminder DMs sent per check (the rest are sent by later checks)
+REMINDERS_PER_CHECK = 10
+
+# How often (in seconds) timers scheduled with QueueBot.schedule() are checked (they run up to this late)
+TIMER_TICK_SECONDS = 1
+# How long (in seconds) an online student can be out of the waiting room before they're removed from the queue
+VOICE_GRACE_SECONDS = 300
+# How long (in seconds) TAs have to confirm "!q clear"
+CLEAR_CONFIRM_SECONDS = 60
+
+# "!q notify" tells students when they reach this position unless they pick one (up to NOTIFY_MAX_POSITION)
+NOTIFY_DEFAULT_POSITION = 3
+NOTIFY_MAX_POSITION = 10
+# "You're almost up" DMs are collected for this long (in seconds) and then sent together
+# (at most NOTIFY_BATCH_SIZE at a time) so a fast moving queue doesn't send a burst of DMs
+NOTIFY_BATCH_SECONDS = 2
+NOTIFY_BATCH_SIZE = 10
+
+# Most students listed in each "Queue state" log line (the rest are counted)
+QUEUE_STATE_LOG_LIMIT = 25
+
+# Number of students on each page of "!q list"
+LIST_PAGE_SIZE = 10
+# Reactions used to flip through the pages of a "!q list" message
+LIST_PREVIOUS = "◀️"
+LIST_NEXT = "▶️"
+# Number of (most recent) "!q list" messages that can still be flipped through
+LIST_MESSAGES_TRACKED = 20
+# Most "!q list" pages and help messages kept by the render cache
+RENDER_CACHE_ENTRIES = 256
+
+# Users and Direct Message channels are remembered for this many seconds (at most DM_CACHE_ENTRIES of each)
+DM_CACHE_SECONDS = 3600
+DM_CACHE_ENTRIES = 1000
+# Most Direct Messages _send_dms() sends at the same time
+DM_CONCURRENCY = 5
+
+# Students can send COMMAND_BURST commands in a row and then one every COMMAND_INTERVAL_SECONDS
+# (TAs are not limited). Commands over the limit get THROTTLED_REACTION instead of a reply
+COMMAND_BURST = 5
+COMMAND_INTERVAL_SECONDS = 2
+THROTTLED_REACTION = "⏳"
+
+# The bot is overloaded when OVERLOAD_ENTER_BACKLOG commands are running at once or sending a message
+# takes OVERLOAD_ENTER_LATENCY seconds on average. It recovers once both have been at or below the EXIT
+# values for OVERLOAD_RECOVER_SECONDS (see overload.py). While overloaded, replies are cheaper
+# (see _send(), _q_list(), _alert_avail_tas() and _reconcile_waiting_rooms())
+OVERLOAD_ENTER_BACKLOG = 20
+OVERLOAD_EXIT_BACKLOG = 5
+OVERLOAD_ENTER_LATENCY = 3.0
+OVERLOAD_EXIT_LATENCY = 1.0
+OVERLOAD_RECOVER_SECONDS = 15
+# How long (in seconds) "the queue is no longer empty" alerts are put off while overloaded
+OVERLOAD_ALERT_DELAY = 30
+# Reactions that replace replies with these prefixes while overloaded (other replies are still sent)
+OVERLOAD_REACTIONS = {CmdPrefix.SUCCESS: "✅", CmdPrefix.WARNING: "⚠️"}
+
+# "!q next <mode>" picks the first student with the mode's tag (see QueueBot._queue_tags())
+NEXT_MODES = {"voice": "voice", "online": "online", "inperson": "inperson", "in-person": "inperson"}
+# How the students each tag picks are described when there aren't any
+NEXT_MODE_NAMES = {"voice": "online and in voice", "online": "online", "inperson": "in person"}
+
+# Reply to commands that need the queue in the bot's process when config.QUEUE_ENGINE is used
+MSG_ENGINE_UNSUPPORTED = "this command isn't available while the queue runs in a separate queue engine"
+
+# Slash commands and buttons that take longer than this (in seconds) are deferred so
+# Discord gets an answer within its 3 second limit (the reply is filled in when the command finishes)
+INTERACTION_DEFER_SECONDS = 1.5
+
+# Messages _send() is collecting for an interaction's reply instead of sending (see handle_interaction())
+_interaction_replies = contextvars.ContextVar("interaction_replies", default=None)
+# The "!q" message the running command is answering (see REPLY_MODE in README.md and _queue_reply())
+_reply_to = contextvars.ContextVar("reply_to", default=None)
+
+# Discord's limit on the length of a message (replies batched together are split to fit)
+MAX_MESSAGE_LENGTH = 2000
+MENTION_PATTERN = re.compile(r"<@!?(\d+)>")
 
-from config import QueueConfig, get_config_json
-from utils import CmdPrefix, DiscordUser, log_session
 
-
-# TODO Notify user if they're in voice channel and not in queue? https://discordpy.readthedocs.io/en/latest/ext/tasks/index.html
-# TODO Save Queue State in the case of a restart?
 # TODO Make all commands private
 # QueueBot extends the discord.Client class
 
@@ -45,9 +166,15 @@ class QueueBot(discord.Client):
     Parameters:
         config: A QueueConfig object specifying config options
         logger: A logger object created from Python's logging module
+        testing: Print messages instead of sending them (used for unit tests)
+        clock: Clock used for join and wait times (see clock.py). Defaults to the system clock
+        config_path: Config file to watch for changes (see reload_config()). None disables watching
+        snapshot_path: File the queues are saved to when the bot shuts down and restored
+                       from when it starts (see snapshot.py). None disables snapshots
+        options: Extra keyword arguments passed on to discord.Client (see WARM_START_OPTIONS)
     """
 
-    def __init__(self, config, logger, testing=False):
+    def __init__(self, config, logger, testing=False, clock=None, config_path=None, snapshot_path=None, **options):
         assert isinstance(config, QueueConfig)
 
         # Tell Discord library what events we want and don't want
@@ -61,20 +188,56 @@ class QueueBot(discord.Client):
         intents.messages = True
 
         # Cache voice channels only if queuebot checks voice channel state
-        intents.members = True if config.CHECK_VOICE_WAITING or config.ALERT_ON_FIRST_JOIN else False
-        super().__init__(intents=intents)  # Calls __init__() on super class (discord.Client)
+        intents.members = _needs_members(config)
+        super().__init__(intents=intents, **options)  # Calls __init__() on super class (discord.Client)
 
         self._testing = testing
         self._is_initialized = False
         self._config = config
         self._logger = logger
-        self._join_times = {}
-        self._queues = {}  # guild -> doubly linked list
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._join_times = {}  # uuid -> clock.monotonic() timestamp
+        self._queues = {}  # guild id -> StudentQueue
+        self._reconcilers = {}  # guild id -> WaitingRoomReconciler (see reconcile_waiting_room())
+        self._timers = TimerWheel(TIMER_TICK_SECONDS, clock=self._clock)  # See schedule()
+        self._notifiers = {}  # guild id -> PositionNotifier (see _q_notify())
+        self._pending_notifications = {}  # uuid -> guild. Sent by _send_notifications()
+        self._render_cache = RenderCache(RENDER_CACHE_ENTRIES)  # "!q list" pages and "!q help" text
+        self._users = TTLCache(DM_CACHE_ENTRIES, DM_CACHE_SECONDS, self._clock)  # uuid -> discord.py user (see _resolve_user())
+        self._dm_channels = TTLCache(DM_CACHE_ENTRIES, DM_CACHE_SECONDS, self._clock)  # uuid -> discord.py DMChannel
+        self._list_messages = OrderedDict()  # message id -> (guild id, page) of recent "!q list" messages
+        self._in_flight = set()  # Tasks running a command (see close())
+        self._throttle = Throttle(COMMAND_BURST, COMMAND_INTERVAL_SECONDS, self._clock)
+        self._running_commands = {}  # (author id, channel id, command) -> task running it (see run_command())
+        self._pending_replies = {}  # channel id -> replies waiting to be sent (see _queue_reply())
+        self._reply_senders = {}  # channel id -> task sending the channel's pending replies
+        self._dispatcher = Dispatcher(self._clock)  # Free office rooms and dispatch metrics (see dispatch_students())
+        self._schedulers = {}  # guild id -> FairScheduler picking between config.COURSES (see _pick_student())
+        self._admissions = {}  # guild id -> AdmissionControl (see _admit())
+        self._overload = OverloadDetector(OVERLOAD_ENTER_BACKLOG, OVERLOAD_EXIT_BACKLOG, OVERLOAD_ENTER_LATENCY,
+                                          OVERLOAD_EXIT_LATENCY, OVERLOAD_RECOVER_SECONDS, self._clock)  # See run_command()
+        # With config.QUEUE_ENGINE the queues are kept by a separate process (see queue_engine.py and _engine_join())
+        self._engine = EngineClient(config.QUEUE_ENGINE) if config.QUEUE_ENGINE else None
+        # py-cord doesn't handle slash commands or buttons. Read the raw gateway event instead
+        self._connection.parsers["INTERACTION_CREATE"] = self._parse_interaction_create
+        self._shutdown_task = None
+
+        # Config with roles and channels resolved to IDs (None until logged in and in testing mode)
+        self._resolved = None
+
+        self._config_path = config_path
+        self._config_mtime = _get_mtime(config_path)
+
+        self._snapshot_path = snapshot_path
+        self._snapshot = load_snapshot(snapshot_path, self._clock) if snapshot_path is not None else None
+        if self._snapshot is not None:
+            self._restore_snapshot(self._snapshot)
+            discard_snapshot(snapshot_path)
 
     async def on_ready(self):
         """
         Discord.py calls this on initialization (does not run in testing mode)
-        It does some setup and saves the waiting room voice channel to self.waiting_room
+        It does some setup and resolves the config's roles and channels to IDs (see ResolvedConfig)
 
         Returns: None
         """
@@ -93,38 +256,247 @@ class QueueBot(discord.Client):
             self._is_initialized = True
             return
 
-        if self._config.CHECK_VOICE_WAITING:
-            self._waiting_room = self._get_channel_from_name(self._config.VOICE_WAITING, guild.voice_channels).pop()
+        try:
+            self._resolved = ResolvedConfig(self._config, guild)
+        except ConfigError as e:
+            self._logger.error(e)
+            sys.exit(1)  # FIXME Exit traceback is very messy
+        self._warn_missing(self._resolved)
+        self._start_voice_index()
+        self._is_initialized = True
 
+        if self._config_path is not None and not self._watch_config.is_running():
+            self._watch_config.start()
+        if not self._reconcile_waiting_rooms.is_running():
+            self._reconcile_waiting_rooms.start()
+        if not self._tick_timers.is_running():
+            self._tick_timers.start()
+
+        await self._register_commands(guild)
         await self.change_presence(activity=discord.Game(name="Type '!q help' for all commands"))
-        self._is_initialized = True
         self._logger.info(f"Found all voice and text channels. Ready to process requests.")
 
-    # TODO Documentation
-    # Names either list/tuple of strings or a string
+    async def on_guild_available(self, guild):
+        """
+        Discord.py calls this when a server's data arrives. With WARM_START_OPTIONS that
+        happens before on_ready(), so if the snapshot's resolved config still matches
+        the bot starts answering commands right away instead of waiting for on_ready()
+
+        Returns: None
+        """
+        if self._is_initialized or self._testing or self._snapshot is None:
+            return
+
+        resolved = ResolvedConfig.from_snapshot(self._config, guild, self._snapshot.get("resolved"))
+        if resolved is None:
+            return  # Config or server changed since the snapshot was saved. Wait for on_ready()
+
+        self._resolved = resolved
+        self._start_voice_index()
+        self._is_initialized = True
+        self._logger.info(f"Warm start for server '{guild.name}'. Ready to process requests.")
+
+    def get_snapshot(self):
+        """
+        Returns: JSON friendly dictionary with the bot's queues and resolved config (see snapshot.py)
+        """
+        return {
+            "saved_at": self._clock.now().timestamp(),
+            "queues": {str(guild_id): [user.to_dict() for user in queue]
+                       for guild_id, queue in self._queues.items()},
+            "waitlists": {str(guild_id): [user.to_dict() for user in admission.waitlist.values()]
+                          for guild_id, admission in self._admissions.items() if admission.waitlist},
+            "resolved": self._resolved.to_snapshot() if self._resolved is not None else None,
+        }
+
+    def _restore_snapshot(self, snapshot):
+        for guild_id, users in snapshot.get("queues", {}).items():
+            queue = self._new_queue(int(guild_id), (DiscordUser.from_dict(data, self._clock) for data in users))
+            for user in queue:
+                self._join_times[user.get_uuid()] = user.get_join_time()
+            self._queues[int(guild_id)] = queue
+        for guild_id, users in snapshot.get("waitlists", {}).items():
+            waitlist = self._get_admission(int(guild_id)).waitlist
+            for data in users:
+                user = DiscordUser.from_dict(data, self._clock)
+                waitlist[user.get_uuid()] = user
+        self._logger.info(f"Restored {sum(len(q) for q in self._queues.values())} user(s) from the queue snapshot")
+
+    async def close(self):
+        """
+        Gracefully shut down the bot: stop taking new commands, give running commands
+        SHUTDOWN_DRAIN_SECONDS to finish sending their replies, save the queues to
+        the snapshot file and then disconnect. Safe to call more than once
+
+        Returns: None
+        """
+        if self._shutdown_task is None:
+            self._shutdown_task = asyncio.ensure_future(self._shutdown())
+        await asyncio.shield(self._shutdown_task)
+
+    async def _shutdown(self):
+        self._is_initialized = False  # Ignore new commands
+        if self._watch_config.is_running():
+            self._watch_config.cancel()
+        if self._reconcile_waiting_rooms.is_running():
+            self._reconcile_waiting_rooms.cancel()
+        if self._tick_timers.is_running():
+            self._tick_timers.cancel()
+
+        running = self._in_flight - {asyncio.current_task()}
+        if running:
+            self._logger.info(f"Waiting for {len(running)} command(s) to finish before shutting down")
+            _, pending = await asyncio.wait(running, timeout=SHUTDOWN_DRAIN_SECONDS)
+            if pending:
+                self._logger.warning(f"Shutting down with {len(pending)} command(s) still running")
+
+        if self._snapshot_path is not None:
+            save_snapshot(self.get_snapshot(), self._snapshot_path)
+            self._logger.info(f"Saved queue snapshot to {self._snapshot_path}")
+
+        stats = self._render_cache.stats()
+        self._logger.info(f"Render cache: {stats['hits']} hit(s), {stats['misses']} miss(es)")
+        for line in self._stats_lines():
+            self._logger.info(line)
+        if self._engine is not None:
+            await self._engine.close()
+        for handler in logging.getLogger("queuebot").handlers:
+            handler.flush()
+
+        await super().close()
+
+    def _stats_lines(self, guild_id=None):
+        """
+        Describe the staffing metrics: dispatch latency and TA idle time (config.AUTO_DISPATCH),
+        per course wait times (config.COURSES), students turned away or waitlisted by
+        admission control and overload episodes. Logged at shutdown and shown by "!q stats"
+
+        Parameters:
+            guild_id: only describe this server's queue (defaults to every server)
+
+        Returns: list of strings (one per metric group)
+        """
+        lines = []
+        if self._config.AUTO_DISPATCH:
+            stats = self._dispatcher.stats()
+            lines.append(f"Dispatcher: {stats['dispatches']} dispatch(es), {stats['failures']} failure(s), "
+                         f"{stats['skipped']} skipped, latency {stats['mean_latency']:.2f}s mean/{stats['max_latency']:.2f}s max, "
+                         f"TA idle {stats['mean_idle']:.0f}s mean/{stats['idle_total']:.0f}s total")
+        for scheduler_guild, scheduler in self._schedulers.items():
+            if guild_id is not None and scheduler_guild != guild_id:
+                continue
+            stats = scheduler.stats()
+            courses = ", ".join(f"{course} (weight {course_stats['weight']:g}): {course_stats['served']} helped, "
+                                f"{course_stats['mean_wait']:.0f}s mean/{course_stats['max_wait']:.0f}s max wait"
+                                for course, course_stats in stats["courses"].items())
+            lines.append(f"Courses in {scheduler_guild}: {courses}. Fairness {stats['fairness']:.2f}")
+        for admission_guild, admission in self._admissions.items():
+            if guild_id is not None and admission_guild != guild_id:
+                continue
+            stats = admission.stats()
+            lines.append(f"Admission in {admission_guild}: {stats['rejected_full']} turned away (full), "
+                         f"{stats['rejected_wait']} turned away (wait), {stats['waitlisted']} waitlisted, "
+                         f"{stats['promoted']} let in from the waitlist, {stats['waitlist_left']} left the waitlist, "
+                         f"{stats['waitlist']} still waiting")
+        stats = self._overload.stats()
+        if stats["episodes"]:
+            lines.append(f"Overload: {stats['episodes']} episode(s), {stats['degraded_seconds']:.0f}s overloaded, "
+                         f"{stats['degraded_commands']} command(s) answered cheaply, largest backlog {stats['max_backlog']}")
+        return lines
+
     def _get_channel_from_name(self, names, all_channels):
-        # TODO Assert all voice channels names are unique
-        names = set([names]) if isinstance(names, str) else set(names)
-        channel_objects = set(filter(lambda c: c.name in names, all_channels))
-
-        if len(names) == len(channel_objects):
-            return channel_objects
-
-        # Could not find all channels
-        # TODO Make debug output more helpful (is it looking for office hours? Waiting room?)
-        missing = names - set([v.name for v in channel_objects])
-        self._logger.error("Unable to find the following channels: " +
-                            ", ".join([f"'{v}'" for v in missing]))
-        self._logger.error("Available channels: " +
-                            ", ".join([f"'{c.name}'" for c in channel_objects]))
-        sys.exit(1)  # FIXME Exit traceback is very messy
+        """
+        Find channels by name (see config.find_channels())
+
+        Raises: ConfigError if any of the channels can not be found
+        """
+        return find_channels(names, all_channels)
+
+    def _warn_missing(self, resolved):
+        if resolved.missing:
+            self._logger.warning("Unable to find the following roles/channels from the config: " +
+                                 ", ".join([f"'{name}'" for name in resolved.missing]))
+
+    def reload_config(self, config=None):
+        """
+        Swap in a new config without reconnecting to Discord. Only the lookups built
+        from keys that changed are rebuilt, and the swap happens without yielding to
+        the event loop so commands never see half of a reload. Commands that are
+        already running are left alone
+
+        Parameters:
+            config: the new QueueConfig (re-reads the config file if None)
+
+        Returns: set of config keys that changed
+        Raises: ConfigError if the new config is invalid or can only be applied by restarting
+        """
+        if config is None:
+            config = QueueConfig(read_config_json(self._config_path or get_config_path()),
+                                 from_env=self._config.FROM_ENV, test_mode=self._config.TEST_MODE)
+
+        keys = self._config.changed_keys(config)
+        if keys & RESTART_KEYS:
+            raise ConfigError(", ".join(sorted(keys & RESTART_KEYS)) + " can only be changed by restarting the bot")
+        if _needs_members(config) and not self.intents.members:
+            raise ConfigError("CHECK_VOICE_WAITING, ALERT_ON_FIRST_JOIN and AUTO_DISPATCH can only be turned on by restarting the bot")
+
+        resolved = None
+        if self._resolved is not None:
+            # Lookups for keys that did not change are shared with the current ResolvedConfig
+            resolved = ResolvedConfig(config, self.guilds[0], previous=self._resolved, keys=keys)
+            self._warn_missing(resolved)
+
+        self._resolved, self._config = resolved, config
+        if keys & {"CHECK_VOICE_WAITING", "VOICE_WAITING"}:
+            self._reconcilers.clear()  # The voice state indexes are for the old waiting room
+            for queue in self._queues.values():
+                queue.stop_changes()  # A new reconciler starts by looking at everyone
+            self._render_cache.clear()  # Pages show who isn't in the waiting room
+        if keys & {"CHECK_VOICE_WAITING", "VOICE_WAITING", "VOICE_OFFICES"}:
+            self._start_voice_index()  # Who counts as "in voice" changed
+        if "COURSES" in keys:
+            self._schedulers.clear()  # Rebuilt with the new weights by _get_scheduler()
+            for guild_id in self._queues:
+                self._retag_queue(guild_id)
+        if keys & {"QUEUE_CAPACITY", "MAX_WAIT_MINUTES"}:
+            # Counters and the waitlist are kept. Waitlisted students get in as others leave
+            for admission in self._admissions.values():
+                admission.capacity, admission.max_wait = self._admission_limits()
+
+        if keys:
+            self._logger.info(f"Config reloaded. Changed: {', '.join(sorted(keys))}")
+        return keys
+
+    @tasks.loop(seconds=CONFIG_POLL_SECONDS)
+    async def _watch_config(self):
+        """
+        Reload the config whenever the config file is modified
+        """
+        mtime = _get_mtime(self._config_path)
+        if mtime is None or mtime == self._config_mtime:
+            return
+        self._config_mtime = mtime
+
+        try:
+            self.reload_config()
+        except ConfigError as e:
+            self._logger.error(f"Ignoring changes to {self._config_path}: {e}")
 
     # TODO Documentation
     async def on_message(self, message):
+        # Most messages are chat. Reject anything that isn't a "!q" command in a
+        # TEXT_LISTENS channel as cheaply as possible (no formatting or logging)
+        if not message.content.startswith(COMMAND_PREFIXES):
+            return
+
         # Bot still initializing; not ready to receieve messages
         if not self._is_initialized:
             return
 
+        # Ignore channels that are not part of TEXT_LISTENS config item (DMs are never listened to)
+        if not self._listens_to(message.channel):
+            return
+
         # Ignore own messages
         if message.author == self.user:
             return
@@ -133,26 +505,236 @@ class QueueBot(discord.Client):
         if not isinstance(message.channel, discord.channel.TextChannel):
             return
 
-        # Ignore channels that are not part of TEXT_LISTENS config item
-        # TODO Update to check config
-        if message.channel.name not in self._config.TEXT_LISTENS:
+        self._logger.info('[#{0.channel}] {0.author} ({0.author.id}): {0.content}'.format(message))
+
+        # Keep track of running commands so shutting down can wait for their replies
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            update = await self.run_command(message)
+
+            if update:
+                await self._log_queue_state(message.channel)
+        except discord.errors.Forbidden:
+                await self._send(message.channel, "Unable to send message! User and/or channel privacy settings likely preventing the message from being received", message_type=CmdPrefix.ERROR)
+        except EngineError as e:
+            self._logger.error(f"Queue engine error: {e}")
+            await self._send(message.channel, "The queue is unavailable right now. Please try again shortly", CmdPrefix.ERROR)
+        except Exception as e:
+            self._logger.error(e)
+            await self._send(message.channel, "An error has occurred.", CmdPrefix.ERROR)
+            raise e
+        finally:
+            self._in_flight.discard(task)
+
+    async def run_command(self, message):
+        """
+        Run a "!q" command unless the author is sending commands too quickly (see Throttle)
+        If the author sends the same command again while the first one is still running,
+        the second one waits for the first instead of running (and replying) again
+
+        Parameters:
+            message: A discord.py message object where the message starts with '!q'
+
+        Returns: True if queue updated (False if it didn't, the command was throttled or
+                 it was a duplicate of a running command)
+        """
+        key = (message.author.id, message.channel.id, " ".join(message.content.lower().split()))
+        running = self._running_commands.get(key)
+        if running is not None:
+            try:
+                await asyncio.shield(running)
+            except Exception:
+                pass  # The first command reports the error
+            return False
+
+        if not self._is_ta(message.author.roles) and not self._throttle.allow(message.author.id):
+            self._logger.info(f"\t> Throttled {message.author} ({message.author.id})")
+            await self._react(message, THROTTLED_REACTION)
+            return False
+
+        # The command's task gets a copy of the context so its replies know which message they answer
+        token = _reply_to.set(message)
+        try:
+            task = asyncio.ensure_future(self._queue_command(message))
+        finally:
+            _reply_to.reset(token)
+        self._running_commands[key] = task
+        self._overloaded(self._overload.started(len(self._running_commands)))
+        try:
+            return await task
+        finally:
+            del self._running_commands[key]
+            self._overloaded(self._overload.finished(len(self._running_commands)))
+
+    def _overloaded(self, change):
+        # Log when the bot becomes overloaded or recovers (see OverloadDetector)
+        if change is True:
+            stats = self._overload.stats()
+            self._logger.warning(f"Overloaded ({stats['max_backlog']} commands running at most, "
+                                 f"{stats['latency'] or 0:.1f}s average to send a message). Answering commands cheaply")
+        elif change is False:
+            self._logger.info("No longer overloaded. Answering commands normally")
+
+    async def _react(self, message, emoji):
+        """
+        Add a reaction to a message (printed in testing mode). Missing permissions are logged
+
+        Returns: None
+        """
+        if self._testing:
+            print("REACT:", emoji)
             return
+        try:
+            await message.add_reaction(emoji)
+        except discord.HTTPException as e:
+            self._logger.warning(f"Unable to react to a message in #{message.channel}: {e}")
 
-        self._logger.info('[#{0.channel}] {0.author} ({0.author.id}): {0.content}'.format(message))
+    def _parse_interaction_create(self, data):
+        # Called by py-cord's gateway for every INTERACTION_CREATE event. Parsers can't await
+        self.loop.create_task(self._run_interaction(data))
+
+    async def _run_interaction(self, data):
+        # Nothing awaits the task, so failures (ex: a REST callback that failed) are logged here
+        # and the person who used the command is told instead of being left without an answer
+        try:
+            await self.handle_interaction(data)
+        except Exception as e:
+            self._logger.error(f"Interaction {data.get('id')} failed: {e}")
+            try:
+                await self._interaction_response(Interaction(data), CHANNEL_MESSAGE, response_data([("‼️ An error has occurred.", None)]))
+            except Exception as e:
+                # Ex: the interaction was already answered or its token expired
+                self._logger.warning(f"Unable to answer interaction {data.get('id')}: {e}")
+
+    async def _register_commands(self, guild):
+        """
+        Register the slash commands (interactions.SLASH_COMMANDS) with the server. Failing
+        (ex: the bot was added without the applications.commands scope) only disables them
+
+        Returns: True if the commands were registered
+        """
+        try:
+            application = await self.application_info()
+            route = Route("PUT", "/applications/{application_id}/guilds/{guild_id}/commands",
+                          application_id=application.id, guild_id=guild.id)
+            await self.http.request(route, json=SLASH_COMMANDS)
+        except discord.HTTPException as e:
+            self._logger.warning(f"Unable to register slash commands (was the bot added with the applications.commands scope?): {e}")
+            return False
+        return True
+
+    async def handle_interaction(self, data):
+        """
+        Answer a slash command or a queue board button (see interactions.py). Replies are
+        only shown to the person who used it (ephemeral). Commands that take longer than
+        INTERACTION_DEFER_SECONDS are acknowledged first and their reply is filled in after
+
+        Parameters:
+            data: the INTERACTION_CREATE event's payload
+
+        Returns: True if queue updated (False otherwise)
+        """
+        if not self._is_initialized:
+            return False
+        interaction = Interaction(data)
+        if interaction.type not in (APPLICATION_COMMAND, MESSAGE_COMPONENT) or interaction.command is None:
+            return False
+
+        channel = self.get_channel(interaction.channel_id)
+        if channel is None or not self._listens_to(channel):
+            names = ", ".join(f"#{name}" for name in self._config.TEXT_LISTENS)
+            await self._interaction_response(interaction, CHANNEL_MESSAGE, response_data([(f"Queue commands can only be used in {names}", None)]))
+            return False
+        self._logger.info(f"[#{channel}] {interaction.name} ({interaction.user_id}): /{interaction.command} {interaction.options}")
+
+        task = asyncio.current_task()
+        self._in_flight.add(task)
+        try:
+            if not self._is_ta(self._interaction_roles(interaction, channel.guild)) and not self._throttle.allow(interaction.user_id):
+                replies = [(f"{THROTTLED_REACTION} You are sending commands too quickly. Try again in a few seconds", None)]
+                await self._interaction_response(interaction, CHANNEL_MESSAGE, response_data(replies))
+                return False
 
-        # All QueueBot commands start with !q
-        if message.content[:2].lower().startswith("!q"):
+            # The command's task gets a copy of the context so its _send() calls are collected in replies
+            replies = []
+            token = _interaction_replies.set(replies)
             try:
-                update = await self._queue_command(message)
+                work = asyncio.ensure_future(self._interaction_command(interaction, channel))
+            finally:
+                _interaction_replies.reset(token)
 
-                if update:
-                    await self._log_queue_state(message.channel)
-            except discord.errors.Forbidden:
-                    await self._send(message.channel, "Unable to send message! User and/or channel privacy settings likely preventing the message from being received", message_type=CmdPrefix.ERROR)
+            done, _ = await asyncio.wait({work}, timeout=INTERACTION_DEFER_SECONDS)
+            deferred = not done
+            if deferred:
+                await self._interaction_response(interaction, DEFERRED_CHANNEL_MESSAGE, {"flags": EPHEMERAL})
+
+            update = False
+            try:
+                update = await work
             except Exception as e:
-                self._logger.error(e)
-                await self._send(message.channel, "An error has occurred.", CmdPrefix.ERROR)
-                raise e
+                self._logger.error(f"Interaction {interaction} failed: {e}")
+                replies = [("‼️ An error has occurred.", None)]
+
+            if deferred:
+                route = Route("PATCH", "/webhooks/{application_id}/{interaction_token}/messages/@original",
+                              application_id=interaction.application_id, interaction_token=interaction.token)
+                await self.http.request(route, json=response_data(replies))
+            else:
+                await self._interaction_response(interaction, CHANNEL_MESSAGE, response_data(replies))
+
+            if update:
+                await self._log_queue_state(channel)
+            return update
+        finally:
+            self._in_flight.discard(task)
+
+    @staticmethod
+    def _interaction_roles(interaction, guild):
+        """
+        Returns: the discord.py roles of the person who used the interaction (roles the
+                 guild doesn't know about are left out) so they can be passed to _is_ta()
+        """
+        roles = (guild.get_role(role_id) for role_id in interaction.role_ids)
+        return [role for role in roles if role is not None]
+
+    async def _interaction_response(self, interaction, response_type, data):
+        route = Route("POST", "/interactions/{interaction_id}/{interaction_token}/callback",
+                      interaction_id=interaction.id, interaction_token=interaction.token)
+        await self.http.request(route, json={"type": response_type, "data": data})
+
+    async def _interaction_command(self, interaction, channel):
+        """
+        Run the command for a slash command or button without parsing any text
+
+        Returns: True if queue updated (False otherwise)
+        """
+        user = DiscordUser(interaction.user_id, interaction.name, interaction.discriminator, interaction.nick, clock=self._clock)
+        command = interaction.command
+        options = interaction.options
+
+        if command == "join":
+            course = options.get("course").strip().lower() if options.get("course") else None
+            if options.get("in-person"):
+                return await self._q_join_inperson(user, channel, course)
+            return await self._q_join(user, channel, course)
+        elif command == "leave":
+            return await self._q_leave(user, channel)
+        elif command == "position":
+            return await self._q_position(user, channel)
+        elif command == "list":
+            page = options.get("page")
+            return await self._q_list(user, channel, str(page) if page is not None else None)
+        elif command == "notify":
+            return await self._q_notify(user, channel, options.get("position"))
+        elif command == "next":
+            if not self._is_ta(self._interaction_roles(interaction, channel.guild)):
+                await self._send(channel, "Only TAs can use this command", CmdPrefix.WARNING)
+                return False
+            return await self._q_next(user, channel)
+
+        await self._send(channel, f"Unknown command `{command}`", CmdPrefix.WARNING)
+        return False
 
     async def _log_queue_state(self, channel):
         """
@@ -161,25 +743,551 @@ class QueueBot(discord.Client):
 
         Returns: None
         """
+        if self._engine is not None:
+            return  # The queue engine keeps its own stats
         retval = []
         queue = self.get_queue(channel)
-        for user in queue:
+        if self._overload.degraded:
+            self._logger.info(f"\tQueue state: {len(queue)} in queue")
+            return
+        for user in queue.slice(0, QUEUE_STATE_LOG_LIMIT):
             state = "in-person" if user.is_inperson() else "online"
-            retval.append(f"{user} (state='{state}' join={user.get_join_time()})")
+            retval.append(f"{user} (state='{state}' wait={user.get_wait_time():.0f}s)")
+        if len(queue) > QUEUE_STATE_LOG_LIMIT:
+            retval.append(f"... {len(queue) - QUEUE_STATE_LOG_LIMIT} more")
 
+        admission = self._admissions.get(channel.guild.id)
+        if admission is not None and admission.waitlist:
+            retval.append(f"{len(admission.waitlist)} waitlisted")
         self._logger.info("\tQueue state: " + ", ".join(retval))
 
     def get_queue(self, channel):
-        if channel.guild not in self._queues:
-            self._queues[channel.guild] = deque()
-        return self._queues[channel.guild]
+        # Queues are keyed by ID (not the guild object) so they survive reconnects and restarts
+        guild_id = channel.guild.id
+        if guild_id not in self._queues:
+            self._queues[guild_id] = self._new_queue(guild_id)
+        return self._queues[guild_id]
+
+    def _new_queue(self, guild_id, users=()):
+        return StudentQueue(users, tagger=partial(self._queue_tags, guild_id))
+
+    def _queue_tags(self, guild_id, user):
+        """
+        Tags "!q next <mode>" and dispatch_students() use to find students (see StudentQueue.first()):
+        "inperson" or "online", and "voice" for online students who are in voice (see _in_voice())
+        With config.COURSES every tag also has a per course version (see course_tag())
+
+        Returns: list of tags
+        """
+        if user.is_inperson():
+            tags = ["inperson"]
+        elif self._in_voice(guild_id, user.get_uuid()):
+            tags = ["online", "voice"]
+        else:
+            tags = ["online"]
+        course = self._course_of(user)
+        if course is not None:
+            tags += [course_tag(tag, course) for tag in tags] + [course_tag(None, course)]
+        return tags
+
+    def _course_of(self, user):
+        """
+        Returns: the config.COURSES course the user is waiting for. Users who didn't pick one
+                 (or picked one that was removed from the config) wait for the first course.
+                 None if there are no courses
+        """
+        if not self._config.COURSES:
+            return None
+        course = user.get_course()
+        return course if course in self._config.COURSE_WEIGHTS else self._config.COURSES[0][0]
+
+    def _get_scheduler(self, guild_id, queue):
+        scheduler = self._schedulers.get(guild_id)
+        if scheduler is None:
+            scheduler = self._schedulers[guild_id] = FairScheduler(self._config.COURSE_WEIGHTS)
+            for course, _ in self._config.COURSES:
+                if queue.count(course_tag(None, course)):
+                    scheduler.arrive(course)
+        return scheduler
+
+    def _joined(self, guild_id, queue, user):
+        # Call after a user is added to the queue. Lets the course scheduler know the
+        # user's course has someone waiting and starts timing the service interval
+        if self._config.COURSES:
+            self._get_scheduler(guild_id, queue).arrive(self._course_of(user))
+        admission = self._get_admission(guild_id)
+        admission.joined()
+        admission.waitlist.pop(user.get_uuid(), None)  # Added by a TA while on the waitlist
+
+    def _pick_student(self, guild_id, queue, tag=None, skip=None, scheduler=None):
+        """
+        Find the next student to help (without removing them). With config.COURSES the
+        course is picked first (see fair_scheduler.py) and the student is the first one
+        from that course, otherwise it is the first one in the queue
+        The course's turn is only used up by _helped() once the student is taken
+
+        Parameters:
+            guild_id: ID of the queue's server
+            queue: the StudentQueue
+            tag: only pick students with this tag (ex: "voice"). None picks anyone
+            skip: optional function that returns True for students who can't be picked
+            scheduler: FairScheduler to pick the course with. Defaults to the server's
+                       (see FairScheduler.copy() for planning several picks)
+
+        Returns: a DiscordUser (None if nobody can be picked)
+        """
+        if not self._config.COURSES:
+            return _first_student(queue, tag, skip)
+        scheduler = scheduler if scheduler is not None else self._get_scheduler(guild_id, queue)
+        course = scheduler.pick(
+            lambda course: queue.count(course_tag(None, course)) > 0,
+            lambda course: _first_student(queue, course_tag(tag, course), skip) is not None)
+        return _first_student(queue, course_tag(tag, course), skip) if course is not None else None
+
+    def _helped(self, guild_id, queue, user):
+        # Call after a student who was helped is removed from the queue. Uses up their
+        # course's turn and records how long they waited for the course's fairness
+        # metrics and the queue's service rate
+        scheduler = self._schedulers.get(guild_id)
+        if scheduler is not None:
+            course = self._course_of(user)
+            scheduler.charge(course)
+            scheduler.record_wait(course, user.get_wait_time())
+        self._get_admission(guild_id).helped(len(queue))
+
+    def _get_admission(self, guild_id):
+        admission = self._admissions.get(guild_id)
+        if admission is None:
+            admission = self._admissions[guild_id] = AdmissionControl(*self._admission_limits(), clock=self._clock)
+        return admission
+
+    def _admission_limits(self):
+        # (capacity, max wait in seconds) for AdmissionControl
+        max_wait = self._config.MAX_WAIT_MINUTES
+        return self._config.QUEUE_CAPACITY, max_wait * 60 if max_wait is not None else None
+
+    async def _admit(self, user, channel, queue):
+        """
+        Check config.QUEUE_CAPACITY and config.MAX_WAIT_MINUTES before a student joins the queue
+        Students who can't join are put on the waitlist (config.OVERFLOW_WAITLIST) or turned
+        away. TAs are told the first time a student is shed since the queue last took students
+
+        Parameters:
+            user: DiscordUser who wants to join (with their mode and course set)
+            channel: discord.py channel to send messages to
+            queue: the StudentQueue
+
+        Returns: True if the student can be added to the queue
+        """
+        admission = self._get_admission(channel.guild.id)
+        position = admission.waitlist_position(user.get_uuid())
+        if position is not None:
+            await self._send(channel, f"{user.get_mention()} you are already on the waitlist at position #{position}", CmdPrefix.WARNING)
+            return False
+
+        reason = admission.check(len(queue))
+        if reason is None:
+            admission.admitted()
+            return True
+
+        wait = admission.projected_wait(len(queue) + 1)
+        if reason == "full":
+            why = f"the queue is full ({len(queue)} students)"
+        else:
+            why = f"the expected wait is about {wait / 60:.0f} minutes"
+        waitlist = self._config.OVERFLOW_WAITLIST
+        if waitlist:
+            admission.waitlist[user.get_uuid()] = user
+            await self._send(channel, constants.MSG_WAITLISTED.format(mention=user.get_mention(), reason=why,
+                                                                      position=len(admission.waitlist)), CmdPrefix.WARNING)
+        else:
+            await self._send(channel, constants.MSG_QUEUE_FULL.format(mention=user.get_mention(), reason=why), CmdPrefix.WARNING)
+
+        self._logger.info(f"Shed {user} ({reason}, {'waitlisted' if waitlist else 'turned away'})")
+        if admission.shed(reason, waitlist):
+            alert = self._alert_channel(channel.guild)
+            if alert is not None:
+                await self._send(alert, constants.MSG_SHEDDING.format(reason=why), CmdPrefix.WARNING, reply=False)
+        return False
+
+    def _promote_waitlist(self, guild, queue):
+        """
+        Move waitlisted students into the queue while there is room (see _left_queue())
+        They are told they got in by _announce_promoted()
+
+        Returns: list of DiscordUsers added to the queue
+        """
+        admission = self._admissions.get(guild.id)
+        if admission is None or not admission.waitlist:
+            return []
+        users = admission.promote(len(queue))
+        for user in users:
+            queue.append(user)
+            self._join_times[user.get_uuid()] = user.get_join_time()
+            self._joined(guild.id, queue, user)
+        if users:
+            self.schedule(0, self._announce_promoted, guild, users)
+        return users
+
+    async def _announce_promoted(self, guild, users):
+        channel = self._alert_channel(guild, listen=True)
+        queue = self._queues.get(guild.id)
+        if channel is None or queue is None:
+            return
+        for user in users:
+            position = queue.position(user)
+            if position is not None:
+                await self._send(channel, constants.MSG_PROMOTED.format(mention=user.get_mention(), position=position),
+                                 CmdPrefix.SUCCESS, reply=False)
+        await self.dispatch_students(guild)
+
+    def _in_voice(self, guild_id, uuid):
+        """
+        Returns: True if the member is in the waiting room (or, when CHECK_VOICE_WAITING
+                 is off, in a voice channel that isn't one of the office rooms)
+        """
+        if self._config.CHECK_VOICE_WAITING:
+            # Built when the bot starts (see _start_voice_index()). The queue is retagged when it is
+            reconciler = self._reconcilers.get(guild_id)
+            return reconciler is not None and reconciler.is_waiting(uuid)
+        guild = self.get_guild(guild_id)
+        member = guild.get_member(uuid) if guild is not None else None
+        if member is None or member.voice is None or member.voice.channel is None:
+            return False
+        if self._resolved is not None:
+            return member.voice.channel.id not in self._resolved.OFFICE_ROOM_IDS
+        return member.voice.channel.name not in self._config.VOICE_OFFICE_SET
+
+    def _retag_queue(self, guild_id):
+        # Recompute everyone's "voice" tag after the way it is computed changed. O(n log n)
+        queue = self._queues.get(guild_id)
+        if queue is not None:
+            for user in list(queue):
+                queue.retag(user)
+
+    def _start_voice_index(self):
+        """
+        Build the waiting room's voice state index for every server (and retag their
+        queues) so "!q next voice" works before anyone's voice state changes
+
+        Returns: None
+        """
+        for guild in self.guilds:
+            if self._config.CHECK_VOICE_WAITING:
+                self._get_reconciler(guild)
+            else:
+                self._retag_queue(guild.id)
+
+    def _waiting_room(self, guild):
+        """
+        Returns: the config.VOICE_WAITING discord.py voice channel in guild (None if it can't be found)
+        """
+        if self._resolved is not None:
+            return guild.get_channel(self._resolved.WAITING_ROOM_ID)
+        for room in guild.voice_channels:
+            if room.name == self._config.VOICE_WAITING:
+                return room
+        return None
+
+    def _get_reconciler(self, guild):
+        if guild.id not in self._reconcilers:
+            room = self._waiting_room(guild)
+            members = [member.id for member in room.members] if room is not None else []
+            self._reconcilers[guild.id] = WaitingRoomReconciler(REMINDER_GRACE_SECONDS, ABSENT_GRACE_SECONDS,
+                                                                members, self._clock)
+            self._retag_queue(guild.id)
+        return self._reconcilers[guild.id]
+
+    async def on_voice_state_update(self, member, before, after):
+        """
+        Discord.py calls this when someone joins, leaves or moves between voice channels
+        Keeps the waiting room's voice state index up to date (see reconcile_waiting_room())
+        and sends students to office rooms that have a free TA (see dispatch_students())
+
+        Returns: None
+        """
+        if before.channel == after.channel:
+            return
+        started = self._clock.monotonic()
+        if self._config.CHECK_VOICE_WAITING:
+            self._waiting_room_update(member, before, after)
+        queue = self._queues.get(member.guild.id)
+        if queue is not None and member.id in queue:
+            queue.retag(member.id)
+        if self._config.AUTO_DISPATCH:
+            self._dispatcher.voice_update(member.id)
+            await self.dispatch_students(member.guild, started)
+
+    def _waiting_room_update(self, member, before, after):
+        room = self._waiting_room(member.guild)
+        if room is None:
+            return
+        was_waiting = before.channel is not None and before.channel.id == room.id
+        is_waiting = after.channel is not None and after.channel.id == room.id
+        if was_waiting != is_waiting:
+            self._get_reconciler(member.guild).voice_update(member.id, is_waiting)
+
+            # Online students who leave the waiting room are removed from the queue if they don't come back
+            key = ("voice", member.guild.id, member.id)
+            queue = self._queues.get(member.guild.id)
+            if is_waiting:
+                self._timers.cancel(key)
+            elif queue is not None and member.id in queue and not queue.get(member.id).is_inperson():
+                self.schedule(VOICE_GRACE_SECONDS, self._voice_timeout, member.guild, member.id, key=key)
+
+    def _office_rooms(self, guild):
+        """
+        Returns: list of the config.VOICE_OFFICES discord.py voice channels in guild
+        """
+        if self._resolved is not None:
+            return self._resolved.office_rooms(guild)
+        return list(self._get_channel_from_name(self._config.VOICE_OFFICES, guild.voice_channels))
+
+    def _is_free_room(self, room):
+        # Available TAs are in an office hours room without a student (see _alert_avail_tas())
+        return len(room.members) > 0 and all(self._is_ta(member.roles) for member in room.members)
+
+    async def dispatch_students(self, guild, started=None):
+        """
+        Send the next students in the queue to office rooms that have a free TA (a room
+        with only TAs in it) without waiting for "!q next". Online students who aren't
+        in voice are skipped but keep their place, and in-person students are left
+        for the TAs to call with "!q next"
+        *Only runs when config.AUTO_DISPATCH is on*
+
+        Parameters:
+            guild: discord.py server to dispatch students in
+            started: clock.monotonic() of the event that made dispatching possible (defaults to now)
+
+        Returns: list of (DiscordUser, discord.py voice channel) for the students who were moved
+        """
+        if not self._config.AUTO_DISPATCH:
+            return []
+        started = self._clock.monotonic() if started is None else started
+
+        rooms = self._office_rooms(guild)
+        for room in rooms:
+            self._dispatcher.update_room(room.id, self._is_free_room(room))
+        free = [room for room in rooms if self._dispatcher.is_free(room.id)]
+        queue = self._queues.get(guild.id)
+        if not free or not queue:
+            return []
+
+        # Pick every student before moving anyone (moving yields to the event loop). Course
+        # turns are planned on a copy and only used up as students are moved (see _helped())
+        assignments = []
+        last = 0
+        moving = lambda user: self._dispatcher.is_moving(user.get_uuid())
+        plan = self._get_scheduler(guild.id, queue).copy() if self._config.COURSES else None
+        while len(assignments) < len(free):
+            user = self._pick_student(guild.id, queue, "voice", skip=moving, scheduler=plan)
+            if user is None:
+                break
+            if plan is not None:
+                plan.charge(self._course_of(user))
+            room = free[len(assignments)]
+            assignments.append((user, room, self._dispatcher.assign(room.id, user.get_uuid())))
+            last = max(last, queue.position(user))
+        # Online students in front of the last one who were passed over since they aren't in voice
+        if queue.count("online", last) > queue.count("voice", last):
+            user = queue.first("online")
+            while user is not None and queue.position(user) < last:
+                if not self._in_voice(guild.id, user.get_uuid()):
+                    self._dispatcher.skip(user.get_uuid())
+                user = queue.first("online", queue.position(user) + 1)
+
+        moved = await asyncio.gather(*(self._dispatch_student(guild, user, room, idle, started)
+                                       for user, room, idle in assignments))
+        return [(user, room) for (user, room, _), ok in zip(assignments, moved) if ok]
+
+    async def _dispatch_student(self, guild, user, room, idle, started):
+        uuid = user.get_uuid()
+        member = guild.get_member(uuid)
+        try:
+            if member is None:
+                raise ValueError("they are not in the server")
+            await member.move_to(room)
+        except (discord.HTTPException, ValueError) as e:
+            self._dispatcher.failed(room.id, uuid)
+            self._logger.warning(f"Unable to dispatch {user} to {room.name}: {e}")
+            return False
+
+        latency = self._dispatcher.moved(uuid, started)
+        tas = [ta for ta in room.members if ta.id != uuid and self._is_ta(ta.roles)]
+        ta_name = tas[0].display_name if tas else None
+        queue = self._queues.get(guild.id)
+        if queue is not None and uuid in queue:
+            position = queue.position(uuid)
+            queue.remove(uuid)
+            self._helped(guild.id, queue, user)
+            self._left_queue(guild, queue, user, position)
+        self._logger.info(f"Dispatched {user} to {room.name} in {latency:.2f}s (TA idle for {idle:.0f}s)")
+        await log_session(user.get_name(), self._join_times.pop(uuid, None), ta_name, "dispatch", guild.name, self._clock)
+
+        channel = self._alert_channel(guild, listen=True)
+        if channel is not None:
+            await self._send(channel, constants.MSG_DISPATCHED.format(mention=user.get_mention(), room=room.name),
+                             CmdPrefix.SUCCESS, reply=False)
+        return True
+
+    async def _voice_timeout(self, guild, uuid):
+        """
+        Remove an online student from the queue after they've been out of the waiting room
+        for VOICE_GRACE_SECONDS (logged with the "timeout" command type)
+
+        Returns: True if the student was removed
+        """
+        if not self._config.CHECK_VOICE_WAITING:
+            return False  # Turned off since the timer was scheduled
+        queue = self._queues.get(guild.id)
+        user = queue.get(uuid) if queue is not None else None
+        if user is None or user.is_inperson() or self._get_reconciler(guild).is_waiting(uuid):
+            return False
+
+        position = queue.position(user)
+        queue.remove(user)
+        self._left_queue(guild, queue, user, position)
+        self._logger.info(f"Removing {user} from the queue. They left the waiting room {VOICE_GRACE_SECONDS}s ago")
+        channel = self._alert_channel(guild, listen=True)
+        if channel is not None:
+            await self._send(channel, constants.MSG_VOICE_TIMEOUT.format(mention=user.get_mention(), room=self._config.VOICE_WAITING),
+                             CmdPrefix.WARNING)
+        await log_session(user.get_name(), self._join_times.pop(uuid, None), None, "timeout", guild.name, self._clock)
+        return True
+
+    def schedule(self, delay, callback, *args, key=None):
+        """
+        Run callback(*args) after delay seconds (see timer_wheel.py). Coroutine functions are awaited
+        Used instead of a task per delayed action so hundreds of students can have timers
+
+        Parameters:
+            delay: seconds to wait
+            callback: function (or coroutine function) to run
+            args: arguments passed to callback
+            key: optional name for the timer. Scheduling with the same key replaces the old timer
+
+        Returns: the timer_wheel.Timer (use its cancel() method to stop it)
+        """
+        return self._timers.schedule(delay, callback, *args, key=key)
+
+    @tasks.loop(seconds=TIMER_TICK_SECONDS)
+    async def _tick_timers(self):
+        await self.run_timers()
+
+    async def run_timers(self):
+        """
+        Run every scheduled timer that is due
+
+        Returns: number of timers that ran
+        """
+        timers = self._timers.expire()
+        for timer in timers:
+            try:
+                result = timer.callback(*timer.args)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                self._logger.error(f"Timer {timer} failed: {e}")
+        return len(timers)
+
+    async def _wait_for(self, event, timeout, check=None):
+        """
+        Same as discord.Client.wait_for() but the timeout is kept by the bot's timers
+
+        Raises: asyncio.TimeoutError if the event doesn't happen within timeout seconds
+        """
+        waiter = asyncio.ensure_future(self.wait_for(event, check=check))
+        expired = self.loop.create_future()
+        timer = self.schedule(timeout, _set_done, expired)
+        try:
+            await asyncio.wait({waiter, expired}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            timer.cancel()
+            if not waiter.done():
+                waiter.cancel()
+        if not waiter.done() or waiter.cancelled():
+            raise asyncio.TimeoutError()
+        return waiter.result()
+
+    @tasks.loop(seconds=RECONCILE_SECONDS)
+    async def _reconcile_waiting_rooms(self):
+        """
+        Periodically compare every server's waiting room against its queue
+        """
+        if not self._is_initialized or not self._config.CHECK_VOICE_WAITING:
+            return
+        if self._overload.degraded:
+            return  # Reminders and "not in the waiting room" alerts wait for the first check after recovering
+        if self._engine is not None:
+            return  # The queue isn't in this process
+        for guild in self.guilds:
+            try:
+                await self.reconcile_waiting_room(guild)
+            except Exception as e:
+                self._logger.error(f"Unable to check the waiting room for '{guild.name}': {e}")
+
+    async def reconcile_waiting_room(self, guild):
+        """
+        Remind students who have been in the waiting room for REMINDER_GRACE_SECONDS without
+        joining the queue (at most REMINDERS_PER_CHECK reminders at a time) and tell TAs about
+        online students who have been in the queue but out of the waiting room for ABSENT_GRACE_SECONDS
+        Each student is only reminded/flagged once until they leave the waiting room/queue
+
+        Parameters:
+            guild: discord.py server to check
+
+        Returns: (members who were reminded, DiscordUsers who were flagged)
+        """
+        queue = self._queues.get(guild.id)
+        if queue is None:
+            queue = self._queues[guild.id] = self._new_queue(guild.id)
+        reminders, flags = self._get_reconciler(guild).reconcile(queue, limit=REMINDERS_PER_CHECK)
+
+        members = [guild.get_member(uuid) for uuid in reminders]
+        members = [m for m in members if m is not None and not getattr(m, "bot", False) and not self._is_ta(m.roles)]
+        if members:
+            self._logger.info(f"Reminding {len(members)} student(s) in the waiting room to join the queue")
+            channel = self._alert_channel(guild, listen=True)
+            content = constants.MSG_WAITING_REMINDER.format(room=self._config.VOICE_WAITING,
+                                                            channel=channel.name if channel is not None else "the queue channel")
+            await self._send_dms([(m, content) for m in members], CmdPrefix.WARNING, action="remind")
+
+        flagged = [queue.get(uuid) for uuid in flags]
+        flagged = [user for user in flagged if user is not None]
+        channel = self._alert_channel(guild)
+        if flagged and channel is not None:
+            names = ", ".join(user.get_name() for user in flagged)
+            await self._send(channel, constants.MSG_NOT_WAITING.format(room=self._config.VOICE_WAITING, names=names),
+                             CmdPrefix.WARNING)
+
+        return members, flagged
+
+    def _alert_channel(self, guild, listen=False):
+        """
+        Returns: the config.TEXT_ALERT channel (or first config.TEXT_LISTENS channel if there
+                 isn't one or listen is True). None if it can't be found
+        """
+        name = self._config.TEXT_ALERT
+        if listen or name is None:
+            name = self._config.TEXT_LISTENS[0]
+        for channel in guild.text_channels:
+            if channel.name == name:
+                return channel
+        return None
 
     # TODO Use message.reply instead of message.send()? Double check parameters
-    async def _send(self, channel, content=None, message_type=None, *, embed=None, allowed_mentions=None):
+    async def _send(self, channel, content=None, message_type=None, *, embed=None, allowed_mentions=None, reply=True):
         """
         Simple wrapper of discord.py's send method.
         This is used to add emote prefixes to messages as well as
         facilitate unit testing by printing out messages to stdout
+
+        Replies (reply=True) to a slash command or button are collected for its
+        ephemeral response instead of being sent (see handle_interaction()). With
+        config.REPLY_MODE, replies to a "!q" command answer the command's message
+        (see _queue_reply()). Messages everyone in the channel should see (ex: TA alerts) use reply=False
+        While the bot is overloaded, success and warning replies to a "!q" command are
+        reactions on the command instead (see OVERLOAD_REACTIONS)
         """
         if not self._is_initialized:
             pass  # TODO Do something (eat messages...? Could cause confusion)
@@ -195,9 +1303,27 @@ class QueueBot(discord.Client):
         if prefix_emote:
             content = prefix_emote + " " + content
 
+        replies = _interaction_replies.get()
+        if reply and replies is not None:
+            replies.append((content, embed))
+            return None
+
+        message = _reply_to.get()
+        if reply and message_type in OVERLOAD_REACTIONS and self._overload.degraded and \
+                message is not None and message.channel.id == channel.id:
+            await self._react(message, OVERLOAD_REACTIONS[message_type])
+            return None
+
         if not self._testing:
             self._logger.info(f"[#{channel.name}] {self.user} [embed? {embed is not None}] {content.rstrip() if content else ''}")
-            return await channel.send(content=content, embed=embed, allowed_mentions=allowed_mentions)  # TODO pass in kwargs/args?
+            started = self._clock.monotonic()
+            try:
+                if reply and self._config.REPLY_MODE and message is not None and message.channel.id == channel.id:
+                    return await self._queue_reply(channel, message, content, embed, allowed_mentions)
+                return await channel.send(content=content, embed=embed, allowed_mentions=allowed_mentions)  # TODO pass in kwargs/args?
+            finally:
+                # Sends slow down when Discord rate limits the bot (see OverloadDetector)
+                self._overloaded(self._overload.sent(self._clock.monotonic() - started, len(self._running_commands)))
         else:
             print("SEND:", content, end="")
             if embed:
@@ -205,6 +1331,59 @@ class QueueBot(discord.Client):
             else:
                 print()  # End current line
 
+    async def _queue_reply(self, channel, message, content, embed, allowed_mentions=None):
+        """
+        Answer a message by replying to it. Replies for the same channel that are waiting
+        to be sent at the same time (ex: while the channel is rate limited) are sent as one
+        message that replies to the first of them. Only the people who are being replied to
+        and users mentioned in someone else's reply are pinged. Replies with their own
+        allowed_mentions (ex: the compact "!q list") are sent on their own with them
+
+        Returns: the discord.py message the reply was sent in
+        """
+        future = self.loop.create_future()
+        self._pending_replies.setdefault(channel.id, []).append((message, content, embed, allowed_mentions, future))
+        if channel.id not in self._reply_senders:
+            self._reply_senders[channel.id] = self.loop.create_task(self._send_replies(channel))
+        return await future
+
+    async def _send_replies(self, channel):
+        try:
+            while True:
+                await asyncio.sleep(0)  # Let commands that are running at the same time add their replies
+                batch = self._pending_replies.pop(channel.id, None)
+                if not batch:
+                    return
+                for group in _reply_groups(batch):
+                    try:
+                        sent = await self._send_reply_group(channel, group)
+                    except Exception as e:
+                        for *_, future in group:
+                            if not future.done():
+                                future.set_exception(e)
+                    else:
+                        for *_, future in group:
+                            if not future.done():
+                                future.set_result(sent)
+        finally:
+            self._reply_senders.pop(channel.id, None)
+
+    async def _send_reply_group(self, channel, group):
+        first = group[0][0]
+        content = "\n".join(content for _, content, _, _, _ in group if content) or None
+        allowed_mentions = group[0][3]
+        if allowed_mentions is not None:
+            # Only sent on its own (see _reply_groups())
+            return await channel.send(content=content, embed=group[0][2], allowed_mentions=allowed_mentions,
+                                      reference=first.to_reference(fail_if_not_exists=False))
+        # Only the author of the message being replied to gets a reply notification. Ping everyone
+        # else who is mentioned (ex: "!q next" or the other authors whose replies were combined)
+        users = {int(uuid) for uuid in MENTION_PATTERN.findall(content or "")} - {first.author.id}
+        allowed_mentions = discord.AllowedMentions(everyone=False, roles=False, replied_user=True,
+                                                   users=[discord.Object(uuid) for uuid in sorted(users)])
+        return await channel.send(content=content, embed=group[0][2], allowed_mentions=allowed_mentions,
+                                  reference=first.to_reference(fail_if_not_exists=False))
+
     # TODO Combine with send() as code is identical aside from send/send logging
     async def _send_dm(self, user, content=None, message_type=None, *, embed=None, log_message=True, file=None):
         if not self._is_initialized:
@@ -231,26 +1410,96 @@ class QueueBot(discord.Client):
         if log_message:
             self._logger.info(f"[Direct Message] {self.user} --> {user} ({user.id}): [embed? {embed is not None}] {content.rstrip() if content else ''}")
 
-        if file is None:
-            return await user.send(content=content, embed=embed)  # TODO pass in kwargs/args?
-        return await user.send(file=discord.File(file))
+        channel = await self._dm_channel(user)
+        try:
+            if file is None:
+                return await channel.send(content=content, embed=embed)  # TODO pass in kwargs/args?
+            return await channel.send(file=discord.File(file))
+        except discord.NotFound:
+            self._dm_channels.pop(user.id)  # The channel is gone. Open a new one next time
+            raise
+
+    async def _send_dms(self, messages, message_type=None, *, action="message"):
+        """
+        Send Direct Messages to many users at once (at most DM_CONCURRENCY at a time)
+        so one slow or failing DM doesn't hold up the rest. Failures are logged
 
-    def _is_ta(self, user_roles, ta_roles):
+        Parameters:
+            messages: list of (discord.py user, content) pairs
+            message_type: CmdPrefix of every message
+            action: what the messages do, used in the log message ("Unable to {action} ...")
+
+        Returns: list of the users the message could not be sent to
+        """
+        semaphore = asyncio.Semaphore(DM_CONCURRENCY)
+
+        async def send(user, content):
+            async with semaphore:
+                return await self._send_dm(user, content, message_type)
+
+        results = await asyncio.gather(*(send(user, content) for user, content in messages), return_exceptions=True)
+        failed = []
+        for (user, _), result in zip(messages, results):
+            if isinstance(result, Exception):
+                self._logger.warning(f"Unable to {action} {user} ({user.id}): {result}")
+                failed.append(user)
+        return failed
+
+    async def _resolve_user(self, uuid):
+        """
+        Get the discord.py user with the given ID. Users are cached for DM_CACHE_SECONDS and
+        looked up with a REST request if discord.py doesn't have them (ex: no members intent)
+
+        Returns: the discord.py user (None in testing mode if discord.py doesn't have them)
+        """
+        user = self._users.get(uuid)
+        if user is None:
+            user = self.get_user(uuid)
+            if user is None and not self._testing:
+                user = await self.fetch_user(uuid)
+            if user is not None:
+                self._users.put(uuid, user)
+        return user
+
+    async def _dm_channel(self, user):
+        """
+        Returns: the Direct Message channel with a discord.py user (opened with a REST
+                 request the first time and cached for DM_CACHE_SECONDS)
+        """
+        channel = self._dm_channels.get(user.id)
+        if channel is None:
+            channel = user.dm_channel or await user.create_dm()
+            self._dm_channels.put(user.id, channel)
+        return channel
+
+    def _is_ta(self, user_roles):
         """
         Checks to see if a given user's role list is a TA
         from config.TA_ROLES
 
         Parameters:
             user_roles: A discord.py user's role list to check
-            ta_roles: List of strings that is considered to be TA roles
 
         Returns: True if the user is a TA (False otherwise)
         """
+        if self._resolved is not None:
+            return self._resolved.is_ta(user_roles)
+
+        # Roles have not been resolved to IDs (testing mode)
+        ta_roles = self._config.TA_ROLE_SET
         for r in user_roles:
             if r.name in ta_roles:
                 return True
         return False
 
+    def _listens_to(self, channel):
+        """
+        Returns: True if channel is one of the config.TEXT_LISTENS channels
+        """
+        if self._resolved is not None:
+            return channel.id in self._resolved.TEXT_LISTEN_IDS
+        return getattr(channel, "name", None) in self._config.TEXT_LISTEN_SET
+
     async def _queue_command(self, message):
         """
         Takes a !q ______ command and attempts to parse it
@@ -267,14 +1516,11 @@ class QueueBot(discord.Client):
         channel = message.channel
         author = message.author
 
-        # TODO Account for MockAuthor
-        # if isinstance(author, MockAuthor):
-        #     user = DiscordUser(author.id, author.name, author.nick, author.roles)
         if isinstance(author, discord.member.Member):
-            user = DiscordUser(author.id, author.name, author.discriminator, author.nick)
+            user = DiscordUser(author.id, author.name, author.discriminator, author.nick, clock=self._clock)
         elif isinstance(author, discord.user.User):
             # Users don't have nicknames
-            user = DiscordUser(author.id, author.name, author.discriminator, None)
+            user = DiscordUser(author.id, author.name, author.discriminator, None, clock=self._clock)
         else:
             # TODO Don't put author in error message (bad practice? Double check)
             raise ValueError(f"{type(author)} is an unknown author type")
@@ -302,23 +1548,24 @@ class QueueBot(discord.Client):
         # TODO !q join-online and !q join (in-person)
         elif command == "join" and \
                 len(full_command) > 2 and full_command[2] in {"in-person", "inperson", "in"}:
-            return await self.q_join_inperson(user, channel)
+            return await self._q_join_inperson(user, channel)
         elif command == "join":
-            return await self._q_join(user, channel)
+            return await self._q_join(user, channel, full_command[2] if len(full_command) > 2 else None)
         elif command == "join-inperson":
-            return await self._q_join_inperson(user, channel)
+            return await self._q_join_inperson(user, channel, full_command[2] if len(full_command) > 2 else None)
         elif command == "leave":
             return await self._q_leave(user, channel)
         elif command == "position" or command == "pos":
             return await self._q_position(user, channel)
         elif command == "list":
-            return await self._q_list(user, channel)
+            return await self._q_list(user, channel, full_command[2] if len(full_command) > 2 else None)
+        elif command == "notify":
+            return await self._q_notify(user, channel, full_command[2] if len(full_command) > 2 else None)
 
         """ TA COMMANDS """
 
         # Make sure user is a TA for rest of commands
-        ta_roles = self._config.TA_ROLES
-        if not self._is_ta(author.roles, ta_roles):
+        if not self._is_ta(author.roles):
             await self._send(channel, f"{user.get_mention()} invalid format. " +
                 "Type `!q join-inperson` if you are in person (`!q join` for online) to join the queue or `!q leave` to leave.\n" +
                 "(see `!q help` for all commands)" , CmdPrefix.WARNING)
@@ -332,6 +1579,15 @@ class QueueBot(discord.Client):
                 return await self._q_clear(user, channel)
             elif command == "logs":
                 return await self._q_logs(user, channel)
+            elif command == "reload":
+                return await self._q_reload(user, channel)
+            elif command == "board":
+                return await self._q_board(user, channel)
+            elif command == "stats":
+                return await self._q_stats(user, channel)
+
+        if len(full_command) == 3 and (command == "next" or command == "pop"):
+            return await self._q_next(user, channel, full_command[2])
 
         # Don't check for length (user could accidentally write out name - including spaces - instead of mentioning)
         # As a result, the command will account for it and print out the necessary warning message
@@ -378,38 +1634,38 @@ class QueueBot(discord.Client):
 
         Returns: False (doesn't update queue)
         """
-        discord_user = self.get_user(user.get_uuid())
-        commands = f"{constants.MSG_HELP['STUDENT']}"
-
-        if self._is_ta(author.roles, self._config.TA_ROLES):
-            commands += "\n\n" + constants.MSG_HELP["TA"]
-            self._logger.info("\t> Sent TA help command")
-        else:
-            self._logger.info("\t> Sent Student help command")
+        discord_user = await self._resolve_user(user.get_uuid())
+        role = "ta" if self._is_ta(author.roles) else "everyone"
+        commands = self._render_cache.get((channel.guild.id, role, "help"), None, lambda: _render_help(role))
+        self._logger.info(f"\t> Sent {'TA' if role == 'ta' else 'Student'} help command")
 
         await self._send_dm(discord_user, commands, log_message=False)
         await self._send(channel, f"{user.get_mention()} a list of the commands has been sent to your Direct Messages", CmdPrefix.SUCCESS)
         return False
 
-    async def _alert_avail_tas(self, channel):
+    async def _alert_avail_tas(self, channel, defer=True):
         """
         Notify available TAs when someone joins the queue
         (where an available TA is a TA who is in an office hours
         room without a student in it)
+        While the bot is overloaded, the alert is sent OVERLOAD_ALERT_DELAY seconds later
+        instead (if the queue still isn't empty)
 
         Returns: Number of TAs mentioned
         """
         if not self._config.ALERT_ON_FIRST_JOIN:
             return
+        if defer and self._overload.degraded:
+            self.schedule(OVERLOAD_ALERT_DELAY, self._deferred_alert, channel, key=f"alert:{channel.guild.id}")
+            return 0
 
         self._logger.debug("\t> Getting active TAs for ALERT_ON_FIRST_JOIN")
 
         actives = []
 
-        voice_offices = self._get_channel_from_name(self._config.VOICE_OFFICES, channel.guild.voice_channels)
-        for room in voice_offices:
+        for room in self._office_rooms(channel.guild):
             # All members in the channel are TAs
-            if all(self._is_ta(user.roles, self._config.TA_ROLES) for user in room.members):
+            if all(self._is_ta(user.roles) for user in room.members):
                 actives.extend(room.members)
 
         if len(actives) == 0:
@@ -418,10 +1674,15 @@ class QueueBot(discord.Client):
 
         self._logger.debug(f"\t> Active TAs: {actives}")
         message = " ".join([ta.mention for ta in actives]) + " The queue is no longer empty"
-        await self._send(channel, message)
+        await self._send(channel, message, reply=False)
         return len(actives)
 
-    async def _q_join(self, user, channel):
+    async def _deferred_alert(self, channel):
+        queue = self._queues.get(channel.guild.id)
+        if queue:
+            await self._alert_avail_tas(channel, defer=False)
+
+    async def _q_join(self, user, channel, course=None):
         """
         If a user sends "!q join", attempt to add them to the queue
         The user must be within the config.WAITING_ROOM voice channel before joining
@@ -430,36 +1691,50 @@ class QueueBot(discord.Client):
         Parameters:
             user: DiscordUser object representing the user who ran the command
             channel: discord.py channel object to send message to
+            course: optional config.COURSES course ("!q join csc110")
 
         Returns: True if the user is added to the queue
         """
+        if not await self._check_course(user, channel, course):
+            return False
+
         # TODO Use function for checking if user in waiting room
-        if self._config.CHECK_VOICE_WAITING and not in_voice_channel(user, channel, self._waiting_room.name):
-            # await self.send(channel, f"{user.get_mention()} Please join the __{self._waiting_room.name}__ voice channel then __run `!q join` again__\n(if you are in Gould-Simpson waiting for office hours use `!q join-inperson` instead)", CmdPrefix.WARNING)
-            await self._send(channel, f"{user.get_mention()} Please join the __{self._waiting_room.name}__ voice channel then __run `!q join` again__", CmdPrefix.WARNING)
+        if self._config.CHECK_VOICE_WAITING and not in_voice_channel(user, channel, self._config.VOICE_WAITING):
+            # await self.send(channel, f"{user.get_mention()} Please join the __{self._config.VOICE_WAITING}__ voice channel then __run `!q join` again__\n(if you are in Gould-Simpson waiting for office hours use `!q join-inperson` instead)", CmdPrefix.WARNING)
+            await self._send(channel, f"{user.get_mention()} Please join the __{self._config.VOICE_WAITING}__ voice channel then __run `!q join` again__", CmdPrefix.WARNING)
             return False
+        if self._engine is not None:
+            return await self._engine_join(user, channel, inperson=False)
 
         queue = self.get_queue(channel)
 
         if user in queue:
-            index = queue.index(user)
-            q_user = queue[index]
+            index = queue.position(user) - 1
+            q_user = queue.get(user)
+            if await self._change_course(q_user, queue, channel, course):
+                return False
             if not q_user.is_inperson():
                 await self._send(channel, f"{user.get_mention()} you are already in the queue at position #{index+1}", CmdPrefix.WARNING)
             else:
                 q_user.set_inperson(False)
+                queue.touch(q_user.get_uuid())
                 await self._send(channel, f"{user.get_mention()} status changed to *online* (position in queue: {index+1})", CmdPrefix.SUCCESS)
             return False
 
+        user.set_course(course)
+        if not await self._admit(user, channel, queue):
+            return False
         queue.append(user)
-        self._join_times[user.get_uuid()] = datetime.now()
+        self._join_times[user.get_uuid()] = user.get_join_time()
+        self._joined(channel.guild.id, queue, user)
 
         if len(queue) == 1:
             await self._alert_avail_tas(channel)
         await self._send(channel, f"""{user.get_mention()} you have been added at position #{len(queue)} *(online)*\n*Please stay in the voice channel while you wait*""", CmdPrefix.SUCCESS)
+        await self.dispatch_students(channel.guild)
         return True
 
-    async def _q_join_inperson(self, user, channel):
+    async def _q_join_inperson(self, user, channel, course=None):
         """
         If a user sends "!q join-inperson", attempt to add them to the queue
         The user must be within the config.WAITING_ROOM voice channel before joining
@@ -468,25 +1743,37 @@ class QueueBot(discord.Client):
         Parameters:
             user: DiscordUser object representing the user who ran the command
             channel: discord.py channel object to send message to
+            course: optional config.COURSES course ("!q join-inperson csc110")
 
         Returns: True if the user is added to the queue
         """
+        if not await self._check_course(user, channel, course):
+            return False
+        if self._engine is not None:
+            return await self._engine_join(user, channel, inperson=True)
 
         queue = self.get_queue(channel)
 
         if user in queue:
-            index = queue.index(user)
-            q_user = queue[index]
+            index = queue.position(user) - 1
+            q_user = queue.get(user)
+            if await self._change_course(q_user, queue, channel, course):
+                return False
             if q_user.is_inperson():
                 await self._send(channel, f"{user.get_mention()} you are already in the queue at position #{index+1}", CmdPrefix.WARNING)
             else:
                 q_user.set_inperson(True)
+                queue.touch(q_user.get_uuid())
                 await self._send(channel, f"{user.get_mention()} status changed to __*in-person*__ (position in queue: {index+1})", CmdPrefix.SUCCESS)
             return False
 
         user.set_inperson(True)
+        user.set_course(course)
+        if not await self._admit(user, channel, queue):
+            return False
         queue.append(user)
-        self._join_times[user.get_uuid()] = datetime.now()
+        self._join_times[user.get_uuid()] = user.get_join_time()
+        self._joined(channel.guild.id, queue, user)
 
         self._logger.debug("Queue length after adding user = " + str(len(queue)))
         if len(queue) == 1:
@@ -494,6 +1781,95 @@ class QueueBot(discord.Client):
         await self._send(channel, f"""{user.get_mention()} you have been added at position #{len(queue)} *(in-person)*""", CmdPrefix.SUCCESS)
         return True
 
+    async def _engine_join(self, user, channel, inperson):
+        """
+        "!q join" and "!q join-inperson" when the queue is kept by a queue engine (see queue_engine.py)
+        The voice channel checks are done by the caller since only the bot knows about voice channels
+
+        Returns: True if the user is added to the queue
+        """
+        mode = "in-person" if inperson else "online"
+        result = await self._engine.call("join", guild=channel.guild.id, user=user.to_dict(), inperson=inperson)
+        position = result["position"]
+        if result["status"] == "already":
+            await self._send(channel, f"{user.get_mention()} you are already in the queue at position #{position}", CmdPrefix.WARNING)
+            return False
+        if result["status"] == "changed":
+            status = "__*in-person*__" if inperson else "*online*"
+            await self._send(channel, f"{user.get_mention()} status changed to {status} (position in queue: {position})", CmdPrefix.SUCCESS)
+            return False
+
+        if result["length"] == 1:
+            await self._alert_avail_tas(channel)
+        stay = "" if inperson else "\n*Please stay in the voice channel while you wait*"
+        await self._send(channel, f"{user.get_mention()} you have been added at position #{position} *({mode})*{stay}", CmdPrefix.SUCCESS)
+        return True
+
+    async def _engine_next(self, user, channel, tag):
+        """
+        "!q next [mode]" when the queue is kept by a queue engine. The engine doesn't know
+        who is in voice, so "!q next voice" isn't available
+
+        Returns: True if a user is removed
+        """
+        if tag is not None and tag not in ENGINE_NEXT_MODES:
+            await self._send(channel, f"{user.get_mention()} {MSG_ENGINE_UNSUPPORTED}", CmdPrefix.WARNING)
+            return False
+        result = await self._engine.call("next", guild=channel.guild.id, server=channel.guild.name, ta=user.get_name(), mode=tag)
+        if result["user"] is None:
+            await self._send(channel, "Queue is empty" if tag is None else f"Nobody in the queue is {NEXT_MODE_NAMES[tag]}")
+            return False
+        await self._announce_next(user, channel, DiscordUser.from_dict(result["user"], self._clock), result["length"])
+        return True
+
+    async def _engine_list(self, channel, page):
+        """
+        "!q list [page]" when the queue is kept by a queue engine. Only the page is sent over
+        and there are no page reactions (pages are picked with "!q list <page>")
+
+        Returns: False (doesn't update queue)
+        """
+        start = (page - 1) * LIST_PAGE_SIZE
+        result = await self._engine.call("list", guild=channel.guild.id, start=start, stop=start + LIST_PAGE_SIZE)
+        pages = max(1, -(-result["length"] // LIST_PAGE_SIZE))
+        if page > pages:
+            # Past the end. Show the last page like _list_page() does
+            page = pages
+            start = (page - 1) * LIST_PAGE_SIZE
+            result = await self._engine.call("list", guild=channel.guild.id, start=start, stop=start + LIST_PAGE_SIZE)
+        users = [DiscordUser.from_dict(data, self._clock) for data in result["users"]]
+        reconciler = self._get_reconciler(channel.guild) if self._config.CHECK_VOICE_WAITING else None
+        await self._send(channel, embed=self._render_list_page(users, result["length"], reconciler, page, pages))
+        return False
+
+    async def _check_course(self, user, channel, course):
+        """
+        Make sure the course a student asked for is one of config.COURSES
+        (the course is ignored when there are no courses)
+
+        Returns: True if the course is valid or None
+        """
+        if course is None or not self._config.COURSES or course in self._config.COURSE_WEIGHTS:
+            return True
+        courses = ", ".join(f"`{name}`" for name, _ in self._config.COURSES)
+        await self._send(channel, f"{user.get_mention()} unknown course `{course}`. Courses: {courses}", CmdPrefix.WARNING)
+        return False
+
+    async def _change_course(self, q_user, queue, channel, course):
+        """
+        Move a student who is already in the queue to another course (they keep their place)
+
+        Returns: True if their course changed
+        """
+        if course is None or not self._config.COURSES or course == self._course_of(q_user):
+            return False
+        q_user.set_course(course)
+        queue.touch(q_user.get_uuid())
+        self._joined(channel.guild.id, queue, q_user)
+        await self._send(channel, f"{q_user.get_mention()} course changed to `{course}` (position in queue: {queue.position(q_user)})",
+                         CmdPrefix.SUCCESS)
+        return True
+
     async def _q_leave(self, user, channel):
         """
         If a user sends "!q leave", attempt to remove them to the queue
@@ -505,14 +1881,26 @@ class QueueBot(discord.Client):
 
         Returns: True if the user is removed from the queue
         """
+        if self._engine is not None:
+            result = await self._engine.call("leave", guild=channel.guild.id, server=channel.guild.name, uuid=user.get_uuid())
+            if result["removed"]:
+                await self._send(channel, f"{user.get_mention()} you have been removed from the queue", CmdPrefix.SUCCESS)
+            else:
+                await self._send(channel, f"{user.get_mention()} you can not be removed from the queue because you never joined it", CmdPrefix.WARNING)
+            return result["removed"]
 
         queue = self.get_queue(channel)
 
         if user in queue:
+            position = queue.position(user)
             queue.remove(user)
+            self._left_queue(channel.guild, queue, user, position)
             await self._send(channel, f"{user.get_mention()} you have been removed from the queue", CmdPrefix.SUCCESS)
-            await log_session(user.get_name(), self._join_times.get(user.get_uuid(), None), None, "leave", channel.guild.name)
+            await log_session(user.get_name(), self._join_times.pop(user.get_uuid(), None), None, "leave", channel.guild.name, self._clock)
             return True
+        elif channel.guild.id in self._admissions and self._admissions[channel.guild.id].leave_waitlist(user.get_uuid()):
+            await self._send(channel, f"{user.get_mention()} you have been removed from the waitlist", CmdPrefix.SUCCESS)
+            return False
         else:
             await self._send(channel, f"{user.get_mention()} you can not be removed from the queue because you never joined it", CmdPrefix.WARNING)
             return False
@@ -528,72 +1916,238 @@ class QueueBot(discord.Client):
 
         Returns: False (doesn't update queue)
         """
+        if self._engine is not None:
+            position = (await self._engine.call("position", guild=channel.guild.id, uuid=user.get_uuid()))["position"]
+            if position is not None:
+                await self._send(channel, f"{user.get_mention()} you are at position #{position}")
+            else:
+                await self._send(channel, f"{user.get_mention()} you are not in the queue")
+            return False
 
         queue = self.get_queue(channel)
 
+        admission = self._admissions.get(channel.guild.id)
+        waitlisted = admission.waitlist_position(user.get_uuid()) if admission is not None else None
         if user in queue:
-            index = queue.index(user) + 1
+            index = queue.position(user)
             await self._send(channel, f"{user.get_mention()} you are at position #{index}")
+        elif waitlisted is not None:
+            await self._send(channel, f"{user.get_mention()} you are at position #{waitlisted} on the waitlist")
         else:
             await self._send(channel, f"{user.get_mention()} you are not in the queue")
 
         return False
 
-    async def _q_next(self, user, channel):
+    async def _q_notify(self, user, channel, position=None):
+        """
+        If a user sends "!q notify [position]", send them a Direct Message when they reach
+        that position in the queue (NOTIFY_DEFAULT_POSITION if no position is given)
+        "!q notify off" turns it off
+        *Can be run by anyone*
+
+        Parameters:
+            user: DiscordUser object representing the user who ran the command
+            channel: discord.py channel object to send message to
+            position: the position as typed by the user (None if it was left out)
+
+        Returns: False (doesn't update queue)
+        """
+        if self._engine is not None:
+            await self._send(channel, f"{user.get_mention()} {MSG_ENGINE_UNSUPPORTED}", CmdPrefix.WARNING)
+            return False
+        queue = self.get_queue(channel)
+        notifier = self._get_notifier(channel.guild)
+
+        if position == "off":
+            if notifier.unsubscribe(user.get_uuid()):
+                await self._send(channel, f"{user.get_mention()} you will not be notified", CmdPrefix.SUCCESS)
+            else:
+                await self._send(channel, f"{user.get_mention()} you did not ask to be notified", CmdPrefix.WARNING)
+            return False
+
+        try:
+            position = NOTIFY_DEFAULT_POSITION if position is None else int(position.lstrip("#"))
+            if not 1 <= position <= NOTIFY_MAX_POSITION:
+                raise ValueError()
+        except ValueError:
+            await self._send(channel, f"{user.get_mention()} invalid syntax. Type `!q notify N` to be notified " +
+                             f"when you reach position N (1 to {NOTIFY_MAX_POSITION}) or `!q notify off`", CmdPrefix.WARNING)
+            return False
+
+        current = queue.position(user)
+        if current is None:
+            await self._send(channel, f"{user.get_mention()} you need to join the queue first", CmdPrefix.WARNING)
+        elif current <= position:
+            await self._send(channel, f"{user.get_mention()} you are already at position #{current}", CmdPrefix.WARNING)
+        else:
+            notifier.subscribe(user.get_uuid(), position)
+            await self._send(channel, f"{user.get_mention()} you will get a Direct Message when you reach position #{position}",
+                             CmdPrefix.SUCCESS)
+        return False
+
+    def _get_notifier(self, guild):
+        if guild.id not in self._notifiers:
+            self._notifiers[guild.id] = PositionNotifier(NOTIFY_MAX_POSITION)
+        return self._notifiers[guild.id]
+
+    def _left_queue(self, guild, queue, user, position):
+        """
+        Call after a user is removed from the queue. Queues "almost up" notifications
+        for the students who moved up to the position they asked for and lets waitlisted
+        students into the queue if there is room now
+
+        Parameters:
+            guild: discord.py server the queue belongs to
+            queue: the StudentQueue the user was removed from
+            user: the DiscordUser who was removed
+            position: position the user was at before they were removed
+
+        Returns: None
+        """
+        self._dispatcher.left(user.get_uuid())
+        notifier = self._notifiers.get(guild.id)
+        if notifier is not None and len(notifier) > 0:
+            notifier.unsubscribe(user.get_uuid())
+            for q_user in notifier.crossed(queue, position):
+                self._pending_notifications[q_user.get_uuid()] = guild
+            if self._pending_notifications and self._timers.get("notifications") is None:
+                self.schedule(NOTIFY_BATCH_SECONDS, self._send_notifications, key="notifications")
+
+        if len(queue) == 0 and guild.id in self._admissions:
+            self._admissions[guild.id].emptied()
+        self._promote_waitlist(guild, queue)
+
+    async def _send_notifications(self):
+        """
+        Send up to NOTIFY_BATCH_SIZE of the pending "almost up" Direct Messages (the rest are
+        sent NOTIFY_BATCH_SECONDS later). Positions are looked up when the message is sent
+
+        Returns: number of messages sent
+        """
+        batch = []
+        while self._pending_notifications and len(batch) < NOTIFY_BATCH_SIZE:
+            uuid = next(iter(self._pending_notifications))
+            batch.append((uuid, self._pending_notifications.pop(uuid)))
+        if self._pending_notifications:
+            self.schedule(NOTIFY_BATCH_SECONDS, self._send_notifications, key="notifications")
+
+        messages = []
+        for uuid, guild in batch:
+            queue = self._queues.get(guild.id)
+            position = queue.position(uuid) if queue is not None else None
+            member = guild.get_member(uuid)
+            if position is not None and member is not None:
+                messages.append((member, constants.MSG_ALMOST_UP.format(position=position, server=guild.name)))
+
+        failed = await self._send_dms(messages, action="notify")
+        return len(messages) - len(failed)
+
+    async def _q_next(self, user, channel, mode=None):
         """
         If a user sends "!q pop" or "!q next", removes the next person from the queue
+        "!q next voice", "!q next online" and "!q next inperson" remove the first person
+        who is online and in voice/online/in person instead (see NEXT_MODES). The people
+        in front of them keep their place. With config.COURSES, the course whose turn
+        it is gets picked first (see _pick_student())
         *Must be run by a TA*
 
         Parameters:
             user: DiscordUser object representing the user who ran the command
             channel: discord.py channel object to send message to
+            mode: optional key of NEXT_MODES
 
         Returns: True if a user is removed
         """
         queue = self.get_queue(channel)
 
+        if mode is not None and mode not in NEXT_MODES:
+            await self._send(channel, f"{user.get_mention()} invalid syntax. Use `!q next`, `!q next voice`, " +
+                             "`!q next online` or `!q next inperson`", CmdPrefix.WARNING)
+            return False
+        if self._engine is not None:
+            return await self._engine_next(user, channel, NEXT_MODES[mode] if mode is not None else None)
+
         if len(queue) == 0:
             await self._send(channel, "Queue is empty")
             return False
 
-        q_next = queue.popleft()
-        await log_session(q_next.get_name(), self._join_times.get(q_next.get_uuid(), None), user.get_name(), "next", channel.guild.name)
+        tag = NEXT_MODES[mode] if mode is not None else None
+        # Students config.AUTO_DISPATCH is moving to another TA's room are already taken
+        q_next = self._pick_student(channel.guild.id, queue, tag, skip=lambda q_user: self._dispatcher.is_moving(q_user.get_uuid()))
+        if q_next is None:
+            if tag is None:
+                await self._send(channel, "Everyone in the queue is being moved to a TA")
+            else:
+                await self._send(channel, f"Nobody in the queue is {NEXT_MODE_NAMES[tag]}")
+            return False
+        position = queue.position(q_next)
+        if position == 1:
+            queue.popleft()
+        else:
+            queue.remove(q_next)
+        self._helped(channel.guild.id, queue, q_next)
+        self._left_queue(channel.guild, queue, q_next, position)
+        await log_session(q_next.get_name(), self._join_times.pop(q_next.get_uuid(), None), user.get_name(), "next", channel.guild.name, self._clock)
+        await self._announce_next(user, channel, q_next, len(queue))
+        return True
 
+    async def _announce_next(self, user, channel, q_next, remaining):
+        """
+        Tell the channel who is next (after they were removed from the queue) and move them
+        into the TA's voice channel if they're online
+
+        Parameters:
+            user: DiscordUser of the TA
+            channel: discord.py channel to send messages to
+            q_next: DiscordUser who is next
+            remaining: number of people left in the queue
+
+        Returns: None
+        """
         # TODO Verify debug message is useful and easy to parse
         self._logger.debug(f"\t> Removing {q_next} from the queue. Total wait time was {q_next.get_wait_time()}")
         user_status = ""
 
         inperson = q_next.is_inperson()
-        incall = in_voice_channel(q_next, channel, self._waiting_room.name)
+        if self._config.CHECK_VOICE_WAITING:
+            incall = in_voice_channel(q_next, channel, self._config.VOICE_WAITING)
+        else:
+            # No waiting room to check against. Any voice channel is good enough to move them
+            member = get_user(channel, q_next.get_uuid())
+            incall = member is not None and member.voice is not None
         if inperson:
             user_status = "__*(in person)*__"
         elif self._config.CHECK_VOICE_WAITING:
             # TODO Use custom function for checking if user is in waiting room
             user_status = " (online and in voice)" if incall else " (online and **not** in voice)"
-        await self._send(channel, f"""The next person is {q_next.get_mention()}{user_status}\nRemaining people in the queue: {len(queue)}""")
+        announcement = f"""The next person is {q_next.get_mention()}{user_status}\nRemaining people in the queue: {remaining}"""
+        if _interaction_replies.get() is not None:
+            # A slash command's reply is only shown to the TA. The student has to be told (and pinged) in the channel
+            await self._send(channel, announcement, reply=False)
+            await self._send(channel, f"{q_next.get_name()} has been called", CmdPrefix.SUCCESS)
+        else:
+            await self._send(channel, announcement)
 
         if not inperson:
             if not incall:
                 await self._send(channel, f"""Cannot automatically move student because they are not in voice""")
-                return True
+                return
 
             # move them into the new vc
             user_to_move = channel.guild.get_member(q_next.get_uuid())
             ta_member = channel.guild.get_member(user.get_uuid())
 
-            # check if TA is in vc
-            if ta_member.voice is None:
-                await self._send(channel, f"""Cannot automatically move student because {ta_member.mention} is not in voice.""")
-                return True
+            # check if TA is in vc (members who are not in voice may not be cached after a warm start)
+            if ta_member is None or ta_member.voice is None:
+                await self._send(channel, f"""Cannot automatically move student because {user.get_mention()} is not in voice.""")
+                return
 
             voice_channel = ta_member.voice.channel
             if voice_channel is None:
-                return True
+                return
 
             await user_to_move.move_to(voice_channel)
 
-        return True
-
     async def _q_add_other(self, user, mentions, channel, in_person=False):
         """
         Run when a TA calls "!q add @user". It will add the specified user
@@ -615,19 +2169,28 @@ class QueueBot(discord.Client):
             return False
 
         author = mentions[0]
-        q_user = DiscordUser(author.id, author.name, author.discriminator, author.nick)
+        q_user = DiscordUser(author.id, author.name, author.discriminator, author.nick, clock=self._clock)
         q_user.set_inperson(in_person)
+        if self._engine is not None:
+            result = await self._engine.call("join", guild=channel.guild.id, user=q_user.to_dict(), inperson=in_person, switch=False)
+            if result["status"] != "added":
+                await self._send(channel, f"{user.get_mention()} That person is already in the queue at position #{result['position']}", CmdPrefix.WARNING)
+                return False
+            await self._send(channel, f"{user.get_mention()} the person has been added at position #{result['position']}", CmdPrefix.SUCCESS)
+            return True
         queue = self.get_queue(channel)
 
         if q_user in queue:
-            index = queue.index(q_user)
+            index = queue.position(q_user)
             await self._send(channel, f"{user.get_mention()} That person is already in the queue at position #{index}", CmdPrefix.WARNING)
             return False
         else:
             queue.append(q_user)
-            self._join_times[q_user.get_uuid()] = datetime.now()
+            self._join_times[q_user.get_uuid()] = q_user.get_join_time()
+            self._joined(channel.guild.id, queue, q_user)
 
             await self._send(channel, f"{user.get_mention()} the person has been added at position #{len(queue)}", CmdPrefix.SUCCESS)
+            await self.dispatch_students(channel.guild)
             return True
 
     async def _q_remove_other(self, user, mentions, channel):
@@ -650,14 +2213,24 @@ class QueueBot(discord.Client):
             return False
 
         author = mentions[0]
-        q_user = DiscordUser(author.id, author.name, author.discriminator, author.nick)
+        q_user = DiscordUser(author.id, author.name, author.discriminator, author.nick, clock=self._clock)
+        if self._engine is not None:
+            result = await self._engine.call("remove", guild=channel.guild.id, server=channel.guild.name,
+                                             ta=user.get_name(), uuid=q_user.get_uuid())
+            if result["user"] is None:
+                await self._send(channel, f"{q_user.get_name()} is not in the queue", CmdPrefix.WARNING)
+                return False
+            await self._send(channel, f"{q_user.get_name()} has been removed from the queue", CmdPrefix.SUCCESS)
+            return True
         queue = self.get_queue(channel)
         # TODO Test removing a user from the beginning of the queue
 
         if q_user in queue:
+            position = queue.position(q_user)
             queue.remove(q_user)
+            self._left_queue(channel.guild, queue, q_user, position)
             await self._send(channel, f"{q_user.get_name()} has been removed from the queue", CmdPrefix.SUCCESS)
-            await log_session(q_user.get_name(), self._join_times.get(q_user.get_uuid(), None), user.get_name(), "remove", channel.guild.name)
+            await log_session(q_user.get_name(), self._join_times.pop(q_user.get_uuid(), None), user.get_name(), "remove", channel.guild.name, self._clock)
             return True
         else:
             await self._send(channel, f"{q_user.get_name()} is not in the queue", CmdPrefix.WARNING)
@@ -682,59 +2255,203 @@ class QueueBot(discord.Client):
             return False
         else:
             author = mentions[0]
-            q_user = DiscordUser(author.id, author.name, author.discriminator, author.nick)
+            q_user = DiscordUser(author.id, author.name, author.discriminator, author.nick, clock=self._clock)
+            if self._engine is not None:
+                await self._engine.call("front", guild=channel.guild.id, user=q_user.to_dict())
+                await self._send(channel, f"{q_user.get_name()} has been moved to the front of the queue", CmdPrefix.SUCCESS)
+                return True
             queue = self.get_queue(channel)
 
             if q_user in queue:
+                q_user.set_course(queue.get(q_user).get_course())
                 queue.remove(q_user)
             queue.appendleft(q_user)
+            self._joined(channel.guild.id, queue, q_user)
             # in this situation we do not want to change the join_time since they were already in the queue
 
             await self._send(channel, f"{q_user.get_name()} has been moved to the front of the queue", CmdPrefix.SUCCESS)
             return True
 
-    async def _q_list(self, user, channel):
+    async def _q_list(self, user, channel, page=None):
         """
-        When a user runs "!q list" it will send a discord embed containing the next
-        10 people within the list (people past 10 are not shown)
+        When a user runs "!q list [page]" it will send a discord embed containing
+        LIST_PAGE_SIZE people from the queue (the first page if no page is given)
+        If there is more than one page, reacting with LIST_PREVIOUS/LIST_NEXT flips
+        through them (see on_raw_reaction_add())
         *Can be run by anyone*
 
         Parameters:
             user: DiscordUser object representing the user who ran the command
-            mentions: list of mentions from the message object
             channel: discord.py channel object to send message to
+            page: page number from the command (string)
 
         Returns: False (doesn't update queue)
         """
-        # List the next 10 people within the queue in a nice formatted box (embed)
-        user_list = []
-        queue = self.get_queue(channel)
-        queue_length = len(queue)
+        if page is None:
+            page = 1
+        elif page.isdigit() and int(page) > 0:
+            page = int(page)
+        else:
+            await self._send(channel, f"{user.get_mention()} invalid syntax. Type `!q list` or `!q list <page>` (ex: `!q list 2`)",
+                             CmdPrefix.WARNING)
+            return False
+
+        if self._engine is not None:
+            return await self._engine_list(channel, page)
+        if self._overload.degraded:
+            # Plain text without the waiting room marks or page reactions
+            await self._send(channel, self._compact_list_page(channel.guild, page), allowed_mentions=discord.AllowedMentions.none())
+            return False
+
+        embed, page, pages = self._list_page(channel.guild, page)
+        message = await self._send(channel, embed=embed)
+        if message is not None and pages > 1:
+            self._list_messages[message.id] = (channel.guild.id, page)
+            while len(self._list_messages) > LIST_MESSAGES_TRACKED:
+                self._list_messages.popitem(last=False)
+            await message.add_reaction(LIST_PREVIOUS)
+            await message.add_reaction(LIST_NEXT)
+        return False
+
+    def _list_page(self, guild, page):
+        """
+        Get the "!q list" embed for a page of the queue. Only the users on the page
+        are looked up (see StudentQueue.slice()) and pages are kept in the render cache
+        until the queue or the waiting room changes, so repeated lists don't rebuild them
+
+        Parameters:
+            guild: discord.py server the queue belongs to
+            page: page number (1 is the front of the queue). Pages past the end show the last page
+
+        Returns: (discord.Embed, page number shown, number of pages)
+        """
+        queue = self._queues.get(guild.id)
+        if queue is None:
+            queue = self._queues[guild.id] = self._new_queue(guild.id)
+        pages = max(1, -(-len(queue) // LIST_PAGE_SIZE))
+        page = min(page, pages)
+
+        reconciler = self._get_reconciler(guild) if self._config.CHECK_VOICE_WAITING else None
+        version = (queue.version, reconciler.version if reconciler is not None else None)
+        start = (page - 1) * LIST_PAGE_SIZE
+        embed = self._render_cache.get((guild.id, "everyone", "list", page), version,
+                                       lambda: self._render_list_page(queue.slice(start, start + LIST_PAGE_SIZE), len(queue),
+                                                                      reconciler, page, pages))
+        return embed, page, pages
+
+    def _compact_list_page(self, guild, page):
+        """
+        Get the "!q list" text used while the bot is overloaded: names only (no waiting
+        room lookups) in one line
 
-        # Get list of first 10 people in queue
-        for i in range(0, min(10, queue_length)):
-            user: DiscordUser = queue[i]
+        Returns: the message content
+        """
+        queue = self._queues.get(guild.id)
+        if not queue:
+            return "Queue is empty"
+        pages = -(-len(queue) // LIST_PAGE_SIZE)
+        page = min(page, pages)
+
+        def render():
+            start = (page - 1) * LIST_PAGE_SIZE
+            names = ", ".join(f"{i}. {user.get_name()}" for i, user in enumerate(queue.slice(start, start + LIST_PAGE_SIZE), start + 1))
+            return f"Queue ({len(queue)}, page {page}/{pages}): {names}"
+        return self._render_cache.get((guild.id, "everyone", "compact", page), queue.version, render)
+
+    def _render_list_page(self, users, queue_length, reconciler, page, pages):
+        # users are the DiscordUsers on the page
+        start = (page - 1) * LIST_PAGE_SIZE
+        user_list = []
+        for i, user in enumerate(users, start + 1):
             user_metadata = ""
             if user.is_inperson():
                 user_metadata = " *__(in person)__*"
-            elif self._config.CHECK_VOICE_WAITING:
+            elif reconciler is not None:
                 #                Bold *
-                user_metadata = " ** * **" if not in_voice_channel(user, channel, self._waiting_room.name) else ""
+                user_metadata = " ** * **" if not reconciler.is_waiting(user.get_uuid()) else ""
 
-            user_list.append(f"**{i+1}.** {user.get_mention()}{user_metadata}")
+            user_list.append(f"**{i}.** {user.get_mention()}{user_metadata}")
 
-        if queue_length >= 11:
-            user_list.append(f"\n{queue_length-10} other(s) not shown")
-
-        if self._config.CHECK_VOICE_WAITING and queue_length > 0:
+        if reconciler is not None and queue_length > 0:
             user_list.append("\n** * ** = user not in voice channel")
 
         description = f"Total in queue: {queue_length}" if queue_length else "Queue is empty"
 
         embed = discord.Embed(title=f"Queue List", description=description)
         if queue_length > 0:
-            embed.add_field(name="Next 10 people:", value="\n".join(user_list), inline=False)
-        await self._send(channel, embed=embed)
+            name = "Next 10 people:" if page == 1 else f"People {start + 1}-{min(start + LIST_PAGE_SIZE, queue_length)}:"
+            embed.add_field(name=name, value="\n".join(user_list), inline=False)
+        if pages > 1:
+            embed.set_footer(text=f"Page {page}/{pages}. React with {LIST_PREVIOUS}/{LIST_NEXT} or type !q list <page> to see other pages")
+        return embed
+
+    async def on_raw_reaction_add(self, payload):
+        """
+        Discord.py calls this when someone reacts to a message. Reacting to a recent
+        "!q list" message with LIST_PREVIOUS/LIST_NEXT shows the previous/next page
+
+        Returns: None
+        """
+        listed = self._list_messages.get(payload.message_id)
+        if listed is None or payload.user_id == self.user.id:
+            return
+        emoji = str(payload.emoji)
+        if emoji not in (LIST_PREVIOUS, LIST_NEXT):
+            return
+
+        guild_id, page = listed
+        guild = self.get_guild(guild_id)
+        channel = self.get_channel(payload.channel_id)
+        if guild is None or channel is None:
+            return
+        embed, page, _ = self._list_page(guild, max(1, page - 1 if emoji == LIST_PREVIOUS else page + 1))
+        self._list_messages[payload.message_id] = (guild_id, page)
+
+        message = channel.get_partial_message(payload.message_id)
+        await message.edit(embed=embed)
+        try:
+            await message.remove_reaction(emoji, discord.Object(payload.user_id))
+        except discord.HTTPException:
+            pass  # Needs the Manage Messages permission. They can remove it themselves
+
+    async def _q_board(self, user, channel):
+        """
+        Post the queue board: a message with Join, Leave and Position buttons (see
+        interactions.BOARD_COMPONENTS). The buttons keep working after restarts
+        *Must be run by a TA*
+
+        Parameters:
+            user: DiscordUser object representing the user who ran the command
+            channel: discord.py channel object to send message to
+
+        Returns: False (doesn't update queue)
+        """
+        if self._testing:
+            print("SEND:", constants.MSG_QUEUE_BOARD, "components:", [button["label"] for button in BOARD_COMPONENTS[0]["components"]])
+            return False
+
+        # This version of py-cord can't send components. Use the REST route directly
+        route = Route("POST", "/channels/{channel_id}/messages", channel_id=channel.id)
+        await self.http.request(route, json={"content": constants.MSG_QUEUE_BOARD, "components": BOARD_COMPONENTS})
+        return False
+
+    async def _q_stats(self, user, channel):
+        """
+        When a TA runs "!q stats", show the server's staffing metrics so far (see
+        _stats_lines()) without waiting for them to be logged at shutdown
+        *Must be run by a TA*
+
+        Parameters:
+            user: DiscordUser object representing the user who ran the command
+            channel: discord.py channel object to send message to
+
+        Returns: False (doesn't update queue)
+        """
+        lines = self._stats_lines(channel.guild.id)
+        if not lines:
+            await self._send(channel, f"{user.get_mention()} there are no stats for this server yet")
+            return False
+        await self._send(channel, "\n".join(lines), allowed_mentions=discord.AllowedMentions.none())
         return False
 
     async def _q_clear(self, user, channel):
@@ -749,14 +2466,7 @@ class QueueBot(discord.Client):
         Returns: True if queue cleared; False otherwise
         """
         def check(reaction, user):
-            # Couldn't get self.is_ta() working since it was an asynchronous routine
-            has_ta_role = False
-            for r in user.roles:
-                if r.name in self._config.TA_ROLES:
-                    has_ta_role = True
-                    break
-
-            if user == self.user or not has_ta_role:
+            if user == self.user or not self._is_ta(user.roles):
                 return False
             if str(reaction.emoji) == '✅':
                 return True
@@ -765,22 +2475,24 @@ class QueueBot(discord.Client):
 
         queue = self.get_queue(channel)
 
-        if len(queue) == 0:
+        # With a queue engine, clearing an empty queue just clears nobody
+        if len(queue) == 0 and self._engine is None:
             await self._send(channel, "Queue is already empty")
             return False
 
         if self._testing:
             print("In testing mode; Skipping confirmation message")
-            queue.clear()
+            await self._clear_queue(user.get_name(), channel)
             return True
 
         # TODO Convert message to constant
-        message = await self._send(channel, constants.MSG_QUEUE_CLEAR)
+        # Not a reply since it is edited once a TA answers (it can't share a message with other replies)
+        message = await self._send(channel, constants.MSG_QUEUE_CLEAR, reply=False)
 
         await message.add_reaction("✅")
         await message.add_reaction("❌")
         try:
-            _, user = await self.wait_for('reaction_add', timeout=60.0, check=check)
+            _, user = await self._wait_for('reaction_add', CLEAR_CONFIRM_SECONDS, check=check)
         except asyncio.TimeoutError:
             await message.edit(content="Clearing queue canceled")
             return False
@@ -789,33 +2501,172 @@ class QueueBot(discord.Client):
             self._logger.debug("Queue prior to clearing: " +
                               ", ".join(str(el) for el in queue))
 
-            for q_user in queue:
-                await log_session(q_user.get_name(), self._join_times[q_user.get_uuid()], user.display_name, "clear", channel.guild.name)
-                self._join_times[q_user.get_uuid()] = None
-
-            queue.clear()
-
+            await self._clear_queue(user.display_name, channel)
             await message.edit(content="Queue has been emptied")
             return True
 
+    async def _clear_queue(self, ta_name, channel):
+        """
+        Empty the queue and log every student in it with a single session log write
+
+        Parameters:
+            ta_name: display name of the TA who cleared the queue
+            channel: discord.py channel the command was sent in
+
+        Returns: None
+        """
+        if self._engine is not None:
+            await self._engine.call("clear", guild=channel.guild.id, server=channel.guild.name, ta=ta_name)
+            return
+        queue = self.get_queue(channel)
+        # Students added with "!q front" have no join time
+        records = [(q_user.get_name(), self._join_times.pop(q_user.get_uuid(), None), ta_name, "clear")
+                   for q_user in queue]
+        for q_user in queue:
+            self._dispatcher.left(q_user.get_uuid())
+        queue.clear()
+        self._notifiers.pop(channel.guild.id, None)
+        admission = self._admissions.get(channel.guild.id)
+        if admission is not None:
+            # The waitlist is cleared with the queue
+            records += [(w_user.get_name(), w_user.get_join_time(), ta_name, "clear") for w_user in admission.waitlist.values()]
+            admission.waitlist.clear()
+            admission.emptied()
+
+        await log_sessions(records, channel.guild.name, self._clock)
+
     async def _q_logs(self, user, channel):
-        discord_user = self.get_user(user.get_uuid())
+        discord_user = await self._resolve_user(user.get_uuid())
         self._logger.info("\t> Sent logs to " + user.get_name())
 
-        await self._send_dm(discord_user, None, log_message=False, file=f"logs/OH_logs_{channel.guild.name}.csv")
+        path = f"logs/OH_logs_{channel.guild.name}.csv"
+        if self._engine is not None:
+            # The engine writes the log (its path may be relative to another directory)
+            path = (await self._engine.call("logs", server=channel.guild.name))["path"]
+            if path is None:
+                await self._send(channel, f"{user.get_mention()} nothing has been logged yet", CmdPrefix.WARNING)
+                return False
+        await self._send_dm(discord_user, None, log_message=False, file=path)
         await self._send(channel, f"{user.get_mention()} QueueBot logs have been to your Direct Messages", CmdPrefix.SUCCESS)
         return False
 
+    async def _q_reload(self, user, channel):
+        """
+        When a TA runs "!q reload", re-read the config file and apply it
+        without restarting the bot (the queue is kept)
+        *Must be run by a TA*
+
+        Parameters:
+            user: DiscordUser object representing the user who ran the command
+            channel: discord.py channel object to send message to
+
+        Returns: False (doesn't update queue)
+        """
+        try:
+            keys = self.reload_config()
+        except ConfigError as e:
+            await self._send(channel, f"{user.get_mention()} config was not reloaded: {e}", CmdPrefix.ERROR)
+            return False
+
+        self._config_mtime = _get_mtime(self._config_path)
+        if keys:
+            await self._send(channel, f"{user.get_mention()} config reloaded. Changed: {', '.join(sorted(keys))}", CmdPrefix.SUCCESS)
+        else:
+            await self._send(channel, f"{user.get_mention()} config reloaded. Nothing changed", CmdPrefix.SUCCESS)
+        return False
+
+
+def _needs_members(config):
+    # Member (and voice state) events are only needed when the bot checks voice channels
+    return True if config.CHECK_VOICE_WAITING or config.ALERT_ON_FIRST_JOIN or config.AUTO_DISPATCH else False
+
+
+def _get_mtime(path):
+    if path is None:
+        return None
+    try:
+        return os.stat(path).st_mtime
+    except OSError:
+        return None
+
+
+def course_tag(tag, course):
+    """
+    Returns: the queue tag for students with tag (ex: "voice") in a course.
+             A tag of None means every student in the course
+    """
+    return f"{tag or 'course'}:{course}"
+
+
+def _first_student(queue, tag, skip):
+    """
+    Returns: the first DiscordUser in the queue with tag (anyone if tag is None) that
+             skip() is False for (None if there isn't one)
+    """
+    user = queue.first(tag) if tag is not None else (queue[0] if queue else None)
+    while user is not None and skip is not None and skip(user):
+        position = queue.position(user) + 1
+        if tag is not None:
+            user = queue.first(tag, position)
+        else:
+            user = queue.user_at(position) if position <= len(queue) else None
+    return user
+
+
+def _reply_groups(batch):
+    """
+    Split pending replies into the messages they are sent in. Replies with an embed
+    or their own allowed_mentions are sent on their own and the others are combined
+    up to MAX_MESSAGE_LENGTH
+
+    Parameters:
+        batch: list of (message, content, embed, allowed_mentions, future) replies
+
+    Returns: list of lists of replies
+    """
+    groups = []
+    length = 0
+    for reply in batch:
+        content, embed, allowed_mentions = reply[1], reply[2], reply[3]
+        if embed is not None or allowed_mentions is not None:
+            groups.append([reply])
+            length = MAX_MESSAGE_LENGTH  # Don't add to an embed's (or different mention settings') message
+            continue
+        size = len(content or "") + 1
+        if groups and length + size <= MAX_MESSAGE_LENGTH:
+            groups[-1].append(reply)
+            length += size
+        else:
+            groups.append([reply])
+            length = size
+    return groups
+
+
+def _render_help(role):
+    """
+    Returns: the "!q help" message for a role class ("ta" or "everyone")
+    """
+    commands = constants.MSG_HELP["STUDENT"]
+    if role == "ta":
+        commands += "\n\n" + constants.MSG_HELP["TA"]
+    return commands
+
+
+def _set_done(future):
+    if not future.done():
+        future.set_result(None)
+
 
 def get_user(channel, uuid):
     return channel.guild.get_member(uuid)
 
 
 def in_voice_channel(user: DiscordUser, message_channel, channel_name):
-    voice = get_user(message_channel, user.get_uuid()).voice
-    if voice is None:
+    member = get_user(message_channel, user.get_uuid())
+    # Members who are not cached are not in a voice channel (voice states always include the member)
+    if member is None or member.voice is None:
         return False
-    return voice.channel.name == channel_name
+    return member.voice.channel.name == channel_name
 
 
 def setup_loggers():
@@ -858,14 +2709,41 @@ def setup_loggers():
 
 def main():
     queue_logger = setup_loggers()
-    config = QueueConfig(get_config_json())
+    try:
+        config = QueueConfig(get_config_json())
+    except ConfigError as e:
+        print(e)
+        sys.exit(1)
     queue_logger.info(f"Config:\n{config}")
 
+    # A usable snapshot means the bot was shut down recently (see MAX_SNAPSHOT_AGE_SECONDS).
+    # Skip the slow parts of starting up
+    snapshot_path = get_snapshot_path()
+    options = WARM_START_OPTIONS if load_snapshot(snapshot_path) is not None else {}
+
     # Run Bot
-    client = QueueBot(config, queue_logger)
+    client = QueueBot(config, queue_logger, config_path=get_config_path(), snapshot_path=snapshot_path, **options)
+    loop = client.loop
 
-    # TODO Catch KeyboardInterrupt and gracefully shut down bot
-    client.run(config.SECRET_TOKEN)
+    # Shut down gracefully (see QueueBot.close()) when stopped by Ctrl+C or docker stop
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, lambda: asyncio.ensure_future(client.close()))
+        except (NotImplementedError, RuntimeError):
+            pass  # Not supported on Windows. Ctrl+C raises KeyboardInterrupt below instead
+
+    async def runner():
+        try:
+            await client.start(config.SECRET_TOKEN)
+        finally:
+            await client.close()
+
+    try:
+        loop.run_until_complete(runner())
+    except KeyboardInterrupt:
+        loop.run_until_complete(client.close())
+    finally:
+        loop.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,114 @@
+from clock import DEFAULT_CLOCK
+
+
+class WaitingRoomReconciler:
+    """
+    Keeps track of who is in a server's waiting room voice channel and compares it
+    against the queue. Students who sit in the waiting room without joining the queue
+    get reminded and online students who are in the queue but left the waiting room
+    are flagged for the TAs
+
+    Voice state changes (voice_update()) and queue changes (StudentQueue.pop_changes())
+    only mark uuids as dirty. reconcile() looks at the dirty uuids, so each check costs
+    O(changes) no matter how many people are in the waiting room or the queue
+
+    Parameters:
+        reminder_grace: seconds a student has to be waiting (but not in the queue) before they're reminded
+        absent_grace: seconds a student has to be gone from the waiting room before they're flagged
+        members: uuids of the members who are in the waiting room right now
+        clock: clock used to time the grace periods. Defaults to the system clock
+    """
+    def __init__(self, reminder_grace, absent_grace, members=(), clock=None):
+        self._reminder_grace = reminder_grace
+        self._absent_grace = absent_grace
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+
+        self._waiting = set(members)  # Voice state index: uuids in the waiting room
+        self.version = 0  # Changes every time someone joins or leaves the waiting room
+        now = self._clock.monotonic()
+        self._dirty = {uuid: now for uuid in self._waiting}  # uuid -> clock.monotonic() of the change
+        # uuid -> clock.monotonic() from when they were first seen. Entries are added in
+        # time order so the ones that are due are always at the front
+        self._unqueued = {}
+        self._absent = {}
+        # Already reminded/flagged. Cleared once the student leaves the waiting room/queue
+        self._reminded = set()
+        self._flagged = set()
+
+    def is_waiting(self, uuid):
+        """
+        Returns: True if the user is in the waiting room
+        """
+        return uuid in self._waiting
+
+    def voice_update(self, uuid, in_waiting_room):
+        """
+        Update the voice state index when someone joins or leaves the waiting room
+
+        Parameters:
+            uuid: ID of the member
+            in_waiting_room: True if the member is in the waiting room now
+
+        Returns: None
+        """
+        if in_waiting_room != (uuid in self._waiting):
+            self.version += 1
+        if in_waiting_room:
+            self._waiting.add(uuid)
+        else:
+            self._waiting.discard(uuid)
+            self._reminded.discard(uuid)  # Remind them again if they come back
+        self._dirty[uuid] = self._clock.monotonic()
+
+    def reconcile(self, queue, limit=None):
+        """
+        Compare the users that changed since the last call against the queue
+
+        Parameters:
+            queue: the server's StudentQueue
+            limit: most reminders to return (the rest are returned by later calls)
+
+        Returns: (uuids to remind about joining the queue, uuids to flag as not in the waiting room)
+        """
+        now = self._clock.monotonic()
+        dirty, self._dirty = self._dirty, {}
+        for uuid in queue.pop_changes():
+            dirty[uuid] = now  # Queue changes aren't timed. They happened since the last call
+
+        # Oldest changes first so the grace period timers stay in time order
+        for uuid, changed in sorted(dirty.items(), key=lambda item: item[1]):
+            user = queue.get(uuid)
+            waiting = uuid in self._waiting
+
+            if waiting and user is None:
+                if uuid not in self._unqueued and uuid not in self._reminded:
+                    self._unqueued[uuid] = changed
+            else:
+                self._unqueued.pop(uuid, None)
+            if not waiting:
+                self._reminded.discard(uuid)
+
+            # In-person students are not expected to be in voice
+            if user is not None and not waiting and not user.is_inperson():
+                if uuid not in self._absent and uuid not in self._flagged:
+                    self._absent[uuid] = changed
+            else:
+                self._absent.pop(uuid, None)
+                self._flagged.discard(uuid)
+
+        reminders = _pop_due(self._unqueued, now - self._reminder_grace, limit)
+        self._reminded.update(reminders)
+        flags = _pop_due(self._absent, now - self._absent_grace)
+        self._flagged.update(flags)
+        return reminders, flags
+
+
+def _pop_due(since, cutoff, limit=None):
+    due = []
+    for uuid, seen in since.items():
+        if seen > cutoff or (limit is not None and len(due) >= limit):
+            break
+        due.append(uuid)
+    for uuid in due:
+        del since[uuid]
+    return due
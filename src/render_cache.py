@@ -0,0 +1,70 @@
+from collections import OrderedDict
+
+
+class RenderCache:
+    """
+    Keeps messages and embeds the bot already built (ex: "!q list" pages and the
+    "!q help" text) so they're only built again when what they show changes
+
+    Every entry is stored with a version (ex: the StudentQueue's version). get()
+    returns the stored value if the version still matches and builds a new one
+    otherwise, so there's nothing to invalidate when the queue changes
+
+    Parameters:
+        max_entries: most entries to keep. The least recently used ones are dropped first
+    """
+    def __init__(self, max_entries=256):
+        self._max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (version, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, version, render):
+        """
+        Parameters:
+            key: what is being rendered. Usually (guild id, role class, name, ...)
+            version: anything that changes when the rendered value would (compared with ==)
+            render: function that builds the value when it isn't cached
+
+        Returns: the cached value or render()'s result
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[1]
+
+        self.misses += 1
+        value = render()
+        self._entries[key] = (version, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+        return value
+
+    def clear(self, guild_id=None):
+        """
+        Drop every entry (or only the entries whose key starts with guild_id)
+
+        Returns: None
+        """
+        if guild_id is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[0] == guild_id]:
+            del self._entries[key]
+
+    def stats(self):
+        """
+        Returns: dictionary with the number of hits, misses, entries and the hit rate (0-1)
+        """
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._entries),
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
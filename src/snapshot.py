@@ -0,0 +1,89 @@
+import os
+import json
+import tempfile
+
+from clock import DEFAULT_CLOCK
+
+# Bump when the snapshot format changes. Snapshots from other versions are ignored
+SNAPSHOT_VERSION = 1
+
+# Snapshots saved longer ago than this are ignored. The queue is only worth restoring
+# after a quick restart (students who waited longer have likely been helped or left)
+MAX_SNAPSHOT_AGE_SECONDS = 5 * 60
+
+
+def get_snapshot_path():
+    """
+    Returns: path to the queue snapshot file (next to config.json when running in Docker)
+    """
+    if os.environ.get("QUEUE_USE_ENV"):
+        return "/data/queue_snapshot.json"
+    return "queue_snapshot.json"
+
+
+def save_snapshot(state, path=None):
+    """
+    Write the bot's state to disk. The file is written to a temporary file first
+    and then renamed so a crash while saving never leaves a half written snapshot
+
+    Parameters:
+        state: JSON friendly dictionary (see QueueBot.get_snapshot())
+        path: file to write to. Defaults to get_snapshot_path()
+
+    Returns: None
+    """
+    path = path if path is not None else get_snapshot_path()
+    fd, tmp_path = tempfile.mkstemp(prefix=".queue_snapshot", dir=os.path.dirname(os.path.abspath(path)))
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(dict(state, version=SNAPSHOT_VERSION), f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def load_snapshot(path=None, clock=None):
+    """
+    Read a snapshot written by save_snapshot()
+
+    Parameters:
+        path: file to read. Defaults to get_snapshot_path()
+        clock: clock used to check the snapshot's age. Defaults to the system clock
+
+    Returns: the saved dictionary, or None if there is no usable snapshot (missing,
+             unreadable, from another version or saved more than MAX_SNAPSHOT_AGE_SECONDS ago)
+    """
+    path = path if path is not None else get_snapshot_path()
+    clock = clock if clock is not None else DEFAULT_CLOCK
+    try:
+        with open(path) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if not isinstance(state, dict) or state.get("version") != SNAPSHOT_VERSION:
+        return None
+    saved_at = state.get("saved_at")
+    if not isinstance(saved_at, (int, float)) or \
+            abs(clock.now().timestamp() - saved_at) > MAX_SNAPSHOT_AGE_SECONDS:
+        return None
+    return state
+
+
+def discard_snapshot(path=None):
+    """
+    Delete a snapshot once it was restored so later starts (ex: after a crash) don't
+    restore the same queue again
+
+    Parameters:
+        path: file to delete. Defaults to get_snapshot_path()
+
+    Returns: None
+    """
+    path = path if path is not None else get_snapshot_path()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
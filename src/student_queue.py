@@ -0,0 +1,432 @@
+import heapq
+from collections import deque
+
+
+def get_uuid(item):
+    """
+    Get the discord ID of a DiscordUser, a discord.py member/user or a plain ID
+
+    Returns: the ID
+    """
+    if hasattr(item, "get_uuid"):
+        return item.get_uuid()
+    if hasattr(item, "id"):
+        return item.id
+    return item
+
+
+def mode_tags(user):
+    """
+    Default tags of a queued user (see StudentQueue.first())
+
+    Returns: ("inperson",) or ("online",)
+    """
+    return ("inperson",) if user.is_inperson() else ("online",)
+
+
+class StudentQueue(deque):
+    """
+    The office hours queue. It is a deque of DiscordUsers that also keeps:
+        - a uuid -> DiscordUser index so "user in queue" and get() are O(1)
+        - a position index (Fenwick tree) so position() and user_at() are O(log n)
+        - a Fenwick tree per tag (ex: "online") so first() can find the first user
+          with a tag in O(log n) without walking everyone in front of them
+        - a sub-queue per tag (a min-heap of slots, which are a global sequence number
+          shared by every tag) so head() is O(1) amortized. The deque itself is the
+          merged FIFO view of every sub-queue
+        - a version number that changes every time the queue changes
+        - the uuids of users who were added/removed/changed since the last
+          pop_changes() call (used by the waiting room reconciler so it only
+          looks at what changed instead of the whole queue). Changes are only
+          recorded once something calls pop_changes(), so a queue without a
+          reconciler doesn't collect them forever
+
+    A user can only be in the queue once
+
+    Parameters:
+        users: DiscordUsers to start the queue with
+        tagger: function that returns the tags of a DiscordUser (see mode_tags()).
+                Tags are recomputed when a user is added, touched or retagged
+    """
+    def __init__(self, users=(), tagger=mode_tags):
+        super().__init__()
+        self._users = {}  # uuid -> DiscordUser
+        self._changes = None  # None until pop_changes() is called (nothing consumes the changes)
+        self.version = 0
+        self._tagger = tagger
+        self._tags_of = {}  # uuid -> frozenset of the user's tags
+        self._tag_trees = {}  # tag -> Fenwick tree over the same slots as the position index
+        # tag -> min-heap of the slots of users with the tag. Users who lose the tag or
+        # leave the queue are only dropped once they reach the top (see head())
+        self._heads = {}
+
+        # Position index. Every user gets a slot number when they're added (slots go up
+        # for append() and down for appendleft()) and the Fenwick tree counts which
+        # slots are in use, so a user's position is the number of used slots up to theirs
+        self._slot_of = {}  # uuid -> slot
+        self._user_at = {}  # slot -> DiscordUser
+        self._reindex(16)
+        self.extend(users)
+
+    def _reindex(self, capacity):
+        """
+        Give every user a new slot and rebuild the Fenwick tree with room for
+        capacity slots (half of the unused room at each end). O(n)
+        """
+        size = 1
+        while size < capacity:
+            size *= 2
+        self._size = size
+        self._origin = -((size - len(self)) // 2)  # Slot stored at tree index 1
+        self._lo = self._hi = self._origin + (size - len(self)) // 2  # Next free slots are lo - 1 and hi
+        self._slot_of.clear()
+        self._user_at.clear()
+
+        tree = [0] * (size + 1)
+        tag_trees = {tag: [0] * (size + 1) for tag in self._tag_trees}
+        for user in deque.__iter__(self):
+            uuid = user.get_uuid()
+            self._slot_of[uuid] = self._hi
+            self._user_at[self._hi] = user
+            tree[self._hi - self._origin + 1] = 1
+            for tag in self._tags_of.get(uuid, ()):
+                tag_trees.setdefault(tag, [0] * (size + 1))[self._hi - self._origin + 1] = 1
+            self._hi += 1
+        self._tree = _build(tree)
+        self._tag_trees = {tag: _build(tag_tree) for tag, tag_tree in tag_trees.items()}
+        # Slots were handed out in queue order so each sub-queue is already a valid heap
+        self._heads = {tag: [] for tag in self._tag_trees}
+        for slot in range(self._lo, self._hi):
+            for tag in self._tags_of.get(self._user_at[slot].get_uuid(), ()):
+                self._heads[tag].append(slot)
+
+    def _tree_add(self, slot, delta, tree=None):
+        tree = self._tree if tree is None else tree
+        i = slot - self._origin + 1
+        while i <= self._size:
+            tree[i] += delta
+            i += i & -i
+
+    def _prefix(self, slot, tree=None):
+        # Number of used slots up to (and including) slot
+        tree = self._tree if tree is None else tree
+        total = 0
+        i = slot - self._origin + 1
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    def _search(self, count, tree=None):
+        # First slot where the number of used slots reaches count
+        tree = self._tree if tree is None else tree
+        i = 0
+        step = self._size
+        while step:
+            if i + step <= self._size and tree[i + step] < count:
+                i += step
+                count -= tree[i]
+            step //= 2
+        return i + self._origin
+
+    def _added(self, user, left=False, index=True):
+        # Called after the user was added to the deque
+        uuid = user.get_uuid()
+        self._users[uuid] = user
+        if index:
+            if (left and self._lo - 1 < self._origin) or (not left and self._hi >= self._origin + self._size):
+                self._reindex(2 * len(self))  # Out of free slots. This indexes the new user too
+            else:
+                if left:
+                    self._lo -= 1
+                    slot = self._lo
+                else:
+                    slot = self._hi
+                    self._hi += 1
+                self._slot_of[uuid] = slot
+                self._user_at[slot] = user
+                self._tree_add(slot, 1)
+        self.touch(uuid)
+
+    def _removed(self, user, index=True):
+        uuid = user.get_uuid()
+        del self._users[uuid]
+        self._retag(uuid)  # Removes their tags (before their slot is freed)
+        if index:
+            slot = self._slot_of.pop(uuid)
+            del self._user_at[slot]
+            self._tree_add(slot, -1)
+        self.touch(uuid)
+
+    def position(self, item):
+        """
+        Parameters:
+            item: a DiscordUser, discord.py member or uuid
+
+        Returns: the user's position in the queue (1 is the front). None if they're not in the queue
+        """
+        slot = self._slot_of.get(get_uuid(item))
+        if slot is None:
+            return None
+        return self._prefix(slot)
+
+    def user_at(self, position):
+        """
+        Parameters:
+            position: position in the queue (1 is the front)
+
+        Returns: the DiscordUser at that position
+        Raises: IndexError if nobody is at that position
+        """
+        if not 1 <= position <= len(self):
+            raise IndexError("queue position out of range")
+        return self._user_at[self._search(position)]
+
+    def count(self, tag, position=None):
+        """
+        Parameters:
+            tag: tag to count (ex: "online")
+            position: only count the users up to this position (defaults to the whole queue)
+
+        Returns: number of users with the tag (O(log n))
+        """
+        tree = self._tag_trees.get(tag)
+        if tree is None or position == 0:
+            return 0
+        if position is None or position >= len(self):
+            return self._prefix(self._origin + self._size - 1, tree)
+        return self._prefix(self._search(position), tree)
+
+    def first(self, tag, start=1):
+        """
+        Find the first user with a tag without walking the queue (O(log n)). The
+        tags come from the queue's tagger (ex: "online" and "inperson" by default)
+
+        Parameters:
+            tag: tag to look for
+            start: position to start looking from (1 is the front)
+
+        Returns: the first DiscordUser with the tag at or after start (None if there isn't one)
+        """
+        if start <= 1:
+            return self.head(tag)
+        tree = self._tag_trees.get(tag)
+        if tree is None or start > len(self):
+            return None
+        count = self.count(tag, start - 1) + 1
+        if count > self.count(tag):
+            return None
+        return self._user_at[self._search(count, tree)]
+
+    def head(self, tag):
+        """
+        Get the first user with a tag from the tag's sub-queue (O(1) amortized)
+
+        Returns: the DiscordUser (None if nobody has the tag)
+        """
+        heap = self._heads.get(tag)
+        while heap:
+            user = self._user_at.get(heap[0])
+            if user is not None and tag in self._tags_of.get(user.get_uuid(), ()):
+                return user
+            heapq.heappop(heap)  # They left the queue or lost the tag
+        return None
+
+    def retag(self, item):
+        """
+        Recompute a user's tags (ex: after they join or leave a voice channel)
+        without counting it as a change to the queue
+
+        Returns: None
+        """
+        self._retag(get_uuid(item))
+
+    def _retag(self, uuid):
+        user = self._users.get(uuid)
+        old = self._tags_of.get(uuid, frozenset())
+        new = frozenset(self._tagger(user)) if user is not None else frozenset()
+        if new == old:
+            return
+        slot = self._slot_of.get(uuid)
+        if slot is not None:
+            for tag in old - new:
+                self._tree_add(slot, -1, self._tag_trees[tag])
+            for tag in new - old:
+                if tag not in self._tag_trees:
+                    self._tag_trees[tag] = [0] * (self._size + 1)
+                    self._heads[tag] = []
+                self._tree_add(slot, 1, self._tag_trees[tag])
+                heap = self._heads[tag]
+                heapq.heappush(heap, slot)
+                if len(heap) > 2 * len(self) + 32:
+                    self._compact(tag)
+        if new:
+            self._tags_of[uuid] = new
+        else:
+            self._tags_of.pop(uuid, None)
+
+    def slice(self, start, stop):
+        """
+        Get part of the queue without walking it from the front (O((stop - start) log n))
+
+        Parameters:
+            start: index of the first user (0 is the front)
+            stop: index after the last user
+
+        Returns: list of DiscordUsers (like list(queue)[start:stop])
+        """
+        start = max(start, 0)
+        stop = min(stop, len(self))
+        return [self.user_at(position) for position in range(start + 1, stop + 1)]
+
+    def _compact(self, tag):
+        # Drop the stale entries of a sub-queue so it doesn't grow past the queue's size
+        heap = [slot for slot in set(self._heads[tag]) if slot in self._user_at and
+                tag in self._tags_of.get(self._user_at[slot].get_uuid(), ())]
+        heapq.heapify(heap)
+        self._heads[tag] = heap
+
+    def touch(self, uuid):
+        """
+        Record that a user's entry changed without being added or removed
+        (ex: switching between online and in-person)
+
+        Returns: None
+        """
+        if self._changes is not None:
+            self._changes.add(uuid)
+        self.version += 1
+        self._retag(uuid)
+
+    def pop_changes(self):
+        """
+        The first call (and the first call after stop_changes()) starts recording
+        changes and returns everyone in the queue, since the caller hasn't seen them yet
+
+        Returns: set of uuids that were added, removed or touched since the last call
+        """
+        if self._changes is None:
+            self._changes = set()
+            return set(self._users)
+        changes, self._changes = self._changes, set()
+        return changes
+
+    def stop_changes(self):
+        """
+        Stop recording changes (ex: the reconciler that called pop_changes() was dropped)
+
+        Returns: None
+        """
+        self._changes = None
+
+    def get(self, item, default=None):
+        """
+        Parameters:
+            item: a DiscordUser, discord.py member or uuid
+
+        Returns: the queue's DiscordUser with the same uuid (default if they're not in the queue)
+        """
+        return self._users.get(get_uuid(item), default)
+
+    def uuids(self):
+        """
+        Returns: a (live) set-like view of the uuids in the queue
+        """
+        return self._users.keys()
+
+    def __contains__(self, item):
+        return get_uuid(item) in self._users
+
+    def append(self, user):
+        super().append(user)
+        self._added(user)
+
+    def appendleft(self, user):
+        super().appendleft(user)
+        self._added(user, left=True)
+
+    def extend(self, users):
+        for user in users:
+            self.append(user)
+
+    def extendleft(self, users):
+        for user in users:
+            self.appendleft(user)
+
+    def insert(self, index, user):
+        super().insert(index, user)
+        self._added(user, index=False)
+        self._reindex(2 * len(self))  # There's no free slot in the middle
+
+    def pop(self):
+        user = super().pop()
+        self._removed(user)
+        return user
+
+    def popleft(self):
+        user = super().popleft()
+        self._removed(user)
+        return user
+
+    def remove(self, item):
+        """
+        Remove a user by their position instead of comparing them against everyone
+        in front of them. Finding the position is O(log n). Deleting from the middle
+        of the deque still moves the users between them and the nearest end, which is
+        O(min(i, n - i)) but done in C without calling DiscordUser.__eq__()
+
+        Raises: ValueError if the user is not in the queue
+        """
+        user = self._users.get(get_uuid(item))
+        if user is None:
+            raise ValueError(f"{item} is not in the queue")
+        super().__delitem__(self.position(user) - 1)
+        self._removed(user)
+
+    def clear(self):
+        if self._changes is not None:
+            self._changes.update(self._users)
+        self._users.clear()
+        self._tags_of.clear()
+        super().clear()
+        self._reindex(16)
+        self.version += 1
+
+    def __delitem__(self, index):
+        user = self[index]
+        super().__delitem__(index)
+        self._removed(user)
+
+    def __setitem__(self, index, user):
+        old = self[index]
+        slot = self._slot_of[old.get_uuid()]
+        super().__setitem__(index, user)
+        self._removed(old, index=False)
+        del self._slot_of[old.get_uuid()]
+        # The slot is filled in first so _added() puts the user's tags in the tag trees
+        self._slot_of[user.get_uuid()] = slot
+        self._user_at[slot] = user
+        self._added(user, index=False)
+
+    def rotate(self, n=1):
+        super().rotate(n)
+        self._reindex(2 * len(self))
+        self.version += 1
+
+    def reverse(self):
+        super().reverse()
+        self._reindex(2 * len(self))
+        self.version += 1
+
+    def __repr__(self):
+        return f"StudentQueue({list(self)})"
+
+
+def _build(tree):
+    # Turn a list of 0/1 counts (index 1 and up) into a Fenwick tree in O(n)
+    size = len(tree) - 1
+    for i in range(1, size + 1):
+        parent = i + (i & -i)
+        if parent <= size:
+            tree[parent] += tree[i]
+    return tree
@@ -0,0 +1,55 @@
+from clock import DEFAULT_CLOCK
+
+
+class Throttle:
+    """
+    A token bucket per user. Every user starts with `burst` tokens, each command uses
+    one and tokens come back at one per `interval` seconds (up to `burst`), so a user
+    can send a few commands in a row but not keep spamming them
+
+    Users whose bucket is full again are forgotten once more than `prune_at` users are
+    being tracked, so memory only depends on how many users are active
+
+    Parameters:
+        burst: most commands a user can send in a row
+        interval: seconds it takes to get a token back
+        clock: clock used to refill the buckets. Defaults to the system clock
+        prune_at: number of tracked users that triggers forgetting the idle ones
+    """
+    def __init__(self, burst, interval, clock=None, prune_at=1000):
+        self._burst = burst
+        self._interval = interval
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._prune_at = prune_at
+        self._next_prune = prune_at  # Grows if most users are still active so pruning stays O(1) on average
+        self._buckets = {}  # uuid -> (tokens, clock.monotonic() tokens was computed at)
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def _tokens(self, uuid, now):
+        tokens, since = self._buckets.get(uuid, (self._burst, now))
+        return min(self._burst, tokens + (now - since) / self._interval)
+
+    def allow(self, uuid):
+        """
+        Use one of the user's tokens
+
+        Returns: True if the user had a token (False means the command should be throttled)
+        """
+        now = self._clock.monotonic()
+        tokens = self._tokens(uuid, now)
+        if tokens < 1:
+            self._buckets[uuid] = (tokens, now)
+            return False
+
+        self._buckets[uuid] = (tokens - 1, now)
+        if len(self._buckets) > self._next_prune:
+            self._prune(now)
+        return True
+
+    def _prune(self, now):
+        idle = [uuid for uuid in self._buckets if self._tokens(uuid, now) >= self._burst]
+        for uuid in idle:
+            del self._buckets[uuid]
+        self._next_prune = max(self._prune_at, 2 * len(self._buckets))
@@ -0,0 +1,187 @@
+import math
+
+from clock import DEFAULT_CLOCK
+
+
+class Timer:
+    """
+    A callback scheduled with TimerWheel.schedule(). Use cancel() to stop it from running
+    """
+    __slots__ = ("deadline", "callback", "args", "key", "_tick", "_slot", "_wheel")
+
+    def __init__(self, wheel, deadline, callback, args, key):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.key = key
+        self._tick = None
+        self._slot = None  # The dictionary the timer is stored in (None once it ran or was cancelled)
+        self._wheel = wheel
+
+    @property
+    def active(self):
+        """
+        Returns: True if the timer has not run or been cancelled yet
+        """
+        return self._slot is not None
+
+    def cancel(self):
+        """
+        Stop the timer from running. Does nothing if it already ran or was cancelled
+
+        Returns: None
+        """
+        if self._slot is not None:
+            del self._slot[self]
+            self._wheel._forget(self)
+
+    def __repr__(self):
+        return f"Timer(deadline={self.deadline}, callback={getattr(self.callback, '__name__', self.callback)}, key={self.key})"
+
+
+class TimerWheel:
+    """
+    Keeps track of many timers (ex: one per student in the queue) with O(1)
+    schedule() and cancel(). Timers are put into buckets ("slots") by the tick they
+    expire on. Level 0 has one slot per tick, level 1 one slot per `slots` ticks,
+    level 2 one per `slots`**2 ticks and so on. When time reaches a higher level
+    slot its timers are moved down a level, so each timer is only moved a
+    handful of times no matter how far away it is
+
+    The wheel doesn't run anything on its own. Call expire() regularly (QueueBot
+    does it every TIMER_TICK_SECONDS) and run the timers it returns
+
+    Parameters:
+        tick: length of a tick in seconds (timers run up to one tick late)
+        slots: number of slots per level
+        levels: number of levels. Timers further away than tick * slots**levels seconds
+                are kept in a separate list until they're close enough
+        clock: clock the deadlines are measured with. Defaults to the system clock
+    """
+    def __init__(self, tick=1.0, slots=64, levels=4, clock=None):
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._tick_length = tick
+        self._slots = slots
+        self._levels = levels
+        # Each slot is a dictionary used as an ordered set (Timer -> None)
+        self._wheels = [[{} for _ in range(slots)] for _ in range(levels)]
+        self._overflow = {}
+        self._expired = {}  # Timers that were already due when they were scheduled
+        self._current = self._to_tick(self._clock.monotonic())
+        self._keys = {}  # key -> Timer
+        self._count = 0
+
+    def _to_tick(self, seconds):
+        return math.floor(seconds / self._tick_length)
+
+    def __len__(self):
+        """
+        Returns: number of timers waiting to run
+        """
+        return self._count
+
+    def schedule(self, delay, callback, *args, key=None):
+        """
+        Run callback(*args) after delay seconds
+
+        Parameters:
+            delay: seconds to wait
+            callback: function (or coroutine function) to run
+            args: arguments passed to callback
+            key: optional name for the timer. Scheduling a timer with the same key
+                 replaces the old one and the timer can be cancelled with cancel(key)
+
+        Returns: the Timer
+        """
+        if key is not None:
+            self.cancel(key)
+
+        timer = Timer(self, self._clock.monotonic() + max(0.0, delay), callback, args, key)
+        timer._tick = math.ceil(timer.deadline / self._tick_length)
+        self._place(timer)
+        self._count += 1
+        if key is not None:
+            self._keys[key] = timer
+        return timer
+
+    def cancel(self, key):
+        """
+        Cancel the timer scheduled with the given key (does nothing if there isn't one)
+
+        Returns: True if a timer was cancelled
+        """
+        timer = self._keys.get(key)
+        if timer is None:
+            return False
+        timer.cancel()
+        return True
+
+    def get(self, key):
+        """
+        Returns: the active timer scheduled with the given key (None if there isn't one)
+        """
+        return self._keys.get(key)
+
+    def _forget(self, timer):
+        timer._slot = None
+        self._count -= 1
+        if timer.key is not None and self._keys.get(timer.key) is timer:
+            del self._keys[timer.key]
+
+    def _place(self, timer):
+        delta = timer._tick - self._current
+        if delta <= 0:
+            slot = self._expired
+        else:
+            slot = self._overflow
+            span = self._slots
+            for level in range(self._levels):
+                if delta < span:
+                    slot = self._wheels[level][(timer._tick // (span // self._slots)) % self._slots]
+                    break
+                span *= self._slots
+        slot[timer] = None
+        timer._slot = slot
+
+    def _cascade(self, slot):
+        timers = list(slot)
+        slot.clear()
+        for timer in timers:
+            self._place(timer)
+
+    def expire(self):
+        """
+        Move the wheel up to the current time
+
+        Returns: list of the timers that are due (earliest deadline first). They are
+                 no longer active and the caller is responsible for running them
+        """
+        now = self._to_tick(self._clock.monotonic())
+        due = list(self._expired)
+        self._expired.clear()
+
+        while self._current < now:
+            if self._count == len(due):
+                self._current = now  # Nothing is scheduled. Skip ahead
+                break
+
+            self._current += 1
+            tick = self._current
+            span = self._slots ** self._levels
+            if tick % span == 0:
+                self._cascade(self._overflow)
+            for level in range(self._levels - 1, 0, -1):
+                span //= self._slots
+                if tick % span == 0:
+                    self._cascade(self._wheels[level][(tick // span) % self._slots])
+
+            due.extend(self._expired)
+            self._expired.clear()
+            slot = self._wheels[0][tick % self._slots]
+            due.extend(slot)
+            slot.clear()
+
+        for timer in due:
+            self._forget(timer)
+        due.sort(key=lambda timer: timer.deadline)
+        return due
@@ -0,0 +1,62 @@
+from collections import OrderedDict
+
+from clock import DEFAULT_CLOCK
+
+
+class TTLCache:
+    """
+    A dictionary that holds at most max_entries items and forgets items ttl seconds
+    after they were stored. When it is full the least recently used item is dropped
+
+    Used to remember discord.py users and Direct Message channels so sending a DM
+    doesn't need a REST request to look them up every time
+
+    Parameters:
+        max_entries: most items to keep
+        ttl: seconds an item is kept after it was stored
+        clock: clock used to time the items out. Defaults to the system clock
+    """
+    def __init__(self, max_entries, ttl, clock=None):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._items = OrderedDict()  # key -> (clock.monotonic() it expires at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        """
+        Returns: the item stored under key (default if there isn't one or it expired)
+        """
+        item = self._items.get(key)
+        if item is not None and item[0] > self._clock.monotonic():
+            self.hits += 1
+            self._items.move_to_end(key)
+            return item[1]
+        if item is not None:
+            del self._items[key]
+        self.misses += 1
+        return default
+
+    def put(self, key, value):
+        """
+        Store value under key (replacing the old value and restarting its ttl)
+
+        Returns: None
+        """
+        self._items[key] = (self._clock.monotonic() + self._ttl, value)
+        self._items.move_to_end(key)
+        while len(self._items) > self._max_entries:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """
+        Forget the item stored under key
+
+        Returns: the item (default if there wasn't one)
+        """
+        item = self._items.pop(key, None)
+        return item[1] if item is not None else default
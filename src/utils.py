@@ -1,11 +1,16 @@
-import time
-import discord
 import asyncio
 import csv
-from datetime import datetime, date
-
+import threading
+from datetime import datetime, timedelta
 from enum import Enum
 
+from clock import DEFAULT_CLOCK
+
+try:
+    import discord
+except ImportError:
+    discord = None  # The queue engine (queue_engine.py) runs without py-cord
+
 
 class CmdPrefix(Enum):
     """
@@ -29,14 +34,19 @@ class DiscordUser():
                        for the external representation of a user
                        example: For "someuser#1234", 1234 is the discriminator
         nick: nickname of the user if it's different than the username. None otherwise
+        inperson: True if the user is waiting in person
+        clock: clock used for join/wait times (see clock.py). Defaults to the system clock
+        course: name of the course the user is waiting for (see config.COURSES). None if not given
     """
-    def __init__(self, uuid, name, discriminator, nick, inperson=False):
+    def __init__(self, uuid, name, discriminator, nick, inperson=False, clock=None, course=None):
         self._uuid = uuid
         self._name = name
         self._discriminator = discriminator
         self._nick = nick
         self._inperson = inperson
-        self._join_time = time.time()  # Unix Timestamp (assuming it's run on Linux)
+        self._course = course
+        self._clock = clock if clock is not None else DEFAULT_CLOCK
+        self._join_time = self._clock.monotonic()
 
     def get_uuid(self):
         """
@@ -96,12 +106,26 @@ class DiscordUser():
         """
         self._inperson = state
 
+    def get_course(self):
+        """
+        Returns: the name of the course the user is waiting for (None if they didn't give one)
+        """
+        return self._course
+
+    def set_course(self, course):
+        """
+        Set the course the user is waiting for
+
+        Returns: None
+        """
+        self._course = course
+
     def get_join_time(self):
         """
-        Get the join time (as a unix timestamp via time.time()) from when the user was added to the queue.
+        Get the join time (as a clock.monotonic() timestamp) from when the user was added to the queue.
         The time is computed upon object instantiaion.
 
-        Return: join time unix timestamp (as a number)
+        Return: join time timestamp in seconds (as a number)
         """
         return self._join_time
 
@@ -111,7 +135,43 @@ class DiscordUser():
 
         Returns: the time the user waited in seconds
         """
-        return time.time() - self._join_time
+        return self._clock.monotonic() - self._join_time
+
+    def to_dict(self):
+        """
+        Save the user in a JSON friendly format (used for queue snapshots)
+        The join time is saved as a wall clock timestamp so time spent
+        while the bot was restarting still counts as waiting
+
+        Returns: dictionary that DiscordUser.from_dict() accepts
+        """
+        joined_at = self._clock.now() - timedelta(seconds=self.get_wait_time())
+        return {
+            "uuid": self._uuid,
+            "name": self._name,
+            "discriminator": self._discriminator,
+            "nick": self._nick,
+            "inperson": self._inperson,
+            "course": self._course,
+            "joined_at": joined_at.timestamp(),
+        }
+
+    @classmethod
+    def from_dict(cls, data, clock=None):
+        """
+        Create a user saved with DiscordUser.to_dict()
+
+        Parameters:
+            data: dictionary from to_dict()
+            clock: clock used for join/wait times. Defaults to the system clock
+
+        Returns: a DiscordUser
+        """
+        user = cls(data["uuid"], data["name"], data["discriminator"], data["nick"], data["inperson"], clock,
+                   data.get("course"))
+        waited = (user._clock.now() - datetime.fromtimestamp(data["joined_at"])).total_seconds()
+        user._join_time -= max(0.0, waited)
+        return user
 
     def __str__(self):
         """
@@ -121,7 +181,7 @@ class DiscordUser():
         return self.get_tag()
 
     def __repr__(self):
-        return f"DiscordUser({self.uuid}, {self.name}, {self.discriminator}, {self.nick}, inperson={self.inperson})"
+        return f"DiscordUser({self._uuid}, {self._name}, {self._discriminator}, {self._nick}, inperson={self._inperson})"
 
     def __eq__(self, other):
         """
@@ -138,36 +198,88 @@ class DiscordUser():
 
         if isinstance(other, DiscordUser):
             return self._uuid == other._uuid
-        elif isinstance(other, discord.member.Member):
+        elif discord is not None and isinstance(other, discord.member.Member):
             return self._uuid == other.id
 
         return other == self._uuid
 
 
-# log_session(user.get_mention(), self._join_times.get(user, None), None)
-async def log_session(name, join_time, ta, command_type, server_name):
-    lock = asyncio.Lock()
+def format_duration(seconds):
+    """
+    Format a duration as H:MM:SS.mmm (ex: 0:05:03.250)
+    """
+    millis = int(round(seconds * 1000))
+    hours, millis = divmod(millis, 3600 * 1000)
+    minutes, millis = divmod(millis, 60 * 1000)
+    secs, millis = divmod(millis, 1000)
+    return f"{hours}:{minutes:02d}:{secs:02d}.{millis:03d}"
+
+
+# Session log writes happen on worker threads (see log_sessions()). Only one may append at a time
+_session_log_lock = threading.Lock()
 
-    # time related data
-    current_time = datetime.now()
-    current_date = current_time.strftime("%B %d, %Y")
-    current_time = current_time.strftime("%H:%M")
+
+def _session_row(name, join_time, ta, command_type, now, monotonic):
+    current_date = now.strftime("%B %d, %Y")
+    current_time = now.strftime("%H:%M:%S")
 
     if join_time is None:
         join_time = "N/A"
         diff = "N/A"
     else:
-        # time spent waiting
-        join_time = join_time.strftime("%H:%M")
-        t1 = datetime.strptime(join_time, "%H:%M")
-        t2 = datetime.strptime(current_time, "%H:%M")
-        diff = t2 - t1
-        diff = str(diff)[:-3]
+        # time spent waiting (exact, rather than the difference between two rounded times)
+        wait = max(0.0, monotonic - join_time)
+        join_time = (now - timedelta(seconds=wait)).strftime("%H:%M:%S")
+        diff = format_duration(wait)
 
     if ta is None:
         ta = "N/A"
 
-    async with lock:
-        with open(f"logs/OH_logs_{server_name}.csv", 'a') as file:
+    return [name, current_date, join_time, ta, current_time, diff, command_type]
+
+
+def _append_rows(path, rows):
+    with _session_log_lock:
+        with open(path, 'a') as file:
             writer = csv.writer(file, delimiter='|')
-            writer.writerow([name, current_date, join_time, ta, current_time, diff, command_type])
+            writer.writerows(rows)
+
+
+async def log_sessions(records, server_name, clock=None):
+    """
+    Append rows about students leaving the queue to logs/OH_logs_<server_name>.csv
+    All rows are written with a single append on a worker thread so large batches
+    (ex: "!q clear" on a full queue) don't block the event loop
+
+    Parameters:
+        records: list of (name, join_time, ta, command_type) tuples (see log_session())
+        server_name: name of the discord server
+        clock: the clock the join times came from. Defaults to the system clock
+    """
+    clock = clock if clock is not None else DEFAULT_CLOCK
+    if not records:
+        return
+
+    # Every row in the batch is stamped with the same time
+    now = clock.now()
+    monotonic = clock.monotonic()
+    rows = [_session_row(name, join_time, ta, command_type, now, monotonic)
+            for name, join_time, ta, command_type in records]
+
+    await asyncio.get_event_loop().run_in_executor(None, _append_rows, f"logs/OH_logs_{server_name}.csv", rows)
+
+
+# log_session(user.get_name(), self._join_times.pop(uuid, None), None, "leave", guild.name, self._clock)
+async def log_session(name, join_time, ta, command_type, server_name, clock=None):
+    """
+    Append a row about a student leaving the queue to logs/OH_logs_<server_name>.csv
+
+    Parameters:
+        name: display name of the student
+        join_time: clock.monotonic() timestamp from when the student joined (None if unknown)
+        ta: display name of the TA who removed the student (None if they left on their own)
+        command_type: what removed the student (next, leave, remove, clear, etc.)
+        server_name: name of the discord server
+        clock: the clock join_time came from. Defaults to the system clock
+    """
+    await log_sessions([(name, join_time, ta, command_type)], server_name, clock)
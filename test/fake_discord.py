@@ -0,0 +1,614 @@
+"""
+An in-process stand-in for Discord's REST API and gateway
+
+py-cord connects to it like it would connect to Discord, so a real QueueBot
+(not in testing mode) goes through the whole discord.Client event path:
+IDENTIFY and intents, READY/GUILD_CREATE (and member chunking), on_ready,
+on_message filtering and real channel.send() awaits.
+
+Only the small part of the API QueueBot uses is implemented. Latency can be
+added to every REST response and gateway event, and message sends can be
+rate limited per channel (the client sees real 429 responses and
+X-Ratelimit headers).
+
+Example:
+    fake = FakeDiscord(latency=0.05)
+    guild = fake.add_guild("CS 120")
+    channel = fake.add_channel(guild, "join-queue")
+    student = fake.add_member(guild, "Wumpus")
+
+    await fake.start()
+    with fake.patch():
+        bot = QueueBot(config, logger, guild_ready_timeout=0.05)
+        task = await start_queuebot(fake, bot, config.SECRET_TOKEN)
+        await fake.send_message(channel, student, "!q join")
+        reply = await fake.wait_for_message(channel)
+"""
+
+import json
+import asyncio
+import itertools
+from time import monotonic
+from datetime import datetime, timezone
+from contextlib import contextmanager
+
+from aiohttp import web, WSMsgType
+import discord
+
+API_VERSION = 7
+
+# Gateway opcodes
+DISPATCH = 0
+HEARTBEAT = 1
+IDENTIFY = 2
+PRESENCE = 3
+RESUME = 6
+RECONNECT = 7
+REQUEST_MEMBERS = 8
+INVALIDATE_SESSION = 9
+HELLO = 10
+HEARTBEAT_ACK = 11
+
+TEXT_CHANNEL = 0
+DM_CHANNEL = 1
+VOICE_CHANNEL = 2
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).isoformat()
+
+
+class RateLimit:
+    """
+    Fixed window rate limit for a single bucket
+
+    Parameters:
+        limit: number of requests allowed per window
+        per: window length in seconds
+    """
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self._window_start = monotonic()
+        self._used = 0
+
+    def hit(self):
+        """
+        Use one request from the bucket
+
+        Returns: (allowed, remaining, reset_after)
+        """
+        now = monotonic()
+        if now - self._window_start >= self.per:
+            self._window_start = now
+            self._used = 0
+
+        reset_after = self.per - (now - self._window_start)
+        if self._used >= self.limit:
+            return False, 0, reset_after
+
+        self._used += 1
+        return True, self.limit - self._used, reset_after
+
+
+class FakeDiscord:
+    """
+    Local Discord REST and gateway server
+
+    Parameters:
+        latency: seconds added before every REST response and gateway event
+        rate_limit: (requests, seconds) allowed per channel when sending messages.
+                    None disables rate limiting
+        heartbeat_interval: gateway heartbeat interval in seconds
+        large: act like Discord does for large servers. GUILD_CREATE only includes members
+               who are in a voice channel and the rest must be requested (member chunking)
+    """
+    def __init__(self, latency=0.0, rate_limit=None, heartbeat_interval=41.25, large=False):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.heartbeat_interval = heartbeat_interval
+        self.large = large
+
+        self._ids = itertools.count(800000000000000000)
+        self._seq = 0
+        self._session_id = None
+        self._socket = None
+        self._runner = None
+        self._site = None
+        self._buckets = {}
+        self._message_waiters = []
+        self._identified = asyncio.Event()
+
+        self.port = None
+        self.bot_user = self._user_payload(self._next_id(), "QueueBot", "0001", bot=True)
+        self.guilds = {}  # guild id -> guild state
+        self.channels = {}  # channel id -> (guild id or None, channel payload)
+        self.users = {self.bot_user["id"]: self.bot_user}
+
+        # Statistics and history that tests/benchmarks can inspect
+        self.identifies = []  # IDENTIFY payloads received
+        self.resumes = 0
+        self.member_requests = 0  # REQUEST_MEMBERS (member chunking) received
+        self.presence_updates = []
+        self.sent_messages = []  # Messages the bot sent through the REST API
+        self.edited_messages = []  # Message edits the bot sent through the REST API
+        self.rate_limited = 0  # Number of 429 responses returned
+        self.commands = {}  # guild id -> slash commands the bot registered
+        self.interaction_responses = {}  # interaction id -> list of responses (callbacks and @original edits)
+        self.requests = 0  # Number of REST requests handled
+
+    # Building the fake server
+
+    def _next_id(self):
+        return str(next(self._ids))
+
+    def _user_payload(self, uuid, name, discriminator, bot=False):
+        return {"id": uuid, "username": name, "discriminator": discriminator,
+                "avatar": None, "bot": bot, "verified": True, "mfa_enabled": False, "flags": 0}
+
+    def add_guild(self, name):
+        """
+        Create a guild the bot is a member of
+
+        Returns: the guild id (as a string)
+        """
+        guild_id = self._next_id()
+        self.guilds[guild_id] = {
+            "name": name,
+            # @everyone shares its id with the guild
+            "roles": {guild_id: {"id": guild_id, "name": "@everyone", "permissions": "104324673",
+                                 "position": 0, "color": 0, "hoist": False, "managed": False, "mentionable": False}},
+            "channels": [],
+            "members": {},
+            "voice_states": {},
+        }
+        self._add_member(guild_id, self.bot_user, [])
+        return guild_id
+
+    def add_role(self, guild_id, name):
+        """
+        Returns: the role id (as a string)
+        """
+        roles = self.guilds[guild_id]["roles"]
+        role_id = self._next_id()
+        roles[role_id] = {"id": role_id, "name": name, "permissions": "0", "position": len(roles),
+                          "color": 0, "hoist": False, "managed": False, "mentionable": False}
+        return role_id
+
+    def add_channel(self, guild_id, name, voice=False):
+        """
+        Returns: the channel id (as a string)
+        """
+        channel_id = self._next_id()
+        channel = {"id": channel_id, "name": name, "position": len(self.guilds[guild_id]["channels"]),
+                   "permission_overwrites": [], "parent_id": None}
+        if voice:
+            channel.update({"type": VOICE_CHANNEL, "bitrate": 64000, "user_limit": 0, "rtc_region": None})
+        else:
+            channel.update({"type": TEXT_CHANNEL, "nsfw": False, "topic": None,
+                            "rate_limit_per_user": 0, "last_message_id": None})
+        self.guilds[guild_id]["channels"].append(channel)
+        self.channels[channel_id] = (guild_id, channel)
+        return channel_id
+
+    def add_member(self, guild_id, name, roles=(), nick=None):
+        """
+        Parameters:
+            roles: role ids the member has
+
+        Returns: the user id (as a string)
+        """
+        user = self._user_payload(self._next_id(), name, f"{len(self.users) % 10000:04d}")
+        self.users[user["id"]] = user
+        self._add_member(guild_id, user, roles, nick)
+        return user["id"]
+
+    def _add_member(self, guild_id, user, roles, nick=None):
+        self.guilds[guild_id]["members"][user["id"]] = {
+            "user": user, "nick": nick, "roles": list(roles),
+            "joined_at": _timestamp(), "deaf": False, "mute": False,
+        }
+
+    def _member_payload(self, guild_id, user_id):
+        member = dict(self.guilds[guild_id]["members"][user_id])
+        member.pop("user")
+        return member
+
+    def _voice_state_payload(self, guild_id, user_id, channel_id):
+        return {"guild_id": guild_id, "user_id": user_id, "channel_id": channel_id,
+                "session_id": "fake", "deaf": False, "mute": False, "self_deaf": False,
+                "self_mute": False, "self_video": False, "suppress": False}
+
+    async def set_voice_state(self, guild_id, user_id, channel_id):
+        """
+        Move a member into a voice channel (or out of voice when channel_id is None)
+        """
+        voice_states = self.guilds[guild_id]["voice_states"]
+        if channel_id is None:
+            voice_states.pop(user_id, None)
+        else:
+            voice_states[user_id] = channel_id
+
+        payload = self._voice_state_payload(guild_id, user_id, channel_id)
+        payload["member"] = dict(self.guilds[guild_id]["members"][user_id])
+        await self._dispatch("VOICE_STATE_UPDATE", payload)
+
+    def _guild_payload(self, guild_id):
+        guild = self.guilds[guild_id]
+        members = list(guild["members"].values())
+        if self.large:
+            members = [m for m in members if m["user"]["id"] in guild["voice_states"]]
+        return {
+            "id": guild_id, "name": guild["name"], "icon": None, "splash": None, "owner_id": self.bot_user["id"],
+            "region": "us-west", "afk_channel_id": None, "afk_timeout": 300, "verification_level": 0,
+            "default_message_notifications": 0, "explicit_content_filter": 0, "mfa_level": 0,
+            "features": [], "emojis": [], "premium_tier": 0, "system_channel_id": None,
+            "large": self.large, "unavailable": False, "member_count": len(guild["members"]),
+            "roles": list(guild["roles"].values()),
+            "channels": guild["channels"],
+            "members": members,
+            "voice_states": [self._voice_state_payload(guild_id, user_id, channel_id)
+                             for user_id, channel_id in guild["voice_states"].items()],
+            "presences": [],
+        }
+
+    # Lifecycle
+
+    @property
+    def api_url(self):
+        return f"http://127.0.0.1:{self.port}/api/v{API_VERSION}"
+
+    @property
+    def gateway_url(self):
+        return f"ws://127.0.0.1:{self.port}/gateway"
+
+    async def start(self):
+        """
+        Start listening on a random local port
+        """
+        app = web.Application()
+        app.router.add_get("/gateway", self._handle_gateway)
+        app.router.add_route("*", "/api/v{version}/{path:.*}", self._handle_rest)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        self._site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await self._site.start()
+        self.port = self._site._server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self._socket is not None and not self._socket.closed:
+            await self._socket.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    @contextmanager
+    def patch(self):
+        """
+        Point py-cord's REST routes at this server while the context is active
+        """
+        original = discord.http.Route.BASE
+        discord.http.Route.BASE = self.api_url
+        try:
+            yield self
+        finally:
+            discord.http.Route.BASE = original
+
+    # Gateway
+
+    async def _send(self, payload):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._socket is not None and not self._socket.closed:
+            await self._socket.send_str(json.dumps(payload))
+
+    async def _dispatch(self, event, data):
+        self._seq += 1
+        await self._send({"op": DISPATCH, "t": event, "s": self._seq, "d": data})
+
+    async def _handle_gateway(self, request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        self._socket = socket
+
+        await socket.send_str(json.dumps({"op": HELLO, "d": {"heartbeat_interval": self.heartbeat_interval * 1000}}))
+        async for msg in socket:
+            if msg.type != WSMsgType.TEXT:
+                continue
+            payload = json.loads(msg.data)
+            op, data = payload.get("op"), payload.get("d")
+
+            if op == HEARTBEAT:
+                await socket.send_str(json.dumps({"op": HEARTBEAT_ACK}))
+            elif op == IDENTIFY:
+                await self._identify(data)
+            elif op == RESUME:
+                self.resumes += 1
+                await self._dispatch("RESUMED", {"_trace": ["fake-discord"]})
+                self._identified.set()
+            elif op == REQUEST_MEMBERS:
+                self.member_requests += 1
+                await self._dispatch("GUILD_MEMBERS_CHUNK", {
+                    "guild_id": data["guild_id"], "chunk_index": 0, "chunk_count": 1, "nonce": data.get("nonce"),
+                    "members": list(self.guilds[str(data["guild_id"])]["members"].values())})
+            elif op == PRESENCE:
+                self.presence_updates.append(data)
+
+        if self._socket is socket:
+            self._socket = None
+        return socket
+
+    async def _identify(self, data):
+        self.identifies.append(data)
+        self._seq = 0
+        self._session_id = self._next_id()
+        await self._dispatch("READY", {
+            "v": 6, "user": self.bot_user, "session_id": self._session_id, "_trace": ["fake-discord"],
+            "guilds": [{"id": guild_id, "unavailable": True} for guild_id in self.guilds],
+            "private_channels": [], "relationships": [],
+        })
+        for guild_id in self.guilds:
+            await self._dispatch("GUILD_CREATE", self._guild_payload(guild_id))
+        self._identified.set()
+
+    async def wait_until_identified(self, timeout=10.0):
+        """
+        Wait until the bot has identified (or resumed) and received its guilds
+        """
+        await asyncio.wait_for(self._identified.wait(), timeout)
+
+    async def force_reconnect(self, resume=True):
+        """
+        Ask the bot to reconnect. The bot resumes its session when resume is True,
+        otherwise the session is invalidated and the bot has to identify again.
+        """
+        self._identified.clear()
+        if resume:
+            await self._send({"op": RECONNECT, "d": None})
+        else:
+            await self._send({"op": INVALIDATE_SESSION, "d": False})
+
+    async def disconnect(self):
+        """
+        Drop the gateway connection without warning (like a network blip)
+        """
+        self._identified.clear()
+        if self._socket is not None:
+            await self._socket.close(code=1011)
+
+    # Messages
+
+    def _message_payload(self, channel_id, author, content, mentions=(), embed=None, reference=None):
+        guild_id, _ = self.channels.get(channel_id, (None, None))
+        message = {
+            "id": self._next_id(), "channel_id": channel_id, "author": author, "content": content or "",
+            "timestamp": _timestamp(), "edited_timestamp": None, "tts": False, "mention_everyone": False,
+            "mentions": [], "mention_roles": [], "attachments": [], "embeds": [embed] if embed else [],
+            "pinned": False, "type": 0, "flags": 0,
+        }
+        if guild_id is not None:
+            message["guild_id"] = guild_id
+            message["member"] = self._member_payload(guild_id, author["id"])
+            for user_id in mentions:
+                mention = dict(self.users[user_id])
+                mention["member"] = self._member_payload(guild_id, user_id)
+                message["mentions"].append(mention)
+        if reference is not None:
+            message["message_reference"] = reference
+        return message
+
+    async def send_message(self, channel_id, author_id, content, mentions=()):
+        """
+        Have a member send a message (dispatches MESSAGE_CREATE to the bot)
+
+        Returns: The message payload
+        """
+        message = self._message_payload(channel_id, self.users[author_id], content, mentions)
+        await self._dispatch("MESSAGE_CREATE", message)
+        return message
+
+    async def add_reaction(self, channel_id, message_id, user_id, emoji):
+        """
+        Have a member react to a message (dispatches MESSAGE_REACTION_ADD to the bot)
+        """
+        guild_id = self.channels[channel_id][0]
+        payload = {"user_id": user_id, "channel_id": channel_id, "message_id": message_id,
+                   "emoji": {"id": None, "name": emoji}}
+        if guild_id is not None:
+            payload["guild_id"] = guild_id
+            payload["member"] = dict(self.guilds[guild_id]["members"][user_id])
+        await self._dispatch("MESSAGE_REACTION_ADD", payload)
+
+    async def send_interaction(self, channel_id, user_id, command=None, options=None, custom_id=None):
+        """
+        Have a member use a slash command (command and options) or click a button
+        (custom_id). Dispatches INTERACTION_CREATE to the bot
+
+        Returns: The interaction's ID
+        """
+        guild_id = self.channels[channel_id][0]
+        interaction_id = self._next_id()
+        payload = {
+            "id": interaction_id, "application_id": self.bot_user["id"], "token": f"token-{interaction_id}",
+            "version": 1, "channel_id": channel_id, "guild_id": guild_id,
+            "member": dict(self.guilds[guild_id]["members"][user_id]),
+        }
+        if custom_id is None:
+            payload["type"] = 2
+            payload["data"] = {"id": self._next_id(), "name": command, "type": 1,
+                               "options": [{"name": k, "value": v} for k, v in (options or {}).items()]}
+        else:
+            payload["type"] = 3
+            payload["data"] = {"custom_id": custom_id, "component_type": 2}
+        self.interaction_responses[interaction_id] = []
+        await self._dispatch("INTERACTION_CREATE", payload)
+        return interaction_id
+
+    async def wait_for_interaction(self, interaction_id, count=1, timeout=5.0):
+        """
+        Wait until the bot answered an interaction count times (a deferred reply answers twice)
+
+        Returns: list of the responses
+        """
+        deadline = asyncio.get_event_loop().time() + timeout
+        while len(self.interaction_responses[interaction_id]) < count:
+            if asyncio.get_event_loop().time() > deadline:
+                raise asyncio.TimeoutError()
+            await asyncio.sleep(0.005)
+        return self.interaction_responses[interaction_id]
+
+    async def wait_for_message(self, channel_id=None, timeout=5.0):
+        """
+        Wait for the next message the bot sends (optionally in a specific channel)
+
+        Returns: The message payload
+        """
+        future = asyncio.get_event_loop().create_future()
+        self._message_waiters.append((channel_id, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            self._message_waiters = [(c, f) for c, f in self._message_waiters if f is not future]
+
+    def _resolve_waiters(self, message):
+        for channel_id, future in self._message_waiters:
+            if not future.done() and channel_id in (None, message["channel_id"]):
+                future.set_result(message)
+                return
+
+    # REST API
+
+    def _json(self, data, status=200, headers=None):
+        # py-cord only decodes JSON when the content type is exactly application/json
+        headers = dict(headers or {}, **{"Content-Type": "application/json"})
+        return web.Response(body=json.dumps(data).encode("utf-8"), status=status, headers=headers)
+
+    def _not_found(self):
+        return self._json({"message": "404: Not Found", "code": 0}, status=404)
+
+    async def _read_body(self, request):
+        if request.content_type.startswith("multipart/"):
+            form = await request.post()
+            return json.loads(form.get("payload_json", "{}"))
+        if request.can_read_body:
+            return await request.json()
+        return {}
+
+    async def _handle_rest(self, request):
+        self.requests += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        method = request.method
+        parts = request.match_info["path"].strip("/").split("/")
+
+        if parts == ["gateway"] or parts == ["gateway", "bot"]:
+            return self._json({"url": self.gateway_url, "shards": 1})
+        if parts == ["users", "@me"]:
+            return self._json(self.bot_user)
+        if parts == ["oauth2", "applications", "@me"]:
+            return self._json({"id": self.bot_user["id"], "name": "QueueBot", "description": "", "icon": None,
+                               "rpc_origins": None, "bot_public": False, "bot_require_code_grant": False,
+                               "owner": self.bot_user, "summary": "", "verify_key": "", "team": None})
+        if len(parts) == 5 and parts[0] == "applications" and parts[4] == "commands" and method == "PUT":
+            self.commands[parts[3]] = await self._read_body(request)
+            return self._json(self.commands[parts[3]])
+        if len(parts) == 4 and parts[0] == "interactions" and parts[3] == "callback" and method == "POST":
+            if parts[1] not in self.interaction_responses:
+                return self._not_found()
+            self.interaction_responses[parts[1]].append(await self._read_body(request))
+            return web.Response(status=204)
+        if len(parts) == 5 and parts[0] == "webhooks" and parts[4] == "@original" and method == "PATCH":
+            interaction_id = parts[2][len("token-"):]
+            body = await self._read_body(request)
+            self.interaction_responses[interaction_id].append({"edit": body})
+            return self._json(self._message_payload(None, self.bot_user, body.get("content")))
+        if parts == ["users", "@me", "channels"] and method == "POST":
+            return await self._create_dm(request)
+        if len(parts) == 2 and parts[0] == "users":
+            return self._json(self.users[parts[1]]) if parts[1] in self.users else self._not_found()
+        if len(parts) == 3 and parts[0] == "channels" and parts[2] == "messages" and method == "POST":
+            return await self._create_message(request, parts[1])
+        if len(parts) == 4 and parts[0] == "channels" and parts[2] == "messages" and method == "PATCH":
+            body = await self._read_body(request)
+            message = self._message_payload(parts[1], self.bot_user, body.get("content"), embed=body.get("embed"))
+            message["id"] = parts[3]
+            self.edited_messages.append(message)
+            return self._json(message)
+        if len(parts) >= 6 and parts[0] == "channels" and parts[4] == "reactions":
+            return web.Response(status=204)
+        if len(parts) == 4 and parts[0] == "guilds" and parts[2] == "members" and method == "PATCH":
+            body = await self._read_body(request)
+            if "channel_id" in body:
+                channel = body["channel_id"]
+                asyncio.ensure_future(self.set_voice_state(parts[1], parts[3], None if channel is None else str(channel)))
+            return web.Response(status=204)
+
+        return self._not_found()
+
+    async def _create_dm(self, request):
+        body = await self._read_body(request)
+        recipient = self.users.get(str(body.get("recipient_id")))
+        if recipient is None:
+            return self._not_found()
+
+        channel_id = self._next_id()
+        channel = {"id": channel_id, "type": DM_CHANNEL, "recipients": [recipient], "last_message_id": None}
+        self.channels[channel_id] = (None, channel)
+        return self._json(channel)
+
+    async def _create_message(self, request, channel_id):
+        if channel_id not in self.channels:
+            return self._not_found()
+
+        headers = {}
+        if self.rate_limit is not None:
+            bucket = self._buckets.setdefault(channel_id, RateLimit(*self.rate_limit))
+            allowed, remaining, reset_after = bucket.hit()
+            headers = {
+                "X-Ratelimit-Bucket": f"messages-{channel_id}",
+                "X-Ratelimit-Limit": str(bucket.limit),
+                "X-Ratelimit-Remaining": str(remaining),
+                "X-Ratelimit-Reset-After": f"{reset_after:.3f}",
+            }
+            if not allowed:
+                self.rate_limited += 1
+                # py-cord treats a 429 without a Via header as a Cloudflare ban
+                headers["Via"] = "1.1 google"
+                return self._json({"message": "You are being rate limited.", "global": False,
+                                   "retry_after": reset_after * 1000}, status=429, headers=headers)
+
+        body = await self._read_body(request)
+        message = self._message_payload(channel_id, self.bot_user, body.get("content"),
+                                        embed=body.get("embed"), reference=body.get("message_reference"))
+        message["allowed_mentions"] = body.get("allowed_mentions")
+        message["components"] = body.get("components", [])
+        self.sent_messages.append(message)
+        self._resolve_waiters(message)
+
+        # Discord echoes the bot's own messages back through the gateway
+        if self.channels[channel_id][0] is not None:
+            asyncio.ensure_future(self._dispatch("MESSAGE_CREATE", message))
+        return self._json(message, headers=headers)
+
+
+async def start_queuebot(fake, bot, token, timeout=10.0):
+    """
+    Connect a QueueBot to a (started and patched) FakeDiscord and wait
+    until it is ready to process commands
+
+    Returns: The task running the bot (it finishes after bot.close())
+    """
+    task = asyncio.ensure_future(bot.start(token))
+    await fake.wait_until_identified(timeout)
+    await asyncio.wait_for(bot.wait_until_ready(), timeout)
+
+    # on_ready() is dispatched as its own task
+    deadline = monotonic() + timeout
+    while not bot._is_initialized:
+        if task.done():
+            task.result()  # Raise whatever stopped the bot
+        if monotonic() > deadline:
+            raise asyncio.TimeoutError("QueueBot did not finish on_ready()")
+        await asyncio.sleep(0.005)
+    return task
@@ -0,0 +1,122 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.admission import AdmissionControl, MIN_SERVICE_SAMPLES
+from src.queuebot import QueueBot, QueueConfig
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.clock = VirtualClock()
+        self.guild = MockGuild("admission")
+        self.channel = MockChannel("join-queue", self.guild)
+        self.guild.text_channels = [self.channel]
+        self.ta = MockAuthor("TA", None, ["UGTA"])
+        self.students = [MockAuthor(f"Student{i}", None) for i in range(6)]
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def make_bot(self, **changes):
+        self.bot = QueueBot(config.copy(**changes), MockLogger(), testing=True, clock=self.clock)
+
+    def command(self, content, author):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot._queue_command(MockMessage(content, author, self.channel)))
+            run(self.bot.run_timers())
+        return output.getvalue()
+
+    def test_service_interval(self):
+        admission = AdmissionControl(max_wait=600, clock=self.clock)
+        admission.joined()
+        for _ in range(MIN_SERVICE_SAMPLES):
+            self.assertIsNone(admission.projected_wait(1))
+            self.assertIsNone(admission.check(50))
+            self.clock.advance(120)
+            admission.helped(remaining=5)
+        self.assertEqual(admission.projected_wait(3), 360)
+        self.assertIsNone(admission.check(4))
+        self.assertEqual(admission.check(5), "wait")
+        self.assertIsNone(admission.check(0))
+
+        # Time with nobody waiting isn't counted
+        admission.helped(remaining=0)
+        self.clock.advance(3600)
+        admission.joined()
+        self.clock.advance(120)
+        admission.helped(remaining=1)
+        self.assertLess(admission.projected_wait(1), 120)
+
+    def test_waitlist(self):
+        self.make_bot(QUEUE_CAPACITY="2", OVERFLOW_WAITLIST="True")
+        first, second, third, fourth = self.students[:4]
+        self.command("!q join", first)
+        self.command("!q join-inperson", second)
+        output = self.command("!q join-inperson", third)
+        self.assertIn("queue is full (2 students) so you have been added to the waitlist at position #1", output)
+        self.assertIn("Students are being turned away or waitlisted", output)
+        self.assertIn("position #2", self.command("!q join", fourth))
+        self.assertIn("already on the waitlist at position #1", self.command("!q join", third))
+        self.assertIn("position #2 on the waitlist", self.command("!q position", fourth))
+
+        # Helping someone lets the first waitlisted student in (still in person)
+        output = self.command("!q next", self.ta)
+        self.assertIn(f"{third.mention} there is room in the queue now. You have been added at position #2", output)
+        queue = self.bot.get_queue(self.channel)
+        self.assertEqual([user.get_uuid() for user in queue], [second.id, third.id])
+        self.assertTrue(queue[1].is_inperson())
+
+        self.assertIn("removed from the waitlist", self.command("!q leave", fourth))
+        self.command("!q leave", second)
+        self.assertEqual(len(queue), 1)
+        stats = self.bot._admissions[self.guild.id].stats()
+        self.assertEqual((stats["waitlisted"], stats["promoted"], stats["waitlist_left"], stats["waitlist"]), (2, 1, 1, 0))
+
+        # The waitlist survives a restart
+        self.command("!q join", first)
+        self.command("!q join", fourth)
+        self.bot._config = self.bot._config.copy(QUEUE_CAPACITY="3")
+        snapshot = self.bot.get_snapshot()
+        self.make_bot(QUEUE_CAPACITY="2", OVERFLOW_WAITLIST="True")
+        self.bot._restore_snapshot(snapshot)
+        self.assertEqual(list(self.bot._admissions[self.guild.id].waitlist), [fourth.id])
+
+    def test_turned_away(self):
+        self.make_bot(QUEUE_CAPACITY="1")
+        self.command("!q join", self.students[0])
+        output = self.command("!q join", self.students[1])
+        self.assertIn("can't join the queue right now because the queue is full (1 students)", output)
+        self.command("!q join", self.students[2])
+        self.assertEqual(len(self.bot.get_queue(self.channel)), 1)
+        self.assertEqual(self.bot._admissions[self.guild.id].rejected_full, 2)
+
+        # TAs can still add students
+        run(self.bot._queue_command(MockMessage(f"!q add {self.students[1].mention}", self.ta, self.channel, [self.students[1]])))
+        self.assertEqual(len(self.bot.get_queue(self.channel)), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
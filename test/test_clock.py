@@ -0,0 +1,136 @@
+import io
+import os
+import sys
+import random
+import asyncio
+import tempfile
+import unittest
+from unittest import mock
+from contextlib import redirect_stdout
+from datetime import datetime
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, DiscordUser, log_sessions
+from src.clock import VirtualClock, SystemClock
+from src.utils import log_session, format_duration
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+        self.clock = VirtualClock(datetime(2021, 4, 5, 13, 0, 0))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def read_log(self, server_name):
+        with open(f"logs/OH_logs_{server_name}.csv") as f:
+            return [line.strip().split("|") for line in f]
+
+    def test_virtual_clock(self):
+        self.assertEqual(self.clock.monotonic(), 0.0)
+        self.clock.advance(90.5)
+        self.assertEqual(self.clock.monotonic(), 90.5)
+        self.assertEqual(self.clock.now(), datetime(2021, 4, 5, 13, 1, 30, 500000))
+
+        # set() never moves backwards
+        self.clock.set(datetime(2021, 4, 5, 13, 0, 0))
+        self.assertEqual(self.clock.monotonic(), 90.5)
+        self.clock.set(datetime(2021, 4, 5, 14, 0, 0))
+        self.assertEqual(self.clock.monotonic(), 3600.0)
+
+        with self.assertRaises(ValueError):
+            self.clock.advance(-1)
+
+        run(self.clock.sleep(60))
+        self.assertEqual(self.clock.now(), datetime(2021, 4, 5, 14, 1, 0))
+
+    def test_system_clock(self):
+        clock = SystemClock()
+        start, now = clock.monotonic(), clock.now()
+        run(clock.sleep(0.01))
+        self.assertTrue(clock.monotonic() - start >= 0.01)
+        self.assertTrue(clock.now() > now)
+
+        # now() follows the system time (ex: NTP corrections) instead of drifting with monotonic()
+        with mock.patch("src.clock.datetime") as system_time:
+            system_time.now.return_value = datetime(2021, 11, 7, 1, 30)
+            self.assertEqual(clock.now(), datetime(2021, 11, 7, 1, 30))
+
+    def test_wait_time(self):
+        user = DiscordUser(1234, "Wumpus", "0001", None, clock=self.clock)
+        self.clock.advance(12.25)
+        self.assertEqual(user.get_wait_time(), 12.25)
+
+    def test_format_duration(self):
+        self.assertEqual(format_duration(0), "0:00:00.000")
+        self.assertEqual(format_duration(303.25), "0:05:03.250")
+        self.assertEqual(format_duration(59.9999), "0:01:00.000")
+        self.assertEqual(format_duration(3600.5), "1:00:00.500")
+
+    def test_log_session(self):
+        join_time = self.clock.monotonic()
+        self.clock.advance(75.125)
+        run(log_session("Wumpus", join_time, "Russ", "next", "test", self.clock))
+        run(log_session("Otus", None, None, "leave", "test", self.clock))
+
+        self.assertEqual(self.read_log("test"), [
+            ["Wumpus", "April 05, 2021", "13:00:00", "Russ", "13:01:15", "0:01:15.125", "next"],
+            ["Otus", "April 05, 2021", "N/A", "N/A", "13:01:15", "N/A", "leave"],
+        ])
+
+    def test_bot_uses_clock(self):
+        bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        guild = MockGuild("clock")
+        channel = MockChannel("join-queue", guild)
+        student, ta = ALL_STUDENTS[0], ALL_TAS[0]
+
+        with io.StringIO() as buf, redirect_stdout(buf):
+            run(bot._queue_command(MockMessage("!q join", student, channel)))
+            self.clock.advance(600)
+            run(bot._queue_command(MockMessage("!q next", ta, channel)))
+
+        row = self.read_log("clock")[0]
+        self.assertEqual(row[2:], ["13:00:00", ta.name, "13:10:00", "0:10:00.000", "next"])
+
+    def test_clear_logs_batch(self):
+        bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        guild = MockGuild("clear")
+        channel = MockChannel("join-queue", guild)
+        ta = ALL_TAS[0]
+
+        # The bot's session log helpers (imported the way the bot imports them)
+        utils_module = sys.modules[log_sessions.__module__]
+        with io.StringIO() as buf, redirect_stdout(buf):
+            for student in ALL_STUDENTS[:3]:
+                run(bot._queue_command(MockMessage("!q join", student, channel)))
+                self.clock.advance(60)
+            # Students added with "!q front" have no join time
+            run(bot._queue_command(MockMessage("!q front", ta, channel, mentions=[ALL_STUDENTS[3]])))
+            with mock.patch.object(utils_module, "_append_rows", wraps=utils_module._append_rows) as append:
+                run(bot._queue_command(MockMessage("!q clear", ta, channel)))
+
+        names = [student.nick or student.name for student in ALL_STUDENTS[:4]]
+        ta_name = ta.nick or ta.name
+        self.assertEqual(append.call_count, 1)
+        self.assertEqual(len(bot.get_queue(channel)), 0)
+        self.assertEqual(self.read_log("clear"), [
+            [names[3], "April 05, 2021", "N/A", ta_name, "13:03:00", "N/A", "clear"],
+            [names[0], "April 05, 2021", "13:00:00", ta_name, "13:03:00", "0:03:00.000", "clear"],
+            [names[1], "April 05, 2021", "13:01:00", ta_name, "13:03:00", "0:02:00.000", "clear"],
+            [names[2], "April 05, 2021", "13:02:00", ta_name, "13:03:00", "0:01:00.000", "clear"],
+        ])
@@ -0,0 +1,151 @@
+import random
+import unittest
+from time import perf_counter
+from .utils import *
+
+from src.queuebot import QueueConfig, ConfigError, ResolvedConfig
+
+base_config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA", " Instructor "],
+    "TEXT_LISTENS": ["#join-queue"],
+    "CHECK_VOICE_WAITING": "True",
+    "VOICE_WAITING": "waiting-room",
+    "ALERT_ON_FIRST_JOIN": "True",
+    "TEXT_ALERT": "queue-alerts",
+    "VOICE_OFFICES": ["Office Hours Room 1", "Office Hours Room 2"],
+}
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.config = QueueConfig(base_config, test_mode=True)
+
+    def test_compiled_values(self):
+        self.assertEqual(self.config.TA_ROLES, ("UGTA", "Instructor"))
+        self.assertEqual(self.config.TA_ROLE_SET, frozenset(["UGTA", "Instructor"]))
+        self.assertEqual(self.config.TEXT_LISTEN_SET, frozenset(["join-queue"]))
+        self.assertEqual(self.config.VOICE_OFFICE_SET, frozenset(["Office Hours Room 1", "Office Hours Room 2"]))
+
+        # Options that are not used are None instead of missing
+        config = QueueConfig(dict(base_config, CHECK_VOICE_WAITING="False", ALERT_ON_FIRST_JOIN="False"))
+        self.assertIsNone(config.VOICE_WAITING)
+        self.assertIsNone(config.VOICE_OFFICES)
+        self.assertEqual(config.VOICE_OFFICE_SET, frozenset())
+
+        # AUTO_DISPATCH also needs the office rooms
+        config = QueueConfig(dict(base_config, ALERT_ON_FIRST_JOIN="False", AUTO_DISPATCH="True"))
+        self.assertEqual(config.VOICE_OFFICES, ("Office Hours Room 1", "Office Hours Room 2"))
+        with self.assertRaises(ConfigError):
+            QueueConfig(dict(base_config, ALERT_ON_FIRST_JOIN="False", AUTO_DISPATCH="True", VOICE_OFFICES=[]))
+
+        # Courses are lower case with a weight of 1 unless one is given
+        self.assertIsNone(self.config.COURSES)
+        config = QueueConfig(dict(base_config, COURSES=["CSC110:2", " csc120 "]))
+        self.assertEqual(config.COURSES, (("csc110", 2.0), ("csc120", 1.0)))
+        self.assertEqual(config.COURSE_WEIGHTS, {"csc110": 2.0, "csc120": 1.0})
+        for courses in (["csc110:0"], ["csc110:lots"], [":2"], ["csc110", "CSC110:3"]):
+            with self.assertRaises(ConfigError):
+                QueueConfig(dict(base_config, COURSES=courses))
+
+        # Queue limits are numbers
+        config = QueueConfig(dict(base_config, QUEUE_CAPACITY=" 40 ", MAX_WAIT_MINUTES="90.5", OVERFLOW_WAITLIST="True"))
+        self.assertEqual((config.QUEUE_CAPACITY, config.MAX_WAIT_MINUTES, config.OVERFLOW_WAITLIST), (40, 90.5, True))
+        self.assertIsNone(self.config.QUEUE_CAPACITY)
+        self.assertFalse(self.config.OVERFLOW_WAITLIST)
+        for limits in ({"QUEUE_CAPACITY": "0"}, {"QUEUE_CAPACITY": "2.5"}, {"MAX_WAIT_MINUTES": "-1"}):
+            with self.assertRaises(ConfigError):
+                QueueConfig(dict(base_config, **limits))
+
+        # The queue engine keeps the queue in another process
+        self.assertEqual(QueueConfig(dict(base_config, QUEUE_ENGINE=" queue_engine.sock ")).QUEUE_ENGINE, "queue_engine.sock")
+        self.assertIsNone(self.config.QUEUE_ENGINE)
+        with self.assertRaises(ConfigError):
+            QueueConfig(dict(base_config, QUEUE_ENGINE="queue_engine.sock", QUEUE_CAPACITY="40"))
+
+    def test_immutable(self):
+        with self.assertRaises(AttributeError):
+            self.config.TA_ROLES = ("Student",)
+        with self.assertRaises(AttributeError):
+            self.config.NEW_OPTION = True
+        with self.assertRaises(TypeError):
+            self.config.clean_config["TA_ROLES"] = ("Student",)
+
+        # Changing the dictionary a config was created from does not change the config
+        values = dict(base_config)
+        config = QueueConfig(values)
+        values["SECRET_TOKEN"] = "adifferenttoken"
+        self.assertEqual(config.SECRET_TOKEN, base_config["SECRET_TOKEN"])
+
+    def test_copy(self):
+        clone = self.config.copy()
+        self.assertIsNot(clone, self.config)
+        self.assertIs(clone.clean_config, self.config.clean_config)
+        self.assertIs(clone.TA_ROLE_SET, self.config.TA_ROLE_SET)
+        self.assertTrue(clone.TEST_MODE)
+        self.assertEqual(clone.changed_keys(self.config), set())
+
+        changed = self.config.copy(TA_ROLES=["UGTA"])
+        self.assertEqual(changed.TA_ROLE_SET, {"UGTA"})
+        self.assertEqual(self.config.TA_ROLE_SET, {"UGTA", "Instructor"})
+        self.assertEqual(self.config.changed_keys(changed), {"TA_ROLES"})
+
+        with self.assertRaises(ConfigError):
+            self.config.copy(VOICE_WAITING="Office Hours Room 1")
+
+    def test_copy_is_cheap(self):
+        # Tests create configs all the time. Plain copies should not re-validate anything
+        start = perf_counter()
+        configs = [self.config.copy() for _ in range(10000)]
+        self.assertLess(perf_counter() - start, 1.0)
+        self.assertEqual(len(configs), 10000)
+
+    def test_resolve(self):
+        guild = MockGuild("resolve", roles=["UGTA", "Student"],
+                          voice_channels=[MockVoice(name) for name in ("waiting-room", "Office Hours Room 1", "Office Hours Room 2")])
+        channel = MockChannel("join-queue", guild)
+        other = MockChannel("general", guild)
+
+        resolved = ResolvedConfig(self.config, guild)
+        self.assertTrue(resolved.is_ta([MockRole("UGTA")]))
+        self.assertFalse(resolved.is_ta([MockRole("Student")]))
+        self.assertTrue(resolved.listens_to(channel))
+        self.assertFalse(resolved.listens_to(other))
+        self.assertEqual(guild.get_channel(resolved.WAITING_ROOM_ID).name, "waiting-room")
+        self.assertEqual({room.name for room in resolved.office_rooms(guild)}, {"Office Hours Room 1", "Office Hours Room 2"})
+
+        # Roles and text channels that don't exist are reported but don't stop the bot
+        self.assertEqual(resolved.missing, ("Instructor",))
+
+        # Only the lookups for changed keys are rebuilt
+        config = self.config.copy(TEXT_LISTENS=["general"])
+        updated = ResolvedConfig(config, guild, previous=resolved, keys=self.config.changed_keys(config))
+        self.assertTrue(updated.listens_to(other))
+        self.assertIs(updated.TA_ROLE_IDS, resolved.TA_ROLE_IDS)
+        self.assertIs(updated.OFFICE_ROOM_IDS, resolved.OFFICE_ROOM_IDS)
+
+        # Voice channels must exist
+        with self.assertRaises(ConfigError):
+            ResolvedConfig(self.config.copy(VOICE_WAITING="lobby"), guild)
+
+    def test_resolve_snapshot(self):
+        guild = MockGuild("resolve", roles=["UGTA", "Instructor"],
+                          voice_channels=[MockVoice(name) for name in ("waiting-room", "Office Hours Room 1", "Office Hours Room 2")])
+        MockChannel("join-queue", guild)
+        resolved = ResolvedConfig(self.config, guild)
+
+        restored = ResolvedConfig.from_snapshot(self.config, guild, resolved.to_snapshot())
+        for name in ("GUILD_ID", "TA_ROLE_IDS", "TEXT_LISTEN_IDS", "WAITING_ROOM_ID", "OFFICE_ROOM_IDS"):
+            self.assertEqual(getattr(restored, name), getattr(resolved, name))
+
+        # Stale snapshots are ignored
+        self.assertIsNone(ResolvedConfig.from_snapshot(self.config.copy(TA_ROLES=["UGTA"]), guild, resolved.to_snapshot()))
+        self.assertIsNone(ResolvedConfig.from_snapshot(self.config, MockGuild("other"), resolved.to_snapshot()))
+        guild.voice_channels.pop()
+        self.assertIsNone(ResolvedConfig.from_snapshot(self.config, guild, resolved.to_snapshot()))
+        self.assertIsNone(ResolvedConfig.from_snapshot(self.config, guild, {"guild_id": guild.id}))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import io
+import os
+import json
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, ConfigError, ResolvedConfig, read_config_json
+
+base_config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "True",
+    "TEXT_ALERT": "queue-alerts",
+    "VOICE_OFFICES": ["Office Hours Room 1"],
+}
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.config_path = os.path.join(self.tmp.name, "config.json")
+        self.write_config(base_config)
+        self.bot = QueueBot(QueueConfig(base_config, test_mode=True), MockLogger(), testing=True,
+                            config_path=self.config_path)
+
+        self.guild = MockGuild("reload", voice_channels=[MockVoice("Office Hours Room 1"), MockVoice("Office Hours Room 2")],
+                               roles=["UGTA", "Instructor"])
+        self.channel = MockChannel("join-queue", self.guild)
+        self.ta = MockAuthor("TA", None, ["UGTA"])
+        self.instructor = MockAuthor("Instructor", None, ["Instructor"])
+        self.student = MockAuthor("Student", None)
+        for member in (self.ta, self.instructor, self.student):
+            self.guild.add_member(member)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def write_config(self, values):
+        with open(self.config_path, "w") as f:
+            json.dump(values, f)
+
+    def command(self, content, author):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot._queue_command(MockMessage(content, author, self.channel)))
+        return output.getvalue()
+
+    def test_validate_raises(self):
+        # Invalid configs raise ConfigError instead of exiting the program
+        for key in ("TA_ROLES", "TEXT_LISTENS"):
+            with self.assertRaises(ConfigError):
+                QueueConfig(dict(base_config, **{key: []}))
+
+        missing = dict(base_config)
+        del missing["VOICE_OFFICES"]
+        with self.assertRaisesRegex(ConfigError, "VOICE_OFFICES"):
+            QueueConfig(missing)
+
+        with open(self.config_path, "w") as f:
+            f.write("{not json")
+        with self.assertRaises(ConfigError):
+            read_config_json(self.config_path)
+        with self.assertRaises(ConfigError):
+            read_config_json(os.path.join(self.tmp.name, "missing.json"))
+
+    def test_changed_keys(self):
+        old = QueueConfig(base_config)
+        self.assertEqual(old.changed_keys(QueueConfig(dict(base_config))), set())
+
+        new = QueueConfig(dict(base_config, TA_ROLES=["UGTA", "Instructor"], ALERT_ON_FIRST_JOIN="False"))
+        self.assertEqual(old.changed_keys(new), {"TA_ROLES", "ALERT_ON_FIRST_JOIN", "TEXT_ALERT", "VOICE_OFFICES"})
+
+    def test_reload_ta_roles(self):
+        self.assertIn("invalid format", self.command("!q next", self.instructor))
+
+        self.write_config(dict(base_config, TA_ROLES=["UGTA", "Instructor"]))
+        output = self.command("!q reload", self.ta)
+        self.assertIn("Changed: TA_ROLES", output)
+
+        self.assertIn("Queue is empty", self.command("!q next", self.instructor))
+
+        # The queue survives a reload
+        self.command("!q join", self.student)
+        self.command("!q reload", self.ta)
+        self.assertEqual(len(self.bot.get_queue(self.channel)), 1)
+
+    def test_reload_only_rebuilds_changed(self):
+        # Pretend the bot logged in to self.guild
+        self.bot._connection._guilds = {self.guild.id: self.guild}
+        self.bot._resolved = ResolvedConfig(self.bot._config, self.guild)
+        MockChannel("queue-2", self.guild)
+        resolved = self.bot._resolved
+
+        self.bot.reload_config(self.bot._config.copy(TEXT_LISTENS=["join-queue", "queue-2"]))
+        self.assertIs(self.bot._resolved.TA_ROLE_IDS, resolved.TA_ROLE_IDS)
+        self.assertIs(self.bot._resolved.OFFICE_ROOM_IDS, resolved.OFFICE_ROOM_IDS)
+        self.assertEqual(self.bot._resolved.TEXT_LISTEN_IDS, {c.id for c in self.guild.text_channels})
+
+        self.bot.reload_config(self.bot._config.copy(VOICE_OFFICES=["Office Hours Room 2"]))
+        self.assertEqual([room.name for room in self.bot._resolved.office_rooms(self.guild)], ["Office Hours Room 2"])
+        self.assertIs(self.bot._resolved.TA_ROLE_IDS, resolved.TA_ROLE_IDS)
+
+        # A voice channel that does not exist is rejected before anything is swapped
+        config = self.bot._config
+        with self.assertRaises(ConfigError):
+            self.bot.reload_config(config.copy(VOICE_OFFICES=["Office Hours Room 3"]))
+        self.assertIs(self.bot._config, config)
+
+    def test_invalid_reload_keeps_config(self):
+        config = self.bot._config
+
+        self.write_config(dict(base_config, TA_ROLES=[]))
+        output = self.command("!q reload", self.ta)
+        self.assertIn("config was not reloaded", output)
+        self.assertIs(self.bot._config, config)
+        self.assertEqual(self.bot._config.TA_ROLE_SET, {"UGTA"})
+
+        # The token is used to log in so it can not be swapped out
+        with self.assertRaisesRegex(ConfigError, "SECRET_TOKEN"):
+            self.bot.reload_config(QueueConfig(dict(base_config, SECRET_TOKEN="adifferenttoken")))
+        self.assertIs(self.bot._config, config)
+
+    def test_reload_requires_ta(self):
+        self.write_config(dict(base_config, TA_ROLES=["Student"]))
+        self.assertIn("invalid format", self.command("!q reload", self.student))
+        self.assertEqual(self.bot._config.TA_ROLE_SET, {"UGTA"})
+
+    def test_watch_config(self):
+        self.write_config(dict(base_config, TA_ROLES=["Instructor"]))
+        # Make sure the modification time changes even on file systems with coarse timestamps
+        os.utime(self.config_path, (0, 0))
+
+        run(self.bot._watch_config.coro(self.bot))
+        self.assertEqual(self.bot._config.TA_ROLE_SET, {"Instructor"})
+
+        # Nothing happens until the file changes again
+        config = self.bot._config
+        run(self.bot._watch_config.coro(self.bot))
+        self.assertIs(self.bot._config, config)
+
+
+if __name__ == '__main__':
+    unittest.main()
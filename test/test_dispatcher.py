@@ -0,0 +1,83 @@
+import random
+import unittest
+from .utils import *
+
+from src.dispatcher import Dispatcher
+from src.clock import VirtualClock
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.clock = VirtualClock()
+        self.dispatcher = Dispatcher(self.clock)
+
+    def test_free_rooms(self):
+        dispatcher = self.dispatcher
+        dispatcher.update_room(1, True)
+        dispatcher.update_room(2, False)
+        self.assertTrue(dispatcher.is_free(1))
+        self.assertFalse(dispatcher.is_free(2))
+
+        # The room stays taken until the student's voice state changes
+        self.clock.advance(30)
+        self.assertEqual(dispatcher.assign(1, 100), 30)
+        self.assertTrue(dispatcher.is_moving(100))
+        dispatcher.update_room(1, True)
+        self.assertFalse(dispatcher.is_free(1))
+        dispatcher.voice_update(100)
+        dispatcher.update_room(1, True)
+        self.assertTrue(dispatcher.is_free(1))
+
+        # A failed move frees the room right away
+        dispatcher.assign(1, 200)
+        dispatcher.failed(1, 200)
+        self.assertFalse(dispatcher.is_moving(200))
+        dispatcher.update_room(1, True)
+        self.assertTrue(dispatcher.is_free(1))
+
+    def test_metrics(self):
+        dispatcher = self.dispatcher
+        dispatcher.update_room(1, True)
+        self.clock.advance(10)
+        dispatcher.assign(1, 100)
+        started = self.clock.monotonic()
+        self.clock.advance(0.5)
+        self.assertEqual(dispatcher.moved(100, started), 0.5)
+        self.assertFalse(dispatcher.is_moving(100))
+
+        # The TA helps the student then is idle again until they get someone else
+        dispatcher.update_room(1, False)
+        self.clock.advance(300)
+        dispatcher.update_room(1, True)
+        self.clock.advance(20)
+        dispatcher.assign(1, 101)
+        self.clock.advance(1.5)
+        dispatcher.moved(101, started=self.clock.monotonic() - 1.5)
+
+        stats = dispatcher.stats()
+        self.assertEqual(stats["dispatches"], 2)
+        self.assertEqual(stats["mean_latency"], 1.0)
+        self.assertEqual(stats["max_latency"], 1.5)
+        self.assertEqual(stats["idle_total"], 30)
+        self.assertEqual(stats["mean_idle"], 15)
+        self.assertEqual(stats["free_rooms"], 0)
+
+    def test_skipped_once(self):
+        dispatcher = self.dispatcher
+        for _ in range(3):
+            dispatcher.skip(100)
+        dispatcher.skip(200)
+        self.assertEqual(dispatcher.stats()["skipped"], 2)
+
+        # Skipped again after they were moved or left the queue and came back
+        dispatcher.assign(1, 100)
+        dispatcher.moved(100, self.clock.monotonic())
+        dispatcher.left(200)
+        dispatcher.skip(100)
+        dispatcher.skip(200)
+        self.assertEqual(dispatcher.stats()["skipped"], 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+import asyncio
+import random
+import unittest
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, DM_CONCURRENCY
+from src.ttl_cache import TTLCache
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.clock = VirtualClock()
+
+    def test_ttl_cache(self):
+        cache = TTLCache(max_entries=3, ttl=60, clock=self.clock)
+        for uuid in range(4):
+            cache.put(uuid, f"user{uuid}")
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(0))  # Least recently used was dropped
+        self.assertEqual(cache.get(1), "user1")
+
+        self.clock.advance(30)
+        cache.put(2, "user2 again")  # Restarts its ttl
+        self.clock.advance(31)
+        self.assertIsNone(cache.get(1))
+        self.assertEqual(cache.get(2), "user2 again")
+        self.assertEqual(cache.pop(2), "user2 again")
+        self.assertEqual(cache.get(2, "missing"), "missing")
+        self.assertEqual((cache.hits, cache.misses), (2, 3))
+
+    def test_send_dms(self):
+        bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        users = [MockAuthor(f"Student{i}", None) for i in range(20)]
+        running = []
+        most = []
+
+        async def send_dm(user, content, message_type=None):
+            running.append(user)
+            most.append(len(running))
+            await asyncio.sleep(random.uniform(0, 0.01))
+            running.remove(user)
+            if user is users[3]:
+                raise ValueError("DMs are closed")
+
+        bot._send_dm = send_dm
+        failed = run(bot._send_dms([(user, "Hello") for user in users]))
+        self.assertEqual(failed, [users[3]])
+        self.assertEqual(len(most), len(users))
+        self.assertEqual(max(most), DM_CONCURRENCY)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,418 @@
+import os
+import random
+import asyncio
+import logging
+import tempfile
+import unittest
+from time import monotonic
+from .utils import *
+from .fake_discord import FakeDiscord, start_queuebot
+
+import discord
+import src.queuebot
+from src.queuebot import QueueBot, QueueConfig, CLEAR_CONFIRM_SECONDS, INTERACTION_DEFER_SECONDS, LIST_NEXT, LIST_PREVIOUS
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "True",
+    "VOICE_WAITING": "waiting-room",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    """
+    Runs a real (non-testing) QueueBot against test.fake_discord.FakeDiscord
+    """
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.fake = FakeDiscord()
+        self.guild = self.fake.add_guild("End to End")
+        self.ta_role = self.fake.add_role(self.guild, "UGTA")
+        self.listen = self.fake.add_channel(self.guild, "join-queue")
+        self.general = self.fake.add_channel(self.guild, "general")
+        self.waiting_room = self.fake.add_channel(self.guild, "waiting-room", voice=True)
+        self.office = self.fake.add_channel(self.guild, "Office Hours Room 1", voice=True)
+        self.student = self.fake.add_member(self.guild, "Wumpus")
+        self.ta = self.fake.add_member(self.guild, "Russ", [self.ta_role])
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def run_bot(self, scenario, clock=None, changes=None):
+        async def runner():
+            await self.fake.start()
+            try:
+                with self.fake.patch():
+                    self.bot = QueueBot(config.copy(**(changes or {})), logging.getLogger("queuebot.test"), clock=clock, guild_ready_timeout=0.05)
+                    task = await start_queuebot(self.fake, self.bot, config.SECRET_TOKEN)
+                    try:
+                        await scenario()
+                    finally:
+                        await self.bot.close()
+                        await task
+            finally:
+                await self.fake.stop()
+        run(runner())
+
+    async def command(self, author, content, mentions=()):
+        await self.fake.send_message(self.listen, author, content, mentions)
+        return (await self.fake.wait_for_message(self.listen))["content"]
+
+    def test_identify_intents(self):
+        async def scenario():
+            intents = discord.Intents._from_value(self.fake.identifies[0]["intents"])
+            self.assertTrue(intents.members)  # CHECK_VOICE_WAITING needs members
+            self.assertTrue(intents.messages)
+            self.assertFalse(intents.typing)
+            self.assertFalse(intents.presences)
+            # on_ready sets the "Type '!q help'" status
+            for _ in range(100):
+                if self.fake.presence_updates:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(len(self.fake.presence_updates), 1)
+
+        self.run_bot(scenario)
+
+    def test_join_and_next(self):
+        async def scenario():
+            reply = await self.command(self.student, "!q join")
+            self.assertTrue("Please join the __waiting-room__" in reply)
+
+            await self.fake.set_voice_state(self.guild, self.student, self.waiting_room)
+            await self.fake.set_voice_state(self.guild, self.ta, self.office)
+            reply = await self.command(self.student, "!q join")
+            self.assertTrue("you have been added at position #1" in reply)
+
+            reply = await self.command(self.ta, "!q next")
+            self.assertTrue(reply.startswith(f"The next person is <@{self.student}> (online and in voice)"))
+
+            # The bot moves the student into the TA's room
+            for _ in range(100):
+                if self.fake.guilds[self.guild]["voice_states"][self.student] == self.office:
+                    break
+                await asyncio.sleep(0.01)
+            self.assertEqual(self.fake.guilds[self.guild]["voice_states"][self.student], self.office)
+
+        self.run_bot(scenario)
+
+    def test_ignored_messages(self):
+        async def scenario():
+            # Not a listen channel
+            await self.fake.send_message(self.general, self.student, "!q ping")
+            # Not a command
+            await self.fake.send_message(self.listen, self.student, "when is office hours?")
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.fake.wait_for_message(timeout=0.3)
+
+            reply = await self.command(self.student, "!q ping")
+            self.assertEqual(reply, "Pong!")
+            # The echoed "Pong!" from the bot itself is ignored
+            with self.assertRaises(asyncio.TimeoutError):
+                await self.fake.wait_for_message(timeout=0.3)
+            self.assertEqual(len(self.fake.sent_messages), 1)
+
+        self.run_bot(scenario)
+
+    def test_rate_limit(self):
+        self.fake.rate_limit = (2, 0.5)
+        # Different members since the same command from the same member is only answered once at a time
+        members = [self.student] + [self.fake.add_member(self.guild, f"Student{i}") for i in range(4)]
+
+        async def scenario():
+            start = monotonic()
+            for member in members:
+                await self.fake.send_message(self.listen, member, "!q ping")
+            for _ in range(5):
+                await self.fake.wait_for_message(self.listen)
+
+            # 5 messages with 2 allowed per half second needs at least 2 full windows
+            self.assertTrue(monotonic() - start >= 1.0)
+            self.assertEqual(len(self.fake.sent_messages), 5)
+
+        self.run_bot(scenario)
+
+    def test_reconnect(self):
+        async def scenario():
+            await self.fake.force_reconnect(resume=True)
+            await self.fake.wait_until_identified()
+            self.assertEqual(self.fake.resumes, 1)
+            self.assertEqual(await self.command(self.student, "!q ping"), "Pong!")
+
+            await self.fake.force_reconnect(resume=False)
+            await self.fake.wait_until_identified()
+            self.assertEqual(len(self.fake.identifies), 2)
+            self.assertEqual(await self.command(self.student, "!q ping"), "Pong!")
+
+        self.run_bot(scenario)
+
+    def test_clear_confirmation(self):
+        clock = VirtualClock()
+
+        async def wait_until(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            self.fail("Timed out")
+
+        async def clear():
+            await self.fake.send_message(self.listen, self.ta, "!q clear")
+            message = await self.fake.wait_for_message(self.listen)
+            self.assertTrue(message["content"].startswith("Are you sure"))
+            # Wait for the bot to start listening for reactions
+            await wait_until(lambda: self.bot._listeners.get("reaction_add"))
+            return message
+
+        async def scenario():
+            await self.fake.set_voice_state(self.guild, self.student, self.waiting_room)
+            self.assertIn("position #1", await self.command(self.student, "!q join"))
+            message = await clear()
+            await wait_until(lambda: self.bot._connection._get_message(int(message["id"])) is not None)
+            await self.fake.add_reaction(self.listen, message["id"], self.ta, "✅")
+            await wait_until(lambda: self.fake.edited_messages)
+            self.assertEqual(self.fake.edited_messages[-1]["content"], "Queue has been emptied")
+
+            # Nobody confirms. The timeout is kept by the bot's timers so it follows the bot's clock
+            self.assertIn("position #1", await self.command(self.student, "!q join"))
+            await clear()
+            clock.advance(CLEAR_CONFIRM_SECONDS + 1)
+            await wait_until(lambda: len(self.fake.edited_messages) == 2)
+            self.assertEqual(self.fake.edited_messages[-1]["content"], "Clearing queue canceled")
+            self.assertIn("already in the queue", await self.command(self.student, "!q join"))
+
+        self.run_bot(scenario, clock)
+
+    def test_list_pages(self):
+        students = [self.fake.add_member(self.guild, f"Student{i}") for i in range(12)]
+
+        async def wait_until(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            self.fail("Timed out")
+
+        async def scenario():
+            for student in students:
+                await self.fake.set_voice_state(self.guild, student, self.waiting_room)
+                await self.command(student, "!q join")
+
+            await self.fake.send_message(self.listen, self.student, "!q list")
+            message = await self.fake.wait_for_message(self.listen)
+            self.assertEqual(message["embeds"][0]["footer"]["text"].split(".")[0], "Page 1/2")
+            await wait_until(lambda: int(message["id"]) in self.bot._list_messages)
+
+            await self.fake.add_reaction(self.listen, message["id"], self.student, LIST_NEXT)
+            await wait_until(lambda: self.fake.edited_messages)
+            embed = self.fake.edited_messages[-1]["embeds"][0]
+            self.assertEqual(embed["footer"]["text"].split(".")[0], "Page 2/2")
+            self.assertIn(f"**11.** <@{students[10]}>", embed["fields"][0]["value"])
+
+            # Past the last page stays on the last page
+            await self.fake.add_reaction(self.listen, message["id"], self.student, LIST_NEXT)
+            await self.fake.add_reaction(self.listen, message["id"], self.student, LIST_PREVIOUS)
+            await wait_until(lambda: len(self.fake.edited_messages) == 3)
+            embed = self.fake.edited_messages[-1]["embeds"][0]
+            self.assertEqual(embed["footer"]["text"].split(".")[0], "Page 1/2")
+
+        self.run_bot(scenario)
+
+    def test_help_dm_channel(self):
+        def dm_channels():
+            return [channel_id for channel_id, (guild_id, _) in self.fake.channels.items() if guild_id is None]
+
+        async def scenario():
+            for _ in range(3):
+                self.assertIn("sent to your Direct Messages", await self.command(self.student, "!q help"))
+            # The Direct Message channel is only opened once
+            self.assertEqual(len(dm_channels()), 1)
+            sent = [m for m in self.fake.sent_messages if m["channel_id"] == dm_channels()[0]]
+            self.assertEqual(len(sent), 3)
+            self.assertTrue(sent[0]["content"].startswith("__STUDENT COMMANDS:__"))
+
+        self.run_bot(scenario)
+
+    def test_slash_commands(self):
+        async def scenario():
+            # on_ready() registers the commands after the bot is ready
+            for _ in range(200):
+                if self.guild in self.fake.commands:
+                    break
+                await asyncio.sleep(0.01)
+            names = [command["name"] for command in self.fake.commands[self.guild]]
+            self.assertIn("join", names)
+
+            await self.fake.set_voice_state(self.guild, self.student, self.waiting_room)
+            interaction = await self.fake.send_interaction(self.listen, self.student, "join")
+            response, = await self.fake.wait_for_interaction(interaction)
+            self.assertEqual(response["type"], 4)
+            self.assertEqual(response["data"]["flags"], 64)
+            self.assertEqual(response["data"]["allowed_mentions"], {"parse": []})
+            self.assertIn("position #1", response["data"]["content"])
+            # Nothing was sent to the channel
+            self.assertEqual(self.fake.sent_messages, [])
+
+            interaction = await self.fake.send_interaction(self.listen, self.student, "next")
+            response, = await self.fake.wait_for_interaction(interaction)
+            self.assertIn("Only TAs", response["data"]["content"])
+
+            # Roles are looked up by ID even before they have been resolved (ex: before on_ready)
+            self.bot._resolved = None
+            interaction = await self.fake.send_interaction(self.listen, self.ta, "next")
+            response, = await self.fake.wait_for_interaction(interaction)
+            self.assertIn("Wumpus has been called", response["data"]["content"])
+            # The student is told (and pinged) in the channel, not in the TA's ephemeral reply
+            announcement, = self.fake.sent_messages
+            self.assertTrue(announcement["content"].startswith(f"The next person is <@{self.student}>"))
+            self.assertIsNone(announcement["allowed_mentions"])  # Mentions ping by default
+
+            interaction = await self.fake.send_interaction(self.general, self.student, "position")
+            response, = await self.fake.wait_for_interaction(interaction)
+            self.assertIn("#join-queue", response["data"]["content"])
+
+            # Failures outside of the command itself are still answered
+            listens_to = self.bot._listens_to
+            self.bot._listens_to = None
+            try:
+                interaction = await self.fake.send_interaction(self.listen, self.student, "position")
+                response, = await self.fake.wait_for_interaction(interaction)
+            finally:
+                self.bot._listens_to = listens_to
+            self.assertIn("An error has occurred", response["data"]["content"])
+
+        self.run_bot(scenario)
+
+    def test_board_buttons(self):
+        async def scenario():
+            await self.fake.send_message(self.listen, self.ta, "!q board")
+            board = await self.fake.wait_for_message(self.listen)
+            buttons = board["components"][0]["components"]
+            self.assertEqual([button["label"] for button in buttons], ["Join", "Leave", "Position"])
+
+            await self.fake.set_voice_state(self.guild, self.student, self.waiting_room)
+            interaction = await self.fake.send_interaction(self.listen, self.student, custom_id=buttons[0]["custom_id"])
+            self.assertIn("position #1", (await self.fake.wait_for_interaction(interaction))[0]["data"]["content"])
+
+            # Slow commands are deferred and the reply is filled in later
+            position = self.bot._q_position
+
+            async def slow_position(*args):
+                await asyncio.sleep(0.1)
+                return await position(*args)
+
+            self.bot._q_position = slow_position
+            src.queuebot.INTERACTION_DEFER_SECONDS = 0.01
+            try:
+                interaction = await self.fake.send_interaction(self.listen, self.student, custom_id=buttons[2]["custom_id"])
+                deferred, edit = await self.fake.wait_for_interaction(interaction, count=2)
+            finally:
+                src.queuebot.INTERACTION_DEFER_SECONDS = INTERACTION_DEFER_SECONDS
+            self.assertEqual(deferred, {"type": 5, "data": {"flags": 64}})
+            self.assertIn("position #1", edit["edit"]["content"])
+            self.assertEqual(len(self.fake.sent_messages), 1)  # Only the board
+
+        self.run_bot(scenario)
+
+    def test_reply_mode(self):
+        self.fake.rate_limit = (1, 0.3)
+        members = [self.fake.add_member(self.guild, f"Student{i}") for i in range(5)]
+
+        async def scenario():
+            command = await self.fake.send_message(self.listen, self.student, "!q join")
+            reply = await self.fake.wait_for_message(self.listen)
+            self.assertEqual(str(reply["message_reference"]["message_id"]), command["id"])
+            self.assertEqual(reply["allowed_mentions"], {"parse": [], "users": [], "replied_user": True})
+
+            # The student being sent for is pinged even though the TA is the one being replied to
+            await self.fake.set_voice_state(self.guild, self.student, self.waiting_room)
+            await self.command(self.student, "!q join")
+            await self.fake.send_message(self.listen, self.ta, "!q next")
+            reply = await self.fake.wait_for_message(self.listen)
+            self.assertEqual(reply["allowed_mentions"]["users"], [int(self.student)])
+
+            # Replies that pile up while the channel is rate limited are sent together
+            sent = len(self.fake.sent_messages)
+            for member in members:
+                await self.fake.send_message(self.listen, member, "!q ping")
+            replies = []
+            while sum(reply["content"].count("Pong!") for reply in replies) < len(members):
+                replies.append(await self.fake.wait_for_message(self.listen))
+            self.assertLess(len(replies), len(members))
+            self.assertEqual(len(self.fake.sent_messages), sent + len(replies))
+            self.assertEqual(self.bot._pending_replies, {})
+
+            # Combined replies ping every author except the one being replied to
+            authors = {}
+            for member in members[:2]:
+                command = await self.fake.send_message(self.listen, member, "!q position")
+                authors[command["id"]] = member
+            reply = await self.fake.wait_for_message(self.listen)
+            while reply["content"].count("not in the queue") < 2:
+                reply = await self.fake.wait_for_message(self.listen)
+            replied_to = authors[str(reply["message_reference"]["message_id"])]
+            other = members[1] if replied_to == members[0] else members[0]
+            self.assertEqual(reply["allowed_mentions"]["users"], [int(other)])
+
+            # A reply's own mention settings are kept (the overloaded "!q list" pings nobody)
+            self.bot._overload.degraded = True
+            await self.fake.send_message(self.listen, members[2], "!q position")
+            await self.fake.send_message(self.listen, self.ta, "!q list")
+            replies = [await self.fake.wait_for_message(self.listen) for _ in range(2)]
+            listing = next(reply for reply in replies if reply["content"].startswith("Queue"))
+            self.assertEqual(listing["allowed_mentions"], {"parse": []})
+
+        self.run_bot(scenario, changes={"REPLY_MODE": "True"})
+
+    def test_auto_dispatch(self):
+        second = self.fake.add_member(self.guild, "Clyde")
+        lurker = self.fake.add_member(self.guild, "Nelly")
+
+        async def wait_until(condition):
+            for _ in range(200):
+                if condition():
+                    return
+                await asyncio.sleep(0.01)
+            self.fail("Timed out")
+
+        def room(member):
+            return self.fake.guilds[self.guild]["voice_states"].get(member)
+
+        async def scenario():
+            # Not in voice, so the student behind them is sent first
+            await self.command(lurker, "!q join-inperson")
+            await self.fake.set_voice_state(self.guild, self.student, self.waiting_room)
+            await self.command(self.student, "!q join")
+            await self.fake.set_voice_state(self.guild, second, self.waiting_room)
+            await self.command(second, "!q join")
+
+            await self.fake.set_voice_state(self.guild, self.ta, self.office)
+            await wait_until(lambda: room(self.student) == self.office)
+            await wait_until(lambda: "it's your turn!" in self.fake.sent_messages[-1]["content"])
+            self.assertTrue(self.fake.sent_messages[-1]["content"].startswith(f"✅ <@{self.student}>"))
+            self.assertEqual([user.get_uuid() for user in self.bot._queues[int(self.guild)]], [int(lurker), int(second)])
+
+            # The TA isn't free until the student leaves
+            await asyncio.sleep(0.1)
+            self.assertEqual(room(second), self.waiting_room)
+            await self.fake.set_voice_state(self.guild, self.student, None)
+            await wait_until(lambda: room(second) == self.office)
+
+            stats = self.bot._dispatcher.stats()
+            self.assertEqual(stats["dispatches"], 2)
+            self.assertEqual(stats["failures"], 0)
+            # The in-person student is left for "!q next"
+            self.assertEqual(len(self.bot._queues[int(self.guild)]), 1)
+
+        self.run_bot(scenario, changes={"AUTO_DISPATCH": "True", "VOICE_OFFICES": ["Office Hours Room 1"]})
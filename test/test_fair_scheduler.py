@@ -0,0 +1,95 @@
+import random
+import unittest
+from .utils import *
+
+from src.fair_scheduler import FairScheduler
+
+
+def take(scheduler, backlogged, eligible=None):
+    # Pick a course and take a student from it
+    course = scheduler.pick(backlogged, eligible)
+    if course is not None:
+        scheduler.charge(course)
+    return course
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.scheduler = FairScheduler({"big": 2, "small": 1})
+
+    def test_weighted_turns(self):
+        scheduler = self.scheduler
+        scheduler.arrive("big")
+        scheduler.arrive("small")
+        picks = [take(scheduler, lambda course: True) for _ in range(300)]
+        self.assertEqual(picks.count("big"), 200)
+        self.assertEqual(picks.count("small"), 100)
+        # Turns are spread out instead of all of one course first
+        self.assertLessEqual(max(len(run) for run in "".join(c[0] for c in picks).split("s")), 2)
+
+    def test_empty_course_saves_no_turns(self):
+        scheduler = self.scheduler
+        scheduler.arrive("big")
+        waiting = {"big": True, "small": False}
+        for _ in range(50):
+            self.assertEqual(take(scheduler, waiting.get), "big")
+
+        # "small" starts at the current virtual time instead of getting 25 turns in a row
+        scheduler.arrive("small")
+        waiting["small"] = True
+        picks = [take(scheduler, waiting.get) for _ in range(6)]
+        self.assertEqual(picks.count("small"), 2)
+        self.assertEqual(picks.count("big"), 4)
+
+        # Courses whose students left are dropped when they reach the top
+        waiting["big"] = False
+        self.assertEqual(scheduler.pick(waiting.get), "small")
+        self.assertNotIn("big", scheduler)
+        waiting["small"] = False
+        self.assertIsNone(scheduler.pick(waiting.get))
+
+    def test_ineligible_course_keeps_turn(self):
+        scheduler = FairScheduler({"a": 1, "b": 1})
+        scheduler.arrive("a")
+        scheduler.arrive("b")
+        everyone = lambda course: True
+        self.assertEqual(take(scheduler, everyone, lambda course: course == "b"), "b")
+        self.assertEqual(take(scheduler, everyone), "a")
+        self.assertIn("a", scheduler)
+        self.assertIsNone(take(scheduler, everyone, lambda course: False))
+        self.assertEqual(take(scheduler, everyone), "b")
+
+    def test_turn_used_when_taken(self):
+        scheduler = self.scheduler
+        scheduler.arrive("big")
+        scheduler.arrive("small")
+        everyone = lambda course: True
+        # Picking alone (ex: a dispatch that failed) doesn't use up the turn
+        self.assertEqual(scheduler.pick(everyone), "big")
+        self.assertEqual(scheduler.pick(everyone), "big")
+
+        # A plan charges a copy so the real turns don't move until students are taken
+        plan = scheduler.copy()
+        self.assertEqual([take(plan, everyone) for _ in range(3)], ["big", "small", "big"])
+        self.assertEqual(scheduler.pick(everyone), "big")
+        scheduler.charge("big")
+        scheduler.charge("big")
+        self.assertEqual(scheduler.pick(everyone), "small")
+        self.assertLessEqual(len(scheduler._heap), 4)
+
+    def test_stats(self):
+        scheduler = self.scheduler
+        self.assertEqual(scheduler.stats()["fairness"], 1.0)
+        scheduler.record_wait("big", 60)
+        scheduler.record_wait("big", 120)
+        scheduler.record_wait("small", 90)
+        stats = scheduler.stats()
+        self.assertEqual(stats["courses"]["big"], {"weight": 2, "served": 2, "share": 2 / 3, "mean_wait": 90, "max_wait": 120})
+        self.assertEqual(stats["fairness"], 1.0)
+        scheduler.record_wait("small", 510)
+        self.assertAlmostEqual(scheduler.stats()["fairness"], (90 + 300) ** 2 / (2 * (90 ** 2 + 300 ** 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, DiscordUser, StudentQueue, LIST_PAGE_SIZE
+from src.render_cache import RenderCache
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.bot = QueueBot(config.copy(), MockLogger(), testing=True)
+        self.guild = MockGuild("list")
+        self.channel = MockChannel("join-queue", self.guild)
+        self.students = [MockAuthor(f"Student{i}", None) for i in range(25)]
+        for member in self.students:
+            self.guild.add_member(member)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def command(self, content, author):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot._queue_command(MockMessage(content, author, self.channel)))
+        return output.getvalue()
+
+    def test_slice(self):
+        users = [DiscordUser(i, f"User{i}", "0001", None) for i in range(50)]
+        queue = StudentQueue(users)
+        for user in users[5:45:3]:
+            queue.remove(user)
+        expected = list(queue)
+        for start, stop in ((0, 10), (10, 20), (30, 40), (-5, 3), (0, 100)):
+            self.assertEqual(queue.slice(start, stop), expected[max(start, 0):stop])
+
+    def test_pages(self):
+        for student in self.students:
+            self.command("!q join", student)
+
+        output = self.command("!q list", self.students[0])
+        self.assertIn("Total in queue: 25", output)
+        self.assertIn("**1.** ", output)
+        self.assertIn("**10.** ", output)
+        self.assertNotIn("**11.** ", output)
+
+        output = self.command("!q list 3", self.students[0])
+        self.assertIn("People 21-25:", output)
+        self.assertIn(f"**21.** {self.students[20].mention}", output)
+        self.assertNotIn("**20.** ", output)
+
+        # Pages past the end show the last page
+        embed, page, pages = self.bot._list_page(self.guild, 10)
+        self.assertEqual((page, pages), (3, 3))
+        self.assertEqual(embed.footer.text.split(".")[0], "Page 3/3")
+
+        self.assertIn("invalid syntax", self.command("!q list two", self.students[0]))
+        self.assertIn("invalid syntax", self.command("!q list 0", self.students[0]))
+
+    def test_cache(self):
+        for student in self.students[:LIST_PAGE_SIZE + 1]:
+            self.command("!q join", student)
+
+        cache = self.bot._render_cache
+        embed, _, pages = self.bot._list_page(self.guild, 2)
+        self.assertEqual(pages, 2)
+        for _ in range(9):
+            self.assertIs(self.bot._list_page(self.guild, 2)[0], embed)
+        self.assertEqual((cache.hits, cache.misses), (9, 1))
+
+        # Any change to the queue builds the pages again
+        self.command("!q leave", self.students[0])
+        embed, _, pages = self.bot._list_page(self.guild, 2)
+        self.assertEqual(pages, 1)
+        self.assertIsNone(embed.footer.text or None)
+        self.assertIn(f"**10.** {self.students[10].mention}", embed.fields[0].value)
+        self.assertEqual((cache.hits, cache.misses), (9, 2))
+
+    def test_help_cache(self):
+        ta = MockAuthor("TA", None, ["UGTA"])
+        self.guild.add_member(ta)
+        for author in self.students[:5] + [ta, ta]:
+            self.command("!q help", author)
+        self.assertEqual(self.bot._render_cache.stats()["hits"], 5)
+        self.assertEqual(self.bot._render_cache.stats()["misses"], 2)
+        self.assertIn("TA COMMANDS", self.command("!q help", ta))
+        self.assertNotIn("TA COMMANDS", self.command("!q help", self.students[0]))
+
+    def test_render_cache(self):
+        cache = RenderCache(max_entries=2)
+        self.assertEqual(cache.get((1, "everyone", "a"), 0, lambda: "a0"), "a0")
+        self.assertEqual(cache.get((1, "everyone", "a"), 0, lambda: "unused"), "a0")
+        self.assertEqual(cache.get((1, "everyone", "a"), 1, lambda: "a1"), "a1")
+        cache.get((2, "everyone", "b"), 0, lambda: "b0")
+        cache.get((1, "everyone", "a"), 1, lambda: "unused")
+        cache.get((1, "ta", "c"), 0, lambda: "c0")  # Drops b (least recently used)
+        self.assertEqual(cache.get((2, "everyone", "b"), 0, lambda: "b0 again"), "b0 again")
+        cache.clear(2)
+        self.assertEqual(len(cache), 1)
+        self.assertEqual(cache.stats(), {"hits": 2, "misses": 5, "entries": 1, "hit_rate": 0.2857})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,43 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from .utils import *
+
+from benchmarks.load_simulation import LoadSimulation, percentile
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        # log_session() writes to logs/ relative to the working directory
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_percentile(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 50), 50)
+        self.assertEqual(percentile(values, 99), 99)
+        self.assertEqual(percentile(values, 100), 100)
+        self.assertEqual(percentile([], 50), 0.0)
+
+    def test_small_simulation(self):
+        # Smoke test so the benchmark doesn't silently rot when commands change
+        simulation = LoadSimulation(queue_size=10, steady_commands=50)
+        with io.StringIO() as buf, redirect_stdout(buf):
+            result = run(simulation.run())
+
+        self.assertEqual(result["queue_size"], 10)
+        self.assertEqual(result["commands"], 60)
+        self.assertEqual(result["latency_ms"]["join"]["count"] >= 10, True)
+        for key in ("p50", "p90", "p99", "max"):
+            self.assertTrue(key in result["latency_ms"]["all"])
+        self.assertEqual(result["final_queue_length"], len(simulation.bot.get_queue(simulation.channel)))
@@ -0,0 +1,256 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from unittest import mock
+from types import SimpleNamespace
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, DiscordUser, StudentQueue
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "True",
+    "VOICE_WAITING": "waiting-room",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+def brute_first(queue, tag, start=1):
+    for position, user in enumerate(queue, start=1):
+        if position >= start and tag in ("inperson" if user.is_inperson() else "online"):
+            return user
+    return None
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=VirtualClock())
+        self.waiting_room = MockVoice("waiting-room")
+        self.guild = MockGuild("next", voice_channels=[self.waiting_room])
+        self.channel = MockChannel("join-queue", self.guild)
+        self.ta = MockAuthor("TA", None, ["UGTA"])
+        self.guild.add_member(self.ta)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def command(self, content, author, mentions=None):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot._queue_command(MockMessage(content, author, self.channel, mentions)))
+        return output.getvalue()
+
+    def student(self, name, waiting=False):
+        member = MockAuthor(name, None)
+        member.guild = self.guild
+        self.guild.add_member(member)
+        if waiting:
+            self.waiting_room.add_member(member)
+            member.voice = SimpleNamespace(channel=self.waiting_room)
+        return member
+
+    def test_tag_index(self):
+        queue = StudentQueue()
+        users = [DiscordUser(i, f"Student{i}", "0001", None, inperson=random.random() < 0.5) for i in range(300)]
+        unused = list(users)
+        for _ in range(2000):
+            action = random.random()
+            if unused and action < 0.4:
+                user = unused.pop(random.randrange(len(unused)))
+                queue.append(user) if random.random() < 0.8 else queue.appendleft(user)
+            elif len(queue) and action < 0.6:
+                user = queue.popleft() if random.random() < 0.3 else queue.user_at(random.randint(1, len(queue)))
+                if user in queue:
+                    queue.remove(user)
+                unused.append(user)
+            elif len(queue) and action < 0.75:
+                user = queue.user_at(random.randint(1, len(queue)))
+                user.set_inperson(not user.is_inperson())
+                queue.touch(user.get_uuid())
+            elif unused and action < 0.78:
+                queue.insert(random.randint(0, len(queue)), unused.pop())
+            elif unused and len(queue) and action < 0.8:
+                old = queue[0]
+                queue[0] = unused.pop()
+                unused.append(old)
+            elif action < 0.81:
+                queue.rotate(random.randint(-3, 3))
+
+            start = random.randint(1, len(queue) + 1)
+            for tag in ("online", "inperson"):
+                self.assertIs(queue.head(tag), brute_first(queue, tag))
+                self.assertIs(queue.first(tag, start), brute_first(queue, tag, start))
+                self.assertEqual(queue.count(tag), sum(1 for user in queue if brute_first([user], tag)))
+        # Stale sub-queue entries don't pile up
+        self.assertLessEqual(sum(len(heap) for heap in queue._heads.values()), 2 * (2 * len(queue) + 32))
+        queue.clear()
+        self.assertIsNone(queue.first("online"))
+        self.assertEqual(queue.count("online"), 0)
+
+    def test_mode_toggles(self):
+        users = [DiscordUser(i, f"Student{i}", "0001", None) for i in range(1000)]
+        queue = StudentQueue(users)
+        # Flipping students between online and in-person keeps both sub-queues in queue order
+        for user in users[::-1]:
+            user.set_inperson(True)
+            queue.touch(user.get_uuid())
+            self.assertIs(queue.head("inperson"), user)
+        for user in users[:500]:
+            user.set_inperson(False)
+            queue.touch(user.get_uuid())
+        self.assertIs(queue.head("online"), users[0])
+        self.assertIs(queue.head("inperson"), users[500])
+        self.assertEqual(list(queue), users)
+        # Users are removed by position, not by comparing them with everyone in front of them
+        with mock.patch.object(DiscordUser, "__eq__", side_effect=AssertionError("compared users")):
+            for user in users[:500][::-1]:
+                queue.remove(user)
+        self.assertEqual(list(queue), users[500:])
+        self.assertIsNone(queue.head("online"))
+        self.assertLessEqual(len(queue._heads["online"]), 2 * len(queue) + 32)
+
+    def test_next_modes(self):
+        away = self.student("Away")
+        inperson = self.student("InPerson")
+        waiting = self.student("Waiting", waiting=True)
+        self.bot._get_reconciler(self.guild)
+
+        # Added by a TA while not in voice
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot._queue_command(MockMessage(f"!q add {away.mention}", self.ta, self.channel, [away])))
+        self.assertIn("added at position #1", output.getvalue())
+        self.assertIn("added at position #2", self.command("!q join-inperson", inperson))
+        self.command("!q join", waiting)
+        queue = self.bot.get_queue(self.channel)
+        self.assertEqual(queue.count("voice"), 1)
+
+        self.assertIn(f"The next person is {waiting.mention}", self.command("!q next voice", self.ta))
+        self.assertEqual([user.get_uuid() for user in queue], [away.id, inperson.id])
+        self.assertIn("Nobody in the queue is online and in voice", self.command("!q next voice", self.ta))
+        self.assertIn("invalid syntax", self.command("!q next sideways", self.ta))
+        self.assertIn(f"The next person is {inperson.mention}", self.command("!q next in-person", self.ta))
+
+        # Joining the waiting room makes them eligible without touching the queue
+        self.waiting_room.add_member(away)
+        before, after = SimpleNamespace(channel=None), SimpleNamespace(channel=self.waiting_room)
+        version = queue.version
+        run(self.bot.on_voice_state_update(away, before, after))
+        self.assertEqual(queue.version, version)
+        self.assertIs(queue.first("voice"), queue[0])
+        self.assertIn(f"The next person is {away.mention}", self.command("!q next online", self.ta))
+        self.assertEqual(len(queue), 0)
+
+    def test_course_turns(self):
+        self.bot._config = config.copy(COURSES=["csc110:2", "csc120"])
+        big = [self.student(f"Big{i}", waiting=True) for i in range(6)]
+        small = [self.student(f"Small{i}", waiting=True) for i in range(3)]
+        self.bot._get_reconciler(self.guild)
+        for member in big:
+            self.command("!q join csc110", member)
+        for member in small:
+            self.command("!q join CSC120", member)
+        self.assertIn("unknown course `csc999`", self.command("!q join csc999", self.student("Lost")))
+
+        # csc110 gets two turns for every turn of csc120 even though all of its students joined first
+        order = []
+        for _ in range(6):
+            output = self.command("!q next", self.ta)
+            order.append(next(m for m in big + small if f"The next person is {m.mention}" in output))
+        self.assertEqual(order, [big[0], small[0], big[1], big[2], small[1], big[3]])
+
+        # Switching course keeps their place
+        queue = self.bot.get_queue(self.channel)
+        self.assertIn("course changed to `csc110`", self.command("!q join csc110", small[2]))
+        self.assertEqual(queue.count("course:csc120"), 0)
+        self.assertEqual([user.get_uuid() for user in queue], [big[4].id, big[5].id, small[2].id])
+        self.assertIn(f"The next person is {big[4].mention}", self.command("!q next voice", self.ta))
+        stats = self.bot._schedulers[self.guild.id].stats()
+        self.assertEqual(stats["courses"]["csc110"]["served"], 5)
+        self.assertEqual(stats["courses"]["csc120"]["served"], 2)
+
+    def test_failed_dispatch_keeps_course_turn(self):
+        self.bot._config = config.copy(COURSES=["csc110", "csc120"])
+        first, second = self.student("First", waiting=True), self.student("Second", waiting=True)
+        small = self.student("Small", waiting=True)
+        self.bot._get_reconciler(self.guild)
+        self.command("!q join csc110", first)
+        self.command("!q join csc110", second)
+        self.command("!q join csc120", small)
+
+        # csc110's student can't be moved (they left the server) so csc110 keeps its turn
+        self.bot._config = self.bot._config.copy(AUTO_DISPATCH="True", VOICE_OFFICES=["Office"])
+        office = MockVoice("Office", [self.ta])
+        self.guild.voice_channels.append(office)
+        del self.guild._members[first.id]
+        with redirect_stdout(io.StringIO()):
+            self.assertEqual(run(self.bot.dispatch_students(self.guild)), [])
+        self.assertIn(first, self.bot.get_queue(self.channel))
+        office.remove_member(self.ta)  # The TA calls the next students instead
+        self.assertIn(f"The next person is {first.mention}", self.command("!q next", self.ta))
+        self.assertIn(f"The next person is {small.mention}", self.command("!q next", self.ta))
+
+    def test_next_skips_dispatched(self):
+        moving, waiting = self.student("Moving", waiting=True), self.student("Waiting", waiting=True)
+        self.bot._get_reconciler(self.guild)
+        self.command("!q join", moving)
+        self.command("!q join", waiting)
+
+        # The first student is being moved to another TA's room by config.AUTO_DISPATCH
+        self.bot._dispatcher.assign(1, moving.id)
+        self.assertIn(f"The next person is {waiting.mention}", self.command("!q next", self.ta))
+        self.assertIn("Everyone in the queue is being moved", self.command("!q next", self.ta))
+        self.assertIn("Nobody in the queue is online", self.command("!q next online", self.ta))
+        self.assertEqual([user.get_uuid() for user in self.bot.get_queue(self.channel)], [moving.id])
+
+    def test_dispatch_counts_skipped_once(self):
+        away, gone = self.student("Away"), self.student("Gone", waiting=True)
+        self.bot._get_reconciler(self.guild)
+        self.command(f"!q add {away.mention}", self.ta, [away])  # Added by a TA while not in voice
+        self.command("!q join", gone)
+        self.bot._config = self.bot._config.copy(AUTO_DISPATCH="True", VOICE_OFFICES=["Office"])
+        self.guild.voice_channels.append(MockVoice("Office", [self.ta]))
+        del self.guild._members[gone.id]  # Their move fails so every event dispatches again
+
+        # Passed over on every voice state event but only counted once while they wait
+        with redirect_stdout(io.StringIO()):
+            for _ in range(3):
+                run(self.bot.dispatch_students(self.guild))
+        stats = self.bot._dispatcher.stats()
+        self.assertEqual((stats["skipped"], stats["failures"]), (1, 3))
+        self.command("!q leave", away)
+        self.assertEqual(self.bot._dispatcher._skipped, set())
+
+    def test_stats_command(self):
+        self.assertIn("no stats for this server yet", self.command("!q stats", self.ta))
+        self.bot._config = config.copy(COURSES=["csc110", "csc120"], AUTO_DISPATCH="True", VOICE_OFFICES=["Office"])
+        self.guild.voice_channels.append(MockVoice("Office"))
+        student = self.student("Student", waiting=True)
+        self.bot._get_reconciler(self.guild)
+        self.command("!q join csc120", student)
+        self.bot._clock.advance(90)
+        self.command("!q next", self.ta)
+
+        # The stats that are logged at shutdown are available while the queue is running
+        output = self.command("!q stats", self.ta)
+        self.assertIn("Dispatcher: 0 dispatch(es)", output)
+        self.assertIn("csc120 (weight 1): 1 helped, 90s mean/90s max wait", output)
+        self.assertIn("invalid format", self.command("!q stats", student))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, DiscordUser, StudentQueue, NOTIFY_BATCH_SECONDS
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.clock = VirtualClock(datetime(2021, 4, 5, 13, 0, 0))
+        self.bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        self.guild = MockGuild("notify")
+        self.channel = MockChannel("join-queue", self.guild)
+        self.students = [MockAuthor(f"Student{i}", None) for i in range(12)]
+        self.ta = MockAuthor("TA", None, ["UGTA"])
+        for member in self.students + [self.ta]:
+            self.guild.add_member(member)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def command(self, content, author, mentions=None):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot._queue_command(MockMessage(content, author, self.channel, mentions)))
+        return output.getvalue()
+
+    def send_notifications(self):
+        self.clock.advance(NOTIFY_BATCH_SECONDS)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot.run_timers())
+        return [line for line in output.getvalue().splitlines() if line.startswith("SEND DM:")]
+
+    def test_position_index(self):
+        users = [DiscordUser(i, f"User{i}", "0001", None) for i in range(100)]
+        queue = StudentQueue(users[10:])
+        for user in users[:10]:
+            queue.appendleft(user)
+        expected = users[9::-1] + users[10:]
+        for _ in range(30):
+            removed = random.choice(expected)
+            expected.remove(removed)
+            queue.remove(removed)
+        self.assertEqual(list(queue), expected)
+        self.assertEqual([queue.position(user) for user in expected], list(range(1, len(expected) + 1)))
+        self.assertEqual([queue.user_at(i + 1) for i in range(len(expected))], expected)
+        self.assertIsNone(queue.position(removed))
+        with self.assertRaises(IndexError):
+            queue.user_at(len(expected) + 1)
+
+    def test_notify(self):
+        for student in self.students[:6]:
+            self.command("!q join", student)
+        last = self.students[5]
+
+        self.assertIn("already at position #2", self.command("!q notify", self.students[1]))
+        self.assertIn("join the queue first", self.command("!q notify", self.students[6]))
+        self.assertIn("invalid syntax", self.command("!q notify 11", last))
+        self.assertIn("reach position #3", self.command("!q notify", last))
+
+        self.command("!q next", self.ta)
+        self.command("!q leave", self.students[3])  # Behind last's position. Doesn't count
+        self.assertEqual(self.send_notifications(), [])
+
+        self.command("!q remove", self.ta, [self.students[2]])
+        self.assertEqual(self.bot.get_queue(self.channel).position(last), 3)
+        self.assertEqual(self.send_notifications(), [f"SEND DM: You are now at position #3 in the office hours queue for **{self.guild.name}**. Get ready!"])
+
+        # Only notified once
+        self.command("!q next", self.ta)
+        self.assertEqual(self.send_notifications(), [])
+
+        # Changed their mind
+        self.command("!q join", self.students[6])
+        self.command("!q join", self.students[7])
+        self.assertIn("reach position #2", self.command("!q notify 2", self.students[7]))
+        self.assertIn("will not be notified", self.command("!q notify off", self.students[7]))
+        self.assertIn("did not ask", self.command("!q notify off", self.students[7]))
+        self.command("!q next", self.ta)
+        self.assertEqual(self.send_notifications(), [])
+
+    def test_batched(self):
+        for student in self.students:
+            self.command("!q join", student)
+        # Student i+1 wants to know when they reach position i
+        for i in range(1, 11):
+            self.command(f"!q notify {i}", self.students[i])
+
+        self.command("!q next", self.ta)
+        # Nothing is sent right away
+        with redirect_stdout(io.StringIO()) as output:
+            run(self.bot.run_timers())
+        self.assertNotIn("SEND DM:", output.getvalue())
+
+        # Students who leave before the batch goes out aren't messaged
+        self.command("!q leave", self.students[10])
+        messages = self.send_notifications()
+        self.assertEqual(len(messages), 9)
+        # Positions are looked up when the batch is sent
+        self.assertIn("position #9 ", messages[-1])
+
+        self.command("!q clear", self.ta)
+        self.assertEqual(self.bot._notifiers, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
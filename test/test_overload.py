@@ -0,0 +1,116 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.overload import OverloadDetector
+from src.queuebot import QueueBot, QueueConfig
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "True",
+    "TEXT_ALERT": "ta-alerts",
+    "VOICE_OFFICES": ["Office Hours Room 1"],
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.clock = VirtualClock()
+        self.detector = OverloadDetector(enter_backlog=10, exit_backlog=2, enter_latency=3, exit_latency=1,
+                                         recover_seconds=15, clock=self.clock)
+
+    def test_hysteresis(self):
+        detector = self.detector
+        self.assertIsNone(detector.started(9))
+        self.assertTrue(detector.started(10))
+        self.assertTrue(detector.degraded)
+
+        # Dropping below the enter threshold isn't enough
+        self.assertIsNone(detector.finished(5))
+        self.clock.advance(60)
+        self.assertIsNone(detector.started(6))
+        self.assertTrue(detector.degraded)
+
+        # Both signals have to stay low for recover_seconds
+        detector.sent(0.5, 2)
+        self.clock.advance(10)
+        detector.started(3)
+        detector.finished(1)
+        self.clock.advance(10)
+        self.assertIsNone(detector.started(2))
+        self.clock.advance(5)
+        self.assertFalse(detector.finished(0))
+        self.assertFalse(detector.degraded)
+        stats = detector.stats()
+        self.assertEqual((stats["episodes"], stats["degraded_seconds"], stats["max_backlog"]), (1, 85, 10))
+
+    def test_latency(self):
+        detector = self.detector
+        for _ in range(3):
+            detector.started(1)
+            change = detector.sent(5, 0)
+        self.assertTrue(detector.degraded)
+        self.assertIsNone(change)
+
+        # Quiet for a while. The old latency is forgotten and the quiet time counts as calm
+        self.clock.advance(20)
+        self.assertFalse(detector.started(1))
+        self.assertIsNone(detector.stats()["latency"])
+
+    def test_cheap_replies(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            os.mkdir("logs")
+            try:
+                self.check_cheap_replies()
+            finally:
+                os.chdir(cwd)
+
+    def check_cheap_replies(self):
+        bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        guild = MockGuild("overload")
+        channel = MockChannel("join-queue", guild)
+        guild.text_channels = [channel, MockChannel("ta-alerts", guild)]
+        students = [MockAuthor(f"Student{i}", None) for i in range(12)]
+        bot._overload.degraded = True
+
+        def command(content, author):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                run(bot.run_command(MockMessage(content, author, channel)))
+            return output.getvalue()
+
+        # The first join's alert is put off
+        self.assertEqual(command("!q join", students[0]), "REACT: ✅\n")
+        timer = bot._timers.get(f"alert:{guild.id}")
+        self.assertIsNotNone(timer)
+        self.assertEqual(command("!q join", students[0]), "REACT: ⚠️\n")
+        for student in students[1:]:
+            command("!q join", student)
+
+        # Replies without a prefix are still sent
+        self.assertIn("position #2", command("!q position", students[1]))
+        output = command("!q list", students[0])
+        self.assertIn("SEND: Queue (12, page 1/2): 1. Student0, 2. Student1", output)
+        self.assertNotIn("embed", output)
+        self.assertNotIn("REACT", output)
+
+        bot._overload.degraded = False
+        output = command("!q list 2", students[0])
+        self.assertIn("embed.title='Queue List'", output)
+        self.assertIn("SEND: ✅", command("!q leave", students[3]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import io
+import os
+import sys
+import random
+import asyncio
+import tempfile
+import unittest
+import subprocess
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queue_engine import QueueEngine, EngineClient, EngineError, start_server
+from src.queuebot import QueueBot, QueueConfig
+from src.clock import VirtualClock
+from src.utils import DiscordUser
+from benchmarks.engine import EngineBenchmark
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+        self.clock = VirtualClock()
+        self.engine = QueueEngine(clock=self.clock)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def user(self, i):
+        return DiscordUser(i, f"Student{i}", "0001", None, clock=self.clock).to_dict()
+
+    def test_operations(self):
+        engine = self.engine
+        self.assertEqual(run(engine.call("join", guild=1, user=self.user(1))), {"status": "added", "position": 1, "length": 1})
+        run(engine.call("join", guild=1, user=self.user(2), inperson=True))
+        self.assertEqual(run(engine.call("join", guild=1, user=self.user(1), inperson=True))["status"], "changed")
+        self.assertEqual(run(engine.call("join", guild=1, user=self.user(1), switch=False))["status"], "already")
+        self.assertEqual(run(engine.call("position", guild=1, uuid=2)), {"position": 2})
+        self.assertEqual(run(engine.call("position", guild=2, uuid=2)), {"position": None})
+
+        self.clock.advance(60)
+        run(engine.call("join", guild=1, user=self.user(3)))
+        result = run(engine.call("next", guild=1, server="engine", ta="TA", mode="online"))
+        self.assertEqual((result["user"]["uuid"], result["length"]), (3, 2))
+        run(engine.call("front", guild=1, user=self.user(2)))
+        page = run(engine.call("list", guild=1))
+        self.assertEqual([user["uuid"] for user in page["users"]], [2, 1])
+        self.assertTrue(run(engine.call("leave", guild=1, server="engine", uuid=1))["removed"])
+        self.assertEqual(run(engine.call("remove", guild=1, server="engine", ta="TA", uuid=1)), {"user": None})
+        self.assertEqual(run(engine.call("clear", guild=1, server="engine", ta="TA")), {"cleared": 1})
+
+        stats = run(engine.call("stats"))["1"]
+        self.assertEqual((stats["joined"], stats["helped"], stats["left"], stats["cleared"], stats["length"]), (3, 1, 1, 1, 0))
+        with open(run(engine.call("logs", server="engine"))["path"]) as f:
+            self.assertEqual(len(f.read().splitlines()), 3)  # next, leave and clear
+
+        with self.assertRaises(EngineError):
+            run(engine.call("next", guild=1, server="engine", ta="TA", mode="voice"))
+        with self.assertRaises(EngineError):
+            run(engine.call("close"))
+
+    def test_snapshot(self):
+        for i in range(3):
+            run(self.engine.call("join", guild=1, user=self.user(i), inperson=i == 1))
+        self.clock.advance(120)
+        restored = QueueEngine(clock=self.clock, snapshot=run(self.engine.call("snapshot")))
+        page = run(restored.call("list", guild=1))
+        self.assertEqual([(user["uuid"], user["inperson"]) for user in page["users"]], [(0, False), (1, True), (2, False)])
+        self.assertEqual(run(restored.call("position", guild=1, uuid=2)), {"position": 3})
+
+    def test_socket(self):
+        path = os.path.join(self.tmp.name, "engine.sock")
+
+        async def scenario():
+            server = await start_server(self.engine, path)
+            client = EngineClient(path)
+            try:
+                # Pipelined requests are applied in the order they were sent
+                results = await asyncio.gather(*(client.call("join", guild=1, user=self.user(i)) for i in range(20)))
+                self.assertEqual([result["position"] for result in results], list(range(1, 21)))
+                result = await client.call("next", guild=1, server="engine", ta="TA")
+                self.assertEqual(result["user"]["uuid"], 0)
+                with self.assertRaises(EngineError):
+                    await client.call("position", guild=1)
+            finally:
+                await client.close()
+                server.close()
+                await server.wait_closed()
+
+            # Calls after the engine stopped fail instead of hanging
+            with self.assertRaises(EngineError):
+                await client.call("position", guild=1, uuid=1)
+        run(scenario())
+
+    def test_no_discord(self):
+        # The engine has to run (and be benchmarked) where py-cord isn't installed
+        code = "import sys; sys.modules['discord'] = None; import queue_engine"
+        self.assertEqual(subprocess.run([sys.executable, "-c", code], cwd=SRC).returncode, 0)
+
+    def test_bot_front_end(self):
+        bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        bot._engine = self.engine  # Same call() as EngineClient
+        guild = MockGuild("engine")
+        channel = MockChannel("join-queue", guild)
+        ta = MockAuthor("TA", None, ["UGTA"])
+        students = [MockAuthor(f"Student{i}", None) for i in range(3)]
+
+        def command(content, author, mentions=None):
+            output = io.StringIO()
+            with redirect_stdout(output):
+                run(bot._queue_command(MockMessage(content, author, channel, mentions)))
+            return output.getvalue()
+
+        self.assertIn("added at position #1", command("!q join", students[0]))
+        self.assertIn("added at position #2", command("!q join-inperson", students[1]))
+        self.assertIn("status changed to __*in-person*__", command("!q join-inperson", students[0]))
+        self.assertIn("already in the queue at position #2", command("!q join-inperson", students[1]))
+        self.assertIn("you are at position #2", command("!q position", students[1]))
+        self.assertIn("the person has been added at position #3", command("!q add", ta, [students[2]]))
+        self.assertEqual(len(bot.get_queue(channel)), 0)  # The queue is only in the engine
+        self.assertIn(f"**3.** {students[2].mention}", command("!q list", students[0]))
+
+        self.assertIn("isn't available", command("!q next voice", ta))
+        self.assertIn(f"The next person is {students[2].mention}", command("!q next online", ta))
+        self.assertIn("Remaining people in the queue: 1", command("!q next", ta))
+        self.assertIn("you have been removed from the queue", command("!q leave", students[1]))
+        self.assertIn("Queue is empty", command("!q next", ta))
+        self.assertEqual(run(self.engine.call("stats"))[str(guild.id)]["helped"], 2)
+
+    def test_small_benchmark(self):
+        # Smoke test so the benchmark doesn't silently rot
+        results = run(EngineBenchmark(operations=200, clients=2).run())
+        self.assertEqual(set(results), {"direct", "socket"})
+        for result in results.values():
+            self.assertEqual(result["operations"], 200)
+            self.assertGreater(result["operations_per_s"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
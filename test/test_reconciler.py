@@ -0,0 +1,223 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from types import SimpleNamespace
+from datetime import datetime
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, DiscordUser, StudentQueue, REMINDERS_PER_CHECK, VOICE_GRACE_SECONDS
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "True",
+    "VOICE_WAITING": "waiting-room",
+    "ALERT_ON_FIRST_JOIN": "True",
+    "TEXT_ALERT": "queue-alerts",
+    "VOICE_OFFICES": ["Office Hours Room 1"],
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.clock = VirtualClock(datetime(2021, 4, 5, 13, 0, 0))
+        self.bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        self.waiting_room = MockVoice("waiting-room")
+        self.office = MockVoice("Office Hours Room 1")
+        self.guild = MockGuild("reconcile", voice_channels=[self.waiting_room, self.office])
+        self.channel = MockChannel("join-queue", self.guild)
+        self.alerts = MockChannel("queue-alerts", self.guild)
+        self.students = [MockAuthor(f"Student{i}", None) for i in range(25)]
+        self.ta = MockAuthor("TA", None, ["UGTA"])
+        for member in self.students + [self.ta]:
+            self.guild.add_member(member)
+            member.guild = self.guild
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def move(self, member, room):
+        """Move a member between voice channels like Discord would (None to disconnect)"""
+        before = SimpleNamespace(channel=member.voice.channel if member.voice else None)
+        if before.channel is not None:
+            before.channel.remove_member(member)
+        if room is not None:
+            room.add_member(member)
+        member.voice = SimpleNamespace(channel=room) if room is not None else None
+        run(self.bot.on_voice_state_update(member, before, SimpleNamespace(channel=room)))
+
+    def command(self, content, author):
+        with redirect_stdout(io.StringIO()):
+            run(self.bot._queue_command(MockMessage(content, author, self.channel)))
+
+    def reconcile(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            reminded, flagged = run(self.bot.reconcile_waiting_room(self.guild))
+        return reminded, flagged, output.getvalue()
+
+    def test_student_queue(self):
+        users = [DiscordUser(i, f"User{i}", "0001", None) for i in range(4)]
+        queue = StudentQueue(users[:3])
+        self.assertEqual(queue.pop_changes(), {0, 1, 2})
+        self.assertEqual(queue.pop_changes(), set())
+        self.assertIn(1, queue)
+        self.assertIn(users[1], queue)
+        self.assertNotIn(users[3], queue)
+        self.assertIs(queue.get(2), users[2])
+
+        version = queue.version
+        queue.remove(1)  # Works with a uuid too
+        queue.appendleft(users[3])
+        self.assertEqual(list(queue), [users[3], users[0], users[2]])
+        self.assertEqual(set(queue.uuids()), {0, 2, 3})
+        self.assertEqual(queue.pop_changes(), {1, 3})
+        self.assertGreater(queue.version, version)
+
+        with self.assertRaises(ValueError):
+            queue.remove(users[1])
+
+        self.assertIs(queue.popleft(), users[3])
+        queue.clear()
+        self.assertEqual(len(queue), 0)
+        self.assertNotIn(0, queue)
+        self.assertEqual(queue.pop_changes(), {0, 2, 3})
+
+        # Changes are only recorded while something pops them
+        queue.stop_changes()
+        queue.extend(users[:2])
+        queue.remove(0)
+        self.assertIsNone(queue._changes)
+        self.assertEqual(queue.pop_changes(), {1})  # Everyone in the queue
+        self.assertIsNone(StudentQueue(users)._changes)
+
+    def test_remind_waiting_students(self):
+        waiting, joined = self.students[:2], self.students[2]
+        for student in waiting + [joined, self.ta]:
+            self.move(student, self.waiting_room)
+        self.command("!q join", joined)
+
+        # Students get some time to join the queue on their own
+        self.clock.advance(30)
+        self.assertEqual(self.reconcile()[:2], ([], []))
+
+        self.clock.advance(31)
+        reminded, flagged, output = self.reconcile()
+        self.assertEqual(sorted(m.id for m in reminded), sorted(m.id for m in waiting))
+        self.assertEqual(flagged, [])
+        self.assertEqual(output.count("SEND DM:"), 2)
+        self.assertIn("#join-queue", output)
+
+        # Students are only reminded once while they stay in the waiting room
+        self.clock.advance(600)
+        self.assertEqual(self.reconcile()[:2], ([], []))
+
+        # ...and again after leaving and coming back
+        self.move(waiting[0], None)
+        self.move(waiting[0], self.waiting_room)
+        self.reconcile()
+        self.clock.advance(61)
+        self.assertEqual([m.id for m in self.reconcile()[0]], [waiting[0].id])
+
+    def test_reminders_are_rate_limited(self):
+        for student in self.students:
+            self.move(student, self.waiting_room)
+        self.clock.advance(61)
+
+        counts = [len(self.reconcile()[0]) for _ in range(4)]
+        self.assertEqual(counts, [REMINDERS_PER_CHECK, REMINDERS_PER_CHECK, 25 - 2 * REMINDERS_PER_CHECK, 0])
+
+    def test_flag_absent_students(self):
+        online, inperson, helped = self.students[:3]
+        self.move(online, self.waiting_room)
+        self.move(helped, self.waiting_room)
+        self.command("!q join", online)
+        self.command("!q join", helped)
+        self.command("!q join-inperson", inperson)
+
+        # One student leaves the waiting room and is then helped. The other wanders off while still in the queue
+        self.move(online, None)
+        self.command("!q next", self.ta)
+        self.move(helped, self.office)
+        self.assertEqual(self.reconcile()[:2], ([], []))
+        self.clock.advance(60)
+        self.assertEqual(self.reconcile()[:2], ([], []))
+
+        self.clock.advance(61)
+        reminded, flagged, output = self.reconcile()
+        self.assertEqual(reminded, [])
+        # In-person students are not expected to be in the waiting room
+        self.assertEqual([user.get_uuid() for user in flagged], [helped.id])
+        self.assertIn(helped.name, output)
+
+        # Flagged once, until they come back
+        self.clock.advance(600)
+        self.assertEqual(self.reconcile()[1], [])
+        self.move(helped, self.waiting_room)
+        self.assertEqual(self.reconcile()[:2], ([], []))
+
+    def run_timers(self):
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(self.bot.run_timers())
+        return output.getvalue()
+
+    def test_voice_timeout(self):
+        online, inperson, returns = self.students[:3]
+        for student in (online, returns):
+            self.move(student, self.waiting_room)
+            self.command("!q join", student)
+        self.command("!q join-inperson", inperson)
+        self.move(inperson, self.waiting_room)
+
+        for student in (online, inperson, returns):
+            self.move(student, None)
+        self.clock.advance(VOICE_GRACE_SECONDS - 10)
+        self.assertEqual(self.run_timers(), "")
+        self.move(returns, self.waiting_room)  # Back in time
+
+        self.clock.advance(11)
+        output = self.run_timers()
+        self.assertIn(f"<@{online.id}> you have been removed from the queue", output)
+        queue = self.bot.get_queue(self.channel)
+        self.assertEqual([user.get_uuid() for user in queue], [returns.id, inperson.id])
+
+        with open(f"logs/OH_logs_{self.guild.name}.csv") as f:
+            row = f.read().strip().split("|")
+        self.assertEqual([row[0], row[2], row[3], row[6]], [online.name, "13:00:00", "N/A", "timeout"])
+
+        # Students who leave the queue on their own don't get removed again
+        self.move(returns, None)
+        self.command("!q leave", returns)
+        self.clock.advance(VOICE_GRACE_SECONDS)
+        self.assertEqual(self.run_timers(), "")
+
+    def test_config_changes(self):
+        self.move(self.students[0], self.waiting_room)
+        self.bot.reload_config(config.copy(CHECK_VOICE_WAITING="False"))
+        self.move(self.students[1], self.waiting_room)  # Ignored
+        self.clock.advance(61)
+        self.assertEqual(self.bot._reconcilers, {})
+
+        # Turning the check back on rebuilds the voice state index from the waiting room
+        self.bot.reload_config(config.copy())
+        self.reconcile()
+        self.clock.advance(61)
+        self.assertEqual(sorted(m.id for m in self.reconcile()[0]), sorted(m.id for m in self.students[:2]))
+
+
+if __name__ == '__main__':
+    unittest.main()
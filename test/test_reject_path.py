@@ -0,0 +1,40 @@
+import random
+import unittest
+from .utils import *
+
+from benchmarks.reject_path import RejectBenchmark
+
+
+class CountingLogger(MockLogger):
+    def __init__(self):
+        super().__init__()
+        self.lines = []
+
+    def info(self, str):
+        self.lines.append(str)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+
+    def test_rejects_without_logging(self):
+        benchmark = RejectBenchmark(messages=10)
+        benchmark.bot._logger = logger = CountingLogger()
+        for kind in ("chat", "other_channel", "command_elsewhere"):
+            for _ in range(10):
+                run(benchmark.bot.on_message(benchmark._make(kind)))
+        self.assertEqual(logger.lines, [])
+        self.assertEqual(benchmark.bot._in_flight, set())
+
+    def test_small_benchmark(self):
+        # Smoke test so the benchmark doesn't silently rot
+        results = run(RejectBenchmark(messages=100).run())
+        self.assertEqual(set(results), {"chat", "other_channel", "command_elsewhere"})
+        for result in results.values():
+            self.assertEqual(result["messages"], 100)
+            self.assertGreater(result["messages_per_s"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
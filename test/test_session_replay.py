@@ -0,0 +1,79 @@
+import io
+import os
+import random
+import tempfile
+import unittest
+from datetime import datetime
+from contextlib import redirect_stdout
+from .utils import *
+
+from benchmarks.session_replay import parse_session_log, build_events, days_in_log, SessionReplay
+
+LOG = """Wumpus|April 05, 2021|13:00|Russ|13:05|0:05|next
+Otus|April 05, 2021|13:00|N/A|13:02|0:02|leave
+Hop|April 05, 2021|13:01|Nick|13:10|0:09|next
+Camel|April 05, 2021|13:03|Nick|13:12|0:09|remove
+Goose|April 05, 2021|13:04|Russ|13:20|0:16|clear
+Crab|April 05, 2021|13:05|Russ|13:20|0:15|clear
+Late|April 06, 2021|23:58|Russ|00:03|0:05|next
+Zip|April 05, 2021|13:00|Nick|13:06|0:06|dispatch
+"""
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+        with open("OH_logs_test.csv", "w") as f:
+            f.write(LOG)
+        self.rows = parse_session_log("OH_logs_test.csv")
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def test_parse(self):
+        self.assertEqual(len(self.rows), 8)
+        self.assertEqual(self.rows[0].join_time, datetime(2021, 4, 5, 13, 0))
+        self.assertEqual(self.rows[1].ta, None)
+        # Rows are dated when the student left. This one joined before midnight
+        self.assertEqual(self.rows[6].join_time, datetime(2021, 4, 5, 23, 58))
+        self.assertEqual(self.rows[6].leave_time, datetime(2021, 4, 6, 0, 3))
+
+    def test_days(self):
+        self.assertEqual(days_in_log(self.rows), [("April 05, 2021", 7), ("April 06, 2021", 1)])
+
+    def test_build_events(self):
+        events = build_events([row for row in self.rows if row.date == "April 05, 2021"])
+        commands = [e.command for e in events]
+
+        # 7 joins, 2 nexts and a dispatch, 1 leave, 1 remove and a single clear for both cleared students
+        self.assertEqual(commands.count("join"), 7)
+        self.assertEqual(commands.count("next"), 3)
+        self.assertEqual(commands.count("clear"), 1)
+        self.assertEqual(sorted(events, key=lambda e: e.time), events)
+        # Joins in the same minute as an exit come first
+        self.assertEqual(commands[:3], ["join", "join", "join"])
+
+    def test_replay(self):
+        events = build_events([row for row in self.rows if row.date == "April 05, 2021"])
+        replay = SessionReplay(events)
+        with io.StringIO() as buf, redirect_stdout(buf):
+            result = run(replay.run())
+
+        self.assertEqual(result["events"], len(events))
+        self.assertEqual(result["peak_queue_length"], 6)
+        self.assertEqual(result["final_queue_length"], 0)
+        self.assertEqual(result["next_mismatches"], 0)
+        self.assertEqual(result["missing"], 0)
+        self.assertEqual(replay.clock.now(), datetime(2021, 4, 5, 13, 20))
+
+        # The bot shares the replay's virtual clock so its own session log has the replayed times
+        replayed = parse_session_log("logs/OH_logs_replay.csv")
+        # Dispatched students are replayed as "!q next"
+        def summary(rows):
+            return sorted((r.leave_time, r.name, r.join_time, r.command_type.replace("dispatch", "next")) for r in rows)
+        self.assertEqual(summary(replayed), summary(row for row in self.rows if row.date == "April 05, 2021"))
@@ -0,0 +1,178 @@
+import io
+import os
+import random
+import asyncio
+import logging
+import tempfile
+import unittest
+from time import monotonic
+from datetime import datetime, timedelta
+from contextlib import redirect_stdout
+from .utils import *
+from .fake_discord import FakeDiscord, start_queuebot
+
+from src.queuebot import QueueBot, QueueConfig, WARM_START_OPTIONS
+from src.snapshot import load_snapshot, save_snapshot
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "True",
+    "VOICE_WAITING": "waiting-room",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+testing_config = config.copy(CHECK_VOICE_WAITING="False")
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+        self.snapshot_path = os.path.join(self.tmp.name, "queue_snapshot.json")
+
+        self.guild = MockGuild("shutdown")
+        self.channel = MockChannel("join-queue", self.guild)
+        self.students = [MockAuthor(name, nick) for name, nick in STUDENT_NAMES[:3]]
+        for student in self.students:
+            self.guild.add_member(student)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def new_bot(self, clock):
+        return QueueBot(testing_config, MockLogger(), testing=True, clock=clock, snapshot_path=self.snapshot_path)
+
+    def command(self, bot, content, author):
+        with redirect_stdout(io.StringIO()):
+            run(bot._queue_command(MockMessage(content, author, self.channel)))
+
+    def test_snapshot_round_trip(self):
+        clock = VirtualClock(datetime(2021, 4, 5, 13, 0, 0))
+        bot = self.new_bot(clock)
+        self.command(bot, "!q join", self.students[0])
+        clock.advance(30)
+        self.command(bot, "!q join-inperson", self.students[1])
+        self.command(bot, "!q join", self.students[2])
+        clock.advance(30)
+        run(bot.close())
+
+        # The bot was down for two minutes
+        restarted = self.new_bot(VirtualClock(datetime(2021, 4, 5, 13, 3, 0)))
+        queue = restarted.get_queue(self.channel)
+        self.assertEqual([user.get_uuid() for user in queue], [student.id for student in self.students])
+        self.assertEqual([user.is_inperson() for user in queue], [False, True, False])
+        self.assertAlmostEqual(queue[0].get_wait_time(), 180, places=3)
+        self.assertAlmostEqual(queue[1].get_wait_time(), 150, places=3)
+
+        # Session logs still use the original join time
+        self.command(restarted, "!q leave", self.students[0])
+        with open(f"logs/OH_logs_{self.guild.name}.csv") as f:
+            self.assertEqual(f.read().split("|")[2], "13:00:00")
+
+        # The snapshot is only restored once (ex: a restart after a crash doesn't bring the queue back)
+        self.assertFalse(os.path.exists(self.snapshot_path))
+        self.assertEqual(len(self.new_bot(VirtualClock(datetime(2021, 4, 5, 13, 4, 0))).get_queue(self.channel)), 0)
+
+    def test_stale_snapshot(self):
+        clock = VirtualClock(datetime(2021, 4, 5, 13, 0, 0))
+        bot = self.new_bot(clock)
+        self.command(bot, "!q join", self.students[0])
+        run(bot.close())
+
+        self.assertIsNotNone(load_snapshot(self.snapshot_path, VirtualClock(datetime(2021, 4, 5, 13, 5, 0))))
+        restarted = self.new_bot(VirtualClock(datetime(2021, 4, 5, 13, 5, 1)))
+        self.assertEqual(len(restarted.get_queue(self.channel)), 0)
+
+    def test_close_drains_commands(self):
+        clock = VirtualClock()
+        bot = self.new_bot(clock)
+
+        async def slow_command():
+            await asyncio.sleep(0.05)
+            await bot._queue_command(MockMessage("!q join", self.students[0], self.channel))
+
+        async def scenario():
+            task = asyncio.ensure_future(slow_command())
+            bot._in_flight.add(task)
+            with redirect_stdout(io.StringIO()):
+                await bot.close()
+            self.assertTrue(task.done())
+            # Closing twice is fine
+            await bot.close()
+        run(scenario())
+
+        snapshot = load_snapshot(self.snapshot_path)
+        self.assertEqual([user["uuid"] for user in snapshot["queues"][str(self.guild.id)]], [self.students[0].id])
+
+    def test_bad_snapshot(self):
+        with open(self.snapshot_path, "w") as f:
+            f.write("{not json")
+        self.assertIsNone(load_snapshot(self.snapshot_path))
+
+        # Snapshots without a save time are ignored
+        save_snapshot({"queues": {}}, self.snapshot_path)
+        self.assertIsNone(load_snapshot(self.snapshot_path))
+        save_snapshot({"queues": {}, "saved_at": datetime.now().timestamp()}, self.snapshot_path)
+        self.assertEqual(load_snapshot(self.snapshot_path)["queues"], {})
+        # No temporary files are left behind
+        self.assertEqual(sorted(os.listdir(self.tmp.name)), ["logs", "queue_snapshot.json"])
+
+        self.assertEqual(len(self.new_bot(VirtualClock())._queues), 0)
+
+    def test_warm_start(self):
+        fake = FakeDiscord(large=True)
+        guild = fake.add_guild("Warm Start")
+        ta_role = fake.add_role(guild, "UGTA")
+        listen = fake.add_channel(guild, "join-queue")
+        waiting_room = fake.add_channel(guild, "waiting-room", voice=True)
+        student = fake.add_member(guild, "Wumpus")
+        fake.add_member(guild, "Russ", [ta_role])
+        fake.guilds[guild]["voice_states"][student] = waiting_room
+
+        async def command(content):
+            await fake.send_message(listen, student, content)
+            return (await fake.wait_for_message(listen))["content"]
+
+        async def runner():
+            await fake.start()
+            try:
+                with fake.patch():
+                    # Cold start: members are chunked before the bot is ready
+                    bot = QueueBot(config, logging.getLogger("queuebot.test"), snapshot_path=self.snapshot_path,
+                                   guild_ready_timeout=0.05)
+                    task = await start_queuebot(fake, bot, config.SECRET_TOKEN)
+                    self.assertEqual(fake.member_requests, 1)
+                    self.assertIn("added at position #1", await command("!q join"))
+                    await bot.close()
+                    await task
+
+                    # Warm start: commands are answered before on_ready() without chunking members
+                    bot = QueueBot(config, logging.getLogger("queuebot.test"), snapshot_path=self.snapshot_path,
+                                   **dict(WARM_START_OPTIONS, guild_ready_timeout=2.0))
+                    start = monotonic()
+                    task = asyncio.ensure_future(bot.start(config.SECRET_TOKEN))
+                    try:
+                        while not bot._is_initialized:
+                            await asyncio.sleep(0.005)
+                        reply = await command("!q position")
+                        self.assertLess(monotonic() - start, 1.0)
+                        self.assertIn("position #1", reply)
+                        self.assertFalse(bot.is_ready())
+                        self.assertEqual(fake.member_requests, 1)
+                    finally:
+                        await bot.close()
+                        await task
+            finally:
+                await fake.stop()
+        run(runner())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import io
+import os
+import random
+import asyncio
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from .utils import *
+
+from src.queuebot import QueueBot, QueueConfig, COMMAND_BURST, COMMAND_INTERVAL_SECONDS, THROTTLED_REACTION
+from src.throttle import Throttle
+from src.clock import VirtualClock
+
+config = {
+    "SECRET_TOKEN": "NOONEWILLEVERGUESSTHISSUPERSECRETSTRINGMWAHAHAHA",
+    "TA_ROLES": ["UGTA"],
+    "TEXT_LISTENS": ["join-queue"],
+    "CHECK_VOICE_WAITING": "False",
+    "ALERT_ON_FIRST_JOIN": "False",
+}
+config = QueueConfig(config, test_mode=True)
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.cwd = os.getcwd()
+        self.tmp = tempfile.TemporaryDirectory()
+        os.chdir(self.tmp.name)
+        os.mkdir("logs")
+
+        self.clock = VirtualClock()
+        self.bot = QueueBot(config.copy(), MockLogger(), testing=True, clock=self.clock)
+        self.guild = MockGuild("throttle")
+        self.channel = MockChannel("join-queue", self.guild)
+        self.student = MockAuthor("Student", None)
+        self.ta = MockAuthor("TA", None, ["UGTA"])
+        self.guild.add_member(self.student)
+        self.guild.add_member(self.ta)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.tmp.cleanup()
+
+    def commands(self, *messages):
+        """Run the (content, author) commands at the same time. Returns what was printed"""
+        async def runner():
+            await asyncio.gather(*(self.bot.run_command(MockMessage(content, author, self.channel))
+                                   for content, author in messages))
+        output = io.StringIO()
+        with redirect_stdout(output):
+            run(runner())
+        return output.getvalue()
+
+    def test_throttle(self):
+        throttle = Throttle(burst=3, interval=2, clock=self.clock, prune_at=10)
+        self.assertEqual([throttle.allow(1) for _ in range(4)], [True, True, True, False])
+        self.clock.advance(1)
+        self.assertFalse(throttle.allow(1))
+        self.clock.advance(1)
+        self.assertTrue(throttle.allow(1))
+        self.assertFalse(throttle.allow(1))
+
+        # Users who haven't sent anything in a while are forgotten
+        for uuid in range(2, 11):
+            throttle.allow(uuid)
+        self.assertEqual(len(throttle), 10)
+        self.clock.advance(10)
+        throttle.allow(11)
+        self.assertEqual(len(throttle), 1)
+
+    def test_throttled_commands(self):
+        output = ""
+        for _ in range(COMMAND_BURST + 2):
+            output += self.commands(("!q position", self.student))
+        self.assertEqual(output.count("SEND:"), COMMAND_BURST)
+        self.assertEqual(output.count(f"REACT: {THROTTLED_REACTION}"), 2)
+
+        self.clock.advance(COMMAND_INTERVAL_SECONDS)
+        self.assertIn("SEND:", self.commands(("!q position", self.student)))
+        self.assertIn("REACT:", self.commands(("!q position", self.student)))
+
+        # TAs aren't limited
+        output = ""
+        for _ in range(COMMAND_BURST + 2):
+            output += self.commands(("!q list", self.ta))
+        self.assertEqual(output.count("SEND:"), COMMAND_BURST + 2)
+
+    def test_duplicate_commands(self):
+        output = self.commands(("!q join", self.student), ("!q  JOIN", self.student), ("!q join", self.ta))
+        self.assertEqual(output.count("SEND:"), 2)
+        self.assertEqual(len(self.bot.get_queue(self.channel)), 2)
+        self.assertEqual(self.bot._running_commands, {})
+
+        # Once the first one is done the command runs again
+        self.assertIn("already in the queue", self.commands(("!q join", self.student)))
+
+
+if __name__ == '__main__':
+    unittest.main()
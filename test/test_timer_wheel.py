@@ -0,0 +1,88 @@
+import random
+import unittest
+from .utils import *
+
+from src.timer_wheel import TimerWheel
+from src.clock import VirtualClock
+
+
+class QueueTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(SEED)
+        self.clock = VirtualClock()
+        self.wheel = TimerWheel(tick=1.0, slots=8, levels=3, clock=self.clock)
+        self.ran = []
+
+    def run_for(self, seconds, step=1.0):
+        """Move the clock forward, expiring timers every step seconds. Returns (time, callback result) pairs"""
+        fired = []
+        end = self.clock.monotonic() + seconds
+        while self.clock.monotonic() < end:
+            self.clock.advance(min(step, end - self.clock.monotonic()))
+            fired.extend((self.clock.monotonic(), timer.callback(*timer.args)) for timer in self.wheel.expire())
+        return fired
+
+    def test_expire_in_order(self):
+        # Spread over every level and the overflow list (8**3 = 512 ticks)
+        delays = [0, 0.5, 1, 7, 8, 9, 63, 64, 65, 100, 511, 512, 513, 2000]
+        shuffled = list(delays)
+        random.shuffle(shuffled)
+        for delay in shuffled:
+            self.wheel.schedule(delay, lambda d: d, delay)
+        self.assertEqual(len(self.wheel), len(delays))
+
+        fired = self.run_for(2001)
+        self.assertEqual([delay for _, delay in fired], sorted(delays))
+        # Timers run on the first tick at or after their deadline
+        for when, delay in fired:
+            self.assertGreaterEqual(when, delay)
+            self.assertLess(when - delay, 1.0 + 1e-9)
+        self.assertEqual(len(self.wheel), 0)
+
+    def test_large_steps(self):
+        # The clock can jump forward (ex: the event loop was busy)
+        for delay in (3, 30, 300, 3000):
+            self.wheel.schedule(delay, lambda d: d, delay)
+        self.assertEqual([d for _, d in self.run_for(400, step=100)], [3, 30, 300])
+        self.assertEqual([d for _, d in self.run_for(5000, step=2500)], [3000])
+
+    def test_cancel(self):
+        timers = [self.wheel.schedule(delay, lambda d: d, delay) for delay in range(1, 101)]
+        for timer in timers[::2]:
+            timer.cancel()
+            timer.cancel()  # Cancelling twice is fine
+        self.assertFalse(timers[0].active)
+        self.assertTrue(timers[1].active)
+        self.assertEqual(len(self.wheel), 50)
+        self.assertEqual([d for _, d in self.run_for(100)], list(range(2, 101, 2)))
+        self.assertFalse(timers[1].active)
+
+    def test_keys(self):
+        self.wheel.schedule(10, lambda: "first", key="student")
+        timer = self.wheel.schedule(20, lambda: "second", key="student")
+        self.assertEqual(len(self.wheel), 1)
+        self.assertIs(self.wheel.get("student"), timer)
+        self.assertEqual([result for _, result in self.run_for(30)], ["second"])
+        self.assertIsNone(self.wheel.get("student"))
+
+        self.wheel.schedule(5, lambda: "cancelled", key="student")
+        self.assertTrue(self.wheel.cancel("student"))
+        self.assertFalse(self.wheel.cancel("student"))
+        self.assertEqual(self.run_for(10), [])
+
+    def test_many_timers(self):
+        wheel = TimerWheel(clock=self.clock)
+        timers = [wheel.schedule(random.uniform(0, 3600), lambda: None) for _ in range(20000)]
+        for timer in timers[:10000]:
+            timer.cancel()
+        self.assertEqual(len(wheel), 10000)
+
+        count = 0
+        for _ in range(3601):
+            self.clock.advance(1)
+            count += len(wheel.expire())
+        self.assertEqual(count, 10000)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,8 @@ import unittest
 import asyncio
 import random
 
+import discord
+
 def run(ctx):
     return asyncio.get_event_loop().run_until_complete(ctx)
 
@@ -41,8 +43,15 @@ class MockLogger:
     def debug(self, str):
         pass
 
+    def warning(self, str):
+        pass
+
+    def error(self, str):
+        pass
+
 class MockRole:
     def __init__(self, name):
+        self.id = hash(name)  # Roles with the same name are the same role
         self.name = name
 
     def __eq__(self, other):
@@ -54,7 +63,11 @@ class MockRole:
     def __repr__(self):
         return f"MockRole('{self.name}')"
 
-class MockAuthor:
+class MockAuthor(discord.member.Member):
+    # A discord.Member (so QueueBot accepts it as a message author) whose fields are plain
+    # attributes instead of looked up in the connection's state
+    id = name = discriminator = nick = mention = roles = voice = guild = None
+
     def __init__(self, name, nick, roles=[]):
         self.id = gen_id(18)
         self.name = name
@@ -62,6 +75,7 @@ class MockAuthor:
         self.nick = nick
         self.mention = self.get_mention()
         self.roles = [MockRole(r) for r in roles]
+        self.voice = None
 
     def get_uuid(self):
         return self.id
@@ -75,13 +89,50 @@ class MockAuthor:
     def __hash__(self):
         return hash(self.name)
 
+    def __str__(self):
+        return str(self.name)
+
     def __repr__(self):
         return f"MockAuthor('{self.name}')"
 
 
+class MockGuild:
+    def __init__(self, name, members=None, voice_channels=None, text_channels=None, roles=None):
+        self.id = gen_id(18)
+        self.name = name
+        self.voice_channels = voice_channels if voice_channels is not None else []
+        self.text_channels = text_channels if text_channels is not None else []
+        self.roles = [MockRole(r) for r in roles] if roles is not None else []
+        self._members = {}
+        for m in (members if members is not None else []):
+            self.add_member(m)
+
+    @property
+    def members(self):
+        return list(self._members.values())
+
+    def add_member(self, member):
+        self._members[member.id] = member
+
+    def get_member(self, uuid):
+        return self._members.get(uuid)
+
+    def get_channel(self, channel_id):
+        for channel in self.voice_channels + self.text_channels:
+            if channel.id == channel_id:
+                return channel
+        return None
+
+    def __repr__(self):
+        return f"MockGuild('{self.name}')"
+
 class MockChannel:
-    def __init__(self, name):
+    def __init__(self, name, guild=None):
+        self.id = gen_id(18)
         self.name = name
+        self.guild = guild
+        if guild is not None:
+            guild.text_channels.append(self)
 
 class MockDMChannel:
     def __init__(self):